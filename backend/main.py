@@ -1,9 +1,13 @@
 import uvicorn
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import json
+import asyncio
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, Callable, Dict, Literal, Optional
 import sys
 import os
-import atexit
+import logging
 
 # ----------------------------------------------------------------------
 # 1. (关键) 将 'src' 目录添加到 Python 路径
@@ -17,23 +21,66 @@ try:
     # ----------------------------------------------------------------------
     # 2. (关键) 导入我们刚刚造好的【轮子 2】
     # ----------------------------------------------------------------------
-    from src.bank_ds_agent.tools.code_executor import SandboxJupyterExecutor
+    from src.bank_ds_agent.tools.kernel_executor import KernelExecutor
+    from src.bank_ds_agent.tools.session_pool import (
+        SandboxSessionPool,
+        SessionMissingError,
+        SessionPoolFullError,
+    )
+    from src.bank_ds_agent.tools.dataset_registry import DatasetRegistry
+    from src.bank_ds_agent.tools.scheduler import (
+        FairScheduler,
+        QueueFullError,
+        QueueTimeoutError,
+    )
+    from src.bank_ds_agent.utils.logger import get_logger
+    from src.bank_ds_agent.utils.metrics import REGISTRY
 except ImportError as e:
-    print(f"致命错误: 无法导入 SandboxJupyterExecutor。")
-    print(f"请确保 __init__.py 文件存在，并且 'src' 在路径中: {e}")
+    # (get_logger 本身可能就是导入失败的模块，这里使用标准库的 logging)
+    logging.basicConfig()
+    logging.getLogger("bank_ds_agent.backend").critical(
+        "致命错误: 无法导入沙箱执行器模块。"
+        f"请确保 __init__.py 文件存在，并且 'src' 在路径中: {e}"
+    )
     sys.exit(1)
 
 
+logger = get_logger("bank_ds_agent.backend")
+
+
 # ----------------------------------------------------------------------
 # 3. Pydantic 模型（我们的 MCP 消息格式）
 # ----------------------------------------------------------------------
 class CodeRequest(BaseModel):
-    # session_id: str  # (未来用于区分不同用户的沙箱)
+    session_id: str = "default"  # 每个会话一个内核，并且用于公平排队 (轮流执行)
     code: str
+    # 单元格的执行截止时间 (秒)。客户端会据此设置自己的 HTTP 超时。
+    timeout: int = Field(default=10, ge=1, le=3600)
+    # 'interactive' (Agent 的交互式单元格) 优先于 'batch' (长时间的批处理)
+    priority: Literal["interactive", "batch"] = "interactive"
+    # 在队列中最多等待多久 (秒)，超过后返回 503 (客户端那时已经放弃了)
+    max_queue_wait: float = Field(default=30, ge=0, le=3600)
+    # False: 会话没有活着的内核时不执行，返回 409 (调用方先通过 POST /sessions
+    # 重建内核并重放之前的单元格，再执行这个单元格，保证执行顺序)
+    create_session: bool = True
+
+
+class DatasetRequest(BaseModel):
+    name: str
+    # 宿主机上的 CSV / Parquet / Arrow 文件 (必须在 DATASET_IMPORT_ROOT 中；
+    # 相对路径相对于 DATASET_IMPORT_ROOT)
+    source_path: str
 
 
 class CodeResponse(BaseModel):
     result: str
+    # 沙箱通过 'agent_sandbox.reporting' 发布的结构化字段
+    evaluation_metrics: Dict[str, Any] = {}
+    xai_report: Optional[str] = None
+    compliance_report: Optional[str] = None
+    # "attached": 在会话已有的内核上执行；"created": 内核是为这次请求新建的
+    # (之前的变量已经丢失，调用方可以重放之前的单元格)
+    session_status: str = "attached"
 
 
 # ----------------------------------------------------------------------
@@ -44,38 +91,116 @@ app = FastAPI(
     description="在安全的 Docker 容器中执行有状态的 Python 代码。",
 )
 
-# 全局变量，用于持有我们的执行器“轮子”
-executor: SandboxJupyterExecutor = None
+# 全局变量，用于持有我们的执行器“轮子”:
+# 每个会话 (session_id，Agent 中即 LangGraph 的 thread_id) 一个独立的内核，
+# 这样恢复的运行可以重新连接到它仍然活着的内核
+pool: SandboxSessionPool = None
+SANDBOX_MAX_SESSIONS = int(os.getenv("SANDBOX_MAX_SESSIONS", "4"))
+# 会话在最后一次使用后多久 (秒) 才可以被淘汰，把内核让给新会话
+SANDBOX_SESSION_IDLE_GRACE = float(os.getenv("SANDBOX_SESSION_IDLE_GRACE", "60"))
 
+# 准入控制 + 公平排队
+# (同一会话的任务永远不会并发执行；并发度最多可以提高到 SANDBOX_MAX_SESSIONS)
+scheduler = FairScheduler(
+    max_concurrency=int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "1")),
+    max_queue_per_session=int(os.getenv("SCHEDULER_MAX_QUEUE_PER_SESSION", "4")),
+    max_queue_total=int(os.getenv("SCHEDULER_MAX_QUEUE_TOTAL", "64")),
+)
 
-@app.on_event("startup")
-async def startup_event():
+# 数据集注册表 (转换一次，只读挂载到所有沙箱的 /data)
+DATASETS_DIR = os.getenv("AGENT_DATASETS_DIR", os.path.join(project_root, "datasets"))
+registry = DatasetRegistry(DATASETS_DIR)
+# 只允许从这个目录 (及其子目录) 导入数据源: POST /datasets 不能读取宿主机上的任意文件
+DATASET_IMPORT_ROOT = os.path.realpath(
+    os.getenv("AGENT_DATASET_IMPORT_ROOT", os.path.join(project_root, "data"))
+)
+
+# 执行器后端:
+#   'docker' (默认): 在容器中运行，适用于不受信任的 (LLM 生成的) 代码
+#   'local':         宿主机上的内核子进程，没有隔离，只用于开发 / CI / 受信任的批处理
+EXECUTOR_BACKEND = os.getenv("EXECUTOR_BACKEND", "docker").lower()
+
+# 队列深度仪表 (在 /metrics 采集时才读取调度器的当前状态)
+REGISTRY.gauge(
+    "sandbox_queue_depth", "调度队列中等待的任务数", ["priority"]
+).set_function(
+    lambda: {
+        (priority,): depth
+        for priority, depth in scheduler.stats()["queued_by_priority"].items()
+    }
+)
+REGISTRY.gauge("sandbox_running_jobs", "正在沙箱中执行的任务数").set_function(
+    lambda: {(): scheduler.stats()["running"]}
+)
+REGISTRY.gauge("sandbox_sessions", "当前持有内核的沙箱会话数").set_function(
+    lambda: {(): len(pool) if pool else 0}
+)
+
+
+def create_executor_factory(backend: str) -> Callable[[], KernelExecutor]:
     """
-    当 FastAPI 服务器启动时，自动构建 Docker 镜像
-    并启动我们的沙箱执行器。
+    根据配置返回一个创建执行器的函数 (每个会话调用一次)。
+    两种后端都提供相同的 execute / execute_stream / cleanup。
+    (按需导入: 'local' 模式不需要安装 docker SDK)
     """
-    global executor
-    print("FastAPI 正在启动...")
-    try:
-        # 步骤 1: 构建镜像 (这会使用缓存，除非 Dockerfile.agent 更改)
-        from src.bank_ds_agent.tools.code_executor import build_docker_image
+    if backend == "local":
+        from src.bank_ds_agent.tools.local_executor import LocalKernelExecutor
+
+        def create_local():
+            logger.info("正在启动 LocalKernelExecutor...")
+            return LocalKernelExecutor(datasets_dir=registry.root_dir)
+
+        return create_local
 
-        print("正在构建/验证 Docker 镜像...")
+    if backend == "docker":
+        from src.bank_ds_agent.tools.code_executor import (
+            SandboxJupyterExecutor,
+            build_docker_image,
+        )
+
+        # 步骤 1: 构建镜像 (这会使用缓存，除非 Dockerfile.agent 更改)
+        logger.info("正在构建/验证 Docker 镜像...")
         # (project_root 变量已在该文件的顶部定义)
         build_docker_image(
             image_tag="agent-executor:latest", build_context_path=project_root
         )  # <-- 修复！
 
-        # 步骤 2: (关键) 初始化我们的沙箱
-        print("正在启动 SandboxJupyterExecutor...")
-        executor = SandboxJupyterExecutor(image_name="agent-executor:latest")
-        print("FastAPI 启动成功：沙箱已准备就绪。")
+        # 步骤 2: (关键) 每个会话用这个镜像启动自己的沙箱容器
+        def create_docker():
+            logger.info("正在启动 SandboxJupyterExecutor...")
+            return SandboxJupyterExecutor(
+                image_name="agent-executor:latest", datasets_dir=registry.root_dir
+            )
+
+        return create_docker
+
+    raise ValueError(
+        f"未知的 EXECUTOR_BACKEND: '{backend}'。请设置为 'docker' 或 'local'。"
+    )
+
+
+@app.on_event("startup")
+async def startup_event():
+    """
+    当 FastAPI 服务器启动时，启动我们的沙箱执行器
+    (docker 后端会先自动构建镜像)。
+    """
+    global pool
+    logger.info("FastAPI 正在启动...", extra={"executor_backend": EXECUTOR_BACKEND})
+    try:
+        pool = SandboxSessionPool(
+            create_executor_factory(EXECUTOR_BACKEND),
+            max_sessions=SANDBOX_MAX_SESSIONS,
+            idle_grace=SANDBOX_SESSION_IDLE_GRACE,
+        )
+        # (预先启动默认会话，这样配置错误会在启动时就暴露出来)
+        pool.ensure("default")
+        logger.info("FastAPI 启动成功：沙箱已准备就绪。")
 
     except Exception as e:
-        print(f"!! 致命错误：FastAPI 启动失败 !!")
-        print(f"!! 无法初始化沙箱: {e}")
+        logger.exception(f"!! 致命错误：FastAPI 启动失败，无法初始化沙箱: {e}")
         # (在生产中，这应该会使服务器崩溃并重启)
-        executor = None
+        pool = None
 
 
 @app.on_event("shutdown")
@@ -83,36 +208,268 @@ async def shutdown_event():
     """
     当 FastAPI 服务器关闭时，清理内核和容器。
     """
-    global executor
-    if executor:
-        print("FastAPI 正在关闭...")
-        executor.cleanup()
+    if pool:
+        logger.info("FastAPI 正在关闭...")
+        pool.close_all()
 
 
 # ----------------------------------------------------------------------
 # 5. MCP API 端点
 # ----------------------------------------------------------------------
+def _queue_timeout(e: QueueTimeoutError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def _pool_full(e: SessionPoolFullError) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def _session_missing(e: SessionMissingError) -> HTTPException:
+    return HTTPException(status_code=409, detail=str(e))
+
+
+def _submit(
+    session_id: str, fn, priority: str = "interactive", max_wait: Optional[float] = None
+) -> "asyncio.Future":
+    """
+    将一个沙箱任务 (执行代码 / 启动会话内核) 交给调度器。队列已满时返回 429 + Retry-After；
+    max_queue_wait=0 且没有空闲槽位时返回 503 + Retry-After。
+    """
+    if not pool:
+        raise HTTPException(status_code=503, detail="沙箱服务不可用。")
+    try:
+        return scheduler.submit(session_id, fn, priority=priority, max_wait=max_wait)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except QueueTimeoutError as e:
+        raise _queue_timeout(e)
+
+
+def _run_in_session(session_id: str, fn, create: bool = True):
+    """
+    在会话的内核上运行 fn(executor) (内核不存在或已死掉时自动重建；
+    create=False 时抛出 SessionMissingError)。
+    返回 (结果, "attached" | "created")。
+    """
+    with pool.session(session_id, create=create) as (session_executor, status):
+        return fn(session_executor), "attached" if status == "attached" else "created"
+
+
 @app.post("/execute", response_model=CodeResponse)
 async def execute_code_endpoint(request: CodeRequest):
     """
     执行代码（有状态）
+    (通过调度器排队；阻塞的 execute() 在线程池中运行，不会阻塞事件循环)
     """
-    global executor
-    if not executor:
-        raise HTTPException(status_code=503, detail="沙箱服务不可用。")
+    future = _submit(
+        request.session_id,
+        lambda: _run_in_session(
+            request.session_id,
+            lambda ex: ex.execute(request.code, timeout=request.timeout),
+            create=request.create_session,
+        ),
+        request.priority,
+        request.max_queue_wait,
+    )
 
     try:
         # (关键) 调用我们轮子的 .execute() 方法
-        result_string = executor.execute(request.code)
-
-        return CodeResponse(result=result_string)
+        execution, session_status = await future
+        return CodeResponse(**execution, session_status=session_status)
 
+    except QueueTimeoutError as e:
+        raise _queue_timeout(e)
+    except SessionPoolFullError as e:
+        raise _pool_full(e)
+    except SessionMissingError as e:
+        raise _session_missing(e)
     except Exception as e:
         # (这不应该发生，因为 execute() 已经捕获了错误)
         raise HTTPException(status_code=500, detail=f"执行时发生内部错误: {e}")
 
 
+@app.post("/execute/stream")
+async def execute_code_stream_endpoint(request: CodeRequest):
+    """
+    执行代码（有状态），并以 NDJSON 的形式流式返回输出:
+    每一行是 {"type": "output", "text": ...}，最后一行是 {"type": "result", ...}。
+    """
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    started = loop.create_future()
+
+    def run_stream():
+        # (在线程池中运行，把事件安全地交回事件循环)
+        with pool.session(request.session_id, create=request.create_session) as (
+            session_executor,
+            _,
+        ):
+            loop.call_soon_threadsafe(started.set_result, None)
+            events_iter = session_executor.execute_stream(
+                request.code, timeout=request.timeout
+            )
+            for event in events_iter:
+                if event["type"] == "result":
+                    event = {"type": "result", **event["execution"]}
+                loop.call_soon_threadsafe(events.put_nowait, event)
+
+    # (准入检查在开始流式响应之前完成，这样才能返回 429 / 503:
+    #  等到任务拿到会话的内核 (或者在队列中过期、会话已满) 之后才发送响应头)
+    future = _submit(
+        request.session_id, run_stream, request.priority, request.max_queue_wait
+    )
+    future.add_done_callback(lambda _: events.put_nowait(None))
+    await asyncio.wait({started, future}, return_when=asyncio.FIRST_COMPLETED)
+    if not started.done():
+        started.cancel()
+        if isinstance(future.exception(), QueueTimeoutError):
+            raise _queue_timeout(future.exception())
+        if isinstance(future.exception(), SessionPoolFullError):
+            raise _pool_full(future.exception())
+        if isinstance(future.exception(), SessionMissingError):
+            raise _session_missing(future.exception())
+
+    async def ndjson_events():
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+        error = future.exception()
+        if error is not None:
+            yield json.dumps(
+                {"type": "result", "result": f"[Error] 执行时发生内部错误: {error}"},
+                ensure_ascii=False,
+            ) + "\n"
+
+    return StreamingResponse(ndjson_events(), media_type="application/x-ndjson")
+
+
+@app.post("/sessions/{session_id:path}")
+async def ensure_session_endpoint(
+    session_id: str,
+    priority: Literal["interactive", "batch"] = "interactive",
+    max_queue_wait: float = Query(default=30, ge=0, le=3600),
+):
+    """
+    重新连接会话仍然活着的内核，或者重建一个。
+    返回 {"status": "attached"} 或 {"status": "created"} (之前的内核状态已丢失，
+    调用方需要重放之前的单元格)。
+    启动内核与执行代码一样经过调度器 (准入控制 + 公平排队)。
+    """
+    future = _submit(session_id, lambda: pool.ensure(session_id), priority, max_queue_wait)
+    try:
+        return await future
+    except QueueTimeoutError as e:
+        raise _queue_timeout(e)
+    except SessionPoolFullError as e:
+        raise _pool_full(e)
+    except Exception as e:
+        logger.exception(f"无法启动会话内核: {e}", extra={"session_id": session_id})
+        raise HTTPException(status_code=503, detail=f"无法启动会话内核: {e}")
+
+
+@app.delete("/sessions/{session_id:path}")
+def close_session_endpoint(session_id: str):
+    """
+    关闭会话的内核 (例如 Agent 任务完成之后)。
+    """
+    if not pool or not pool.close(session_id):
+        raise HTTPException(status_code=404, detail=f"会话 '{session_id}' 不存在。")
+    return {"session_id": session_id, "status": "closed"}
+
+
+@app.get("/sessions")
+async def list_sessions_endpoint():
+    """
+    列出当前持有内核的会话。
+    """
+    return pool.stats() if pool else []
+
+
+@app.get("/scheduler/stats")
+async def scheduler_stats_endpoint():
+    """
+    队列深度和调度统计 (全局 / 按优先级 / 按会话)。
+    """
+    return scheduler.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Prometheus 文本格式的指标 (沙箱延迟、输出大小、队列深度、缓存命中等)。
+    """
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.get("/datasets")
+async def list_datasets_endpoint():
+    """
+    列出所有已注册的数据集。
+    """
+    return registry.list_datasets()
+
+
+def _resolve_import_path(source_path: str) -> str:
+    """
+    解析数据源路径 (包括符号链接和 '..')，并确认它在 DATASET_IMPORT_ROOT 之内，
+    否则返回 403。
+    """
+    resolved = os.path.realpath(os.path.join(DATASET_IMPORT_ROOT, source_path))
+    if os.path.commonpath([DATASET_IMPORT_ROOT, resolved]) != DATASET_IMPORT_ROOT:
+        raise HTTPException(
+            status_code=403,
+            detail=f"数据源必须位于导入目录 {DATASET_IMPORT_ROOT} 之内。",
+        )
+    return resolved
+
+
+@app.post("/datasets")
+def register_dataset_endpoint(request: DatasetRequest):
+    """
+    注册 (或刷新) 一个数据集。转换是一次性的，并且会阻塞，
+    所以这里使用同步函数 (FastAPI 会在线程池中运行它)。
+    """
+    source_path = _resolve_import_path(request.source_path)
+    try:
+        return registry.register(request.name, source_path)
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/datasets/{name}/profile")
+def dataset_profile_endpoint(name: str, target: Optional[str] = None):
+    """
+    返回数据集的画像 (按数据集指纹缓存)。
+    """
+    try:
+        return registry.profile(name, target_column=target)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        # (例如目标列的类型不能统计分布)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception(f"计算数据集画像失败: {e}", extra={"dataset": name})
+        raise HTTPException(status_code=500, detail=f"计算数据集画像失败: {e}")
+
+
 if __name__ == "__main__":
     # 允许直接运行此文件 (尽管我们更推荐 'uvicorn main:app')
-    print("正在启动 Uvicorn (调试模式)...")
+    logger.info("正在启动 Uvicorn (调试模式)...")
     uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,357 @@
+"""
+离线端到端基准测试: 用脚本化的假 LLM 和进程内内核驱动 graph.py 中编译好的图。
+
+不需要 Docker、GGUF 模型或 API 密钥，可以在普通的 Linux CI 机器上运行:
+
+    python -m benchmarks.run_agent_benchmark --runs 3 --iterations 40
+    python -m benchmarks.run_agent_benchmark --output bench.json
+    python -m benchmarks.run_agent_benchmark --baseline bench.json --max-regression 0.25
+(也可以直接运行 python benchmarks/run_agent_benchmark.py；CI 中的冒烟测试见
+ tests/test_benchmark_smoke.py)
+
+报告 (JSON):
+  - 每秒循环次数 (code_generator -> code_executor -> reflection 为一次循环)
+  - 每个节点的延迟分布 (p50 / p95 / max)，以及 LangGraph 自身的调度开销
+  - 长时间运行中 AgentState 的内存增长 (每次循环后序列化的状态大小)
+  - 沙箱往返开销 (空单元格的往返延迟)
+--sandbox 可选 inprocess (默认) / local (内核子进程) / mcp (正在运行的后端)。
+--checkpoint-db 默认在临时文件中使用 SQLite 检查点 (与生产配置相同)，"off" 禁用。
+指定 --baseline 时，如果吞吐量、节点执行次数或状态增长退化超过阈值，退出码为 1。
+--gate deterministic 只用确定性的指标 (节点执行次数、状态大小) 判定退化，
+吞吐量只报告不判定 (CI 的共享机器上吞吐量的抖动很大)。
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import shutil
+import resource
+import tempfile
+
+# (与 backend/main.py 相同: 将项目根目录添加到 Python 路径，
+#  这样直接运行脚本时也能导入 'benchmarks.stand_ins' 和 'src.bank_ds_agent...')
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+from src.bank_ds_agent.utils.logger import configure_logging  # noqa: E402
+
+
+def _percentile(values, q):
+    """最近秩百分位数 (样本很少时也有意义)。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(int(round(q / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def _distribution(values):
+    return {
+        "count": len(values),
+        "p50": round(_percentile(values, 50), 6),
+        "p95": round(_percentile(values, 95), 6),
+        "max": round(max(values), 6) if values else 0.0,
+        "total": round(sum(values), 6),
+    }
+
+
+class TimedSandbox:
+    """
+    包装沙箱的 execute()，记录每次往返的墙钟时间。
+    签名与 mcp_client.execute_code_in_sandbox 兼容，可以直接替换。
+    """
+
+    def __init__(self, execute_fn):
+        self._execute = execute_fn
+        self.round_trips = []
+
+    def __call__(self, code, timeout=10, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._execute(code, timeout=timeout)
+        finally:
+            self.round_trips.append(time.perf_counter() - start)
+
+    def ensure_session(self, session_id):
+        # (单个内核始终保持连接，替代 mcp_client.ensure_sandbox_session)
+        return {"session_id": session_id, "status": "attached", "backend": "benchmark"}
+
+
+def _make_sandbox(kind):
+    """返回 (execute_fn, cleanup_fn)。"""
+    if kind == "inprocess":
+        from benchmarks.stand_ins import InProcessSandbox
+
+        sandbox = InProcessSandbox()
+        return sandbox.execute, sandbox.cleanup
+
+    if kind == "local":
+        # 本地内核子进程 (与后端 EXECUTOR_BACKEND=local 相同)
+        from src.bank_ds_agent.tools.local_executor import LocalKernelExecutor
+
+        sandbox = LocalKernelExecutor()
+        return sandbox.execute, sandbox.cleanup
+
+    # 'mcp': 通过真实的 FastAPI 服务器 (需要它已经在运行)，用于测量 HTTP + Docker 的开销
+    from src.bank_ds_agent.tools import mcp_client
+
+    def execute(code, timeout=10):
+        return mcp_client.execute_code_in_sandbox(
+            code, timeout=timeout, session_id="benchmark", priority="batch"
+        )
+
+    return execute, mcp_client.close_clients
+
+
+def _probe_round_trip(execute_fn, samples):
+    """空单元格的往返延迟 = 纯粹的沙箱协议开销。"""
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        execute_fn("pass", timeout=10)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _make_checkpointer(path):
+    """返回 (checkpointer, cleanup_fn)。checkpointer 为 None 时不保存检查点。"""
+    from src.bank_ds_agent.agent.checkpoint import SQLiteCheckpointSaver
+
+    if path and path.strip().lower() == "off":
+        return None, lambda: None
+    tmp_dir = None
+    if not path:
+        tmp_dir = tempfile.mkdtemp(prefix="agent_bench_ckpt_")
+        path = os.path.join(tmp_dir, "checkpoints.sqlite")
+    saver = SQLiteCheckpointSaver(path)
+
+    def cleanup():
+        saver.close()
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return saver, cleanup
+
+
+def _run_graph(graph, llm, node_timings, config):
+    """运行一次图，返回 (循环次数, 墙钟时间, 每次循环后的状态大小)。"""
+    llm.reset()
+    initial_state = {
+        "task": "分析银行客户流失，训练一个模型并报告准确率。",
+        "messages": [],
+        "evaluation_metrics": {},
+        "dataset_name": None,
+    }
+    loops = 0
+    state_sizes = []
+    measure_state = False
+    excluded = 0.0  # (序列化状态本身的耗时，不计入结果)
+    start = last = time.perf_counter()
+    for mode, chunk in graph.stream(
+        initial_state, config=config, stream_mode=["updates", "values"]
+    ):
+        now = time.perf_counter()
+        if mode == "updates":
+            for node in chunk:
+                node_timings.setdefault(node, []).append(now - last)
+                if node == "reflection":
+                    loops += 1
+                    measure_state = True
+            last = now
+        elif measure_state:
+            # (每次 reflection 之后记录一次完整状态的序列化大小)
+            state_sizes.append(len(pickle.dumps(chunk)))
+            measure_state = False
+            last = time.perf_counter()
+            excluded += last - now
+    return loops, time.perf_counter() - start - excluded, state_sizes
+
+
+def run_benchmark(args):
+    configure_logging(level=args.log_level)
+
+    from benchmarks.stand_ins import ScriptedLLM
+    import src.bank_ds_agent.agent.llms as llms
+    import src.bank_ds_agent.agent.nodes.code_executor as code_executor_module
+    from src.bank_ds_agent.agent.graph import create_agent_graph, thread_config
+    from src.bank_ds_agent.agent.instrumentation import NODE_LATENCY
+
+    llm = ScriptedLLM(
+        iterations=args.iterations,
+        latency=args.llm_latency,
+        output_bytes=args.output_bytes,
+    )
+    # (get_llm() 返回缓存的实例，所以直接替换缓存即可)
+    llms._llm_instance = llm
+
+    execute_fn, cleanup = _make_sandbox(args.sandbox)
+    sandbox = TimedSandbox(execute_fn)
+    original_execute = code_executor_module.execute_code_in_sandbox
+    original_ensure = code_executor_module.ensure_sandbox_session
+    code_executor_module.execute_code_in_sandbox = sandbox
+    code_executor_module.ensure_sandbox_session = sandbox.ensure_session
+    checkpointer, cleanup_checkpointer = _make_checkpointer(args.checkpoint_db)
+
+    try:
+        graph = create_agent_graph(checkpointer=checkpointer)
+        probe = _probe_round_trip(execute_fn, args.probe_samples)
+
+        node_timings = {}
+        per_run = []
+        state_growth = []
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        wall_total = 0.0
+        loops_total = 0
+        node_names = [n for n in graph.nodes if not n.startswith("__")]
+        node_total_before = sum(NODE_LATENCY.sum(node=n) for n in node_names)
+
+        for i in range(args.runs):
+            # (每次运行一个新的 thread_id；每次循环 3 个节点，外加 planner / data_profiler)
+            config = thread_config(
+                f"bench-{os.getpid()}-{i}", recursion_limit=args.iterations * 3 + 10
+            )
+            loops, wall, sizes = _run_graph(graph, llm, node_timings, config)
+            per_run.append(
+                {"iterations": loops, "seconds": round(wall, 4), "state_bytes": sizes}
+            )
+            if len(sizes) > 1:
+                state_growth.append((sizes[-1] - sizes[0]) / (len(sizes) - 1))
+            wall_total += wall
+            loops_total += loops
+
+        node_total = (
+            sum(NODE_LATENCY.sum(node=n) for n in node_names) - node_total_before
+        )
+    finally:
+        code_executor_module.execute_code_in_sandbox = original_execute
+        code_executor_module.ensure_sandbox_session = original_ensure
+        llms._llm_instance = None
+        cleanup()
+        cleanup_checkpointer()
+
+    final_sizes = per_run[-1]["state_bytes"] if per_run else []
+    growth = sum(state_growth) / len(state_growth) if state_growth else 0.0
+    ips = loops_total / wall_total if wall_total else 0.0
+    return {
+        "config": {
+            "runs": args.runs,
+            "iterations": args.iterations,
+            "llm_latency": args.llm_latency,
+            "output_bytes": args.output_bytes,
+            "sandbox": args.sandbox,
+            "checkpointer": type(checkpointer).__name__ if checkpointer else None,
+        },
+        "iterations_per_second": round(ips, 3),
+        "wall_seconds": round(wall_total, 4),
+        "node_latency_seconds": {
+            node: _distribution(values)
+            for node, values in sorted(node_timings.items())
+        },
+        # (节点函数之外的时间: LangGraph 调度、状态合并、检查点等)
+        "graph_overhead_seconds": round(max(wall_total - node_total, 0.0), 4),
+        "state_memory": {
+            "final_state_bytes": final_sizes[-1] if final_sizes else 0,
+            "growth_bytes_per_iteration": round(growth, 1),
+            "max_rss_growth_kb": (
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+            ),
+        },
+        "sandbox_round_trip_seconds": {
+            "noop": _distribution(probe),
+            "cells": _distribution(sandbox.round_trips),
+        },
+        "llm_calls": llm.calls,
+        "runs": per_run if args.verbose else None,
+    }
+
+
+def _node_executions_per_run(report):
+    runs = report.get("config", {}).get("runs") or 1
+    return sum(d["count"] for d in report.get("node_latency_seconds", {}).values()) / runs
+
+
+def compare_with_baseline(report, baseline, max_regression, gate="all"):
+    """
+    返回 (退化描述的列表, 只报告的变化列表)。退化列表为空 = 没有退化。
+    gate="deterministic": 吞吐量的变化只报告，不算退化。
+    """
+    failures, notes = [], []
+
+    old_ips = baseline.get("iterations_per_second", 0)
+    new_ips = report["iterations_per_second"]
+    if old_ips and new_ips < old_ips * (1 - max_regression):
+        message = f"iterations_per_second: {old_ips} -> {new_ips}"
+        (failures if gate == "all" else notes).append(message)
+    elif old_ips:
+        notes.append(f"iterations_per_second: {old_ips} -> {new_ips}")
+
+    # (以下指标与机器速度无关，每次运行的结果都相同)
+    old_nodes = _node_executions_per_run(baseline)
+    new_nodes = _node_executions_per_run(report)
+    if old_nodes and new_nodes > old_nodes * (1 + max_regression):
+        failures.append(f"node_executions_per_run: {old_nodes} -> {new_nodes}")
+
+    old_memory = baseline.get("state_memory", {})
+    new_memory = report["state_memory"]
+    for key in ("growth_bytes_per_iteration", "final_state_bytes"):
+        old_value, new_value = old_memory.get(key, 0), new_memory[key]
+        if old_value and new_value > old_value * (1 + max_regression):
+            failures.append(f"{key}: {old_value} -> {new_value}")
+    return failures, notes
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Agent 图的离线端到端基准测试")
+    parser.add_argument("--runs", type=int, default=3, help="运行图的次数")
+    parser.add_argument("--iterations", type=int, default=20, help="每次运行的循环次数")
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.0, help="每次 LLM 调用的模拟延迟 (秒)"
+    )
+    parser.add_argument("--output-bytes", type=int, default=0, help="每个单元格额外打印的字节数")
+    parser.add_argument("--sandbox", choices=["inprocess", "local", "mcp"], default="inprocess")
+    parser.add_argument(
+        "--checkpoint-db", help="SQLite 检查点文件 (默认使用临时文件，'off' 禁用检查点)"
+    )
+    parser.add_argument("--probe-samples", type=int, default=50, help="空单元格往返探测的次数")
+    parser.add_argument("--output", help="把 JSON 报告写入这个文件 (默认打印到 stdout)")
+    parser.add_argument("--baseline", help="与之前的 JSON 报告比较")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="允许的退化比例")
+    parser.add_argument(
+        "--gate",
+        choices=["all", "deterministic"],
+        default="all",
+        help="'deterministic': 只用节点执行次数和状态大小判定退化，吞吐量只报告",
+    )
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--verbose", action="store_true", help="报告中包含每次运行的明细")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmark(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        failures, notes = compare_with_baseline(
+            report, baseline, args.max_regression, gate=args.gate
+        )
+        if notes:
+            print("与基线相比 (只报告):\n  " + "\n  ".join(notes), file=sys.stderr)
+        if failures:
+            print("性能退化:\n  " + "\n  ".join(failures), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+from langchain_core.messages import AIMessage
+
+from src.bank_ds_agent.agent.nodes.code_generator import CODE_GENERATOR_SYSTEM_PROMPT
+from src.bank_ds_agent.tools.kernel_executor import KernelExecutor
+
+# ----------------------------------------------------------------------
+# 离线基准测试用的“替身”:
+#   - ScriptedLLM: 确定性的假 LLM (LangChain 风格，只实现 .invoke)
+#   - InProcessSandbox: 在当前进程中运行的 IPython 内核，替代 Docker 沙箱
+# 两者都不需要 GPU / GGUF 模型 / API 密钥 / Docker。
+# ----------------------------------------------------------------------
+
+SANDBOX_LIB_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "src", "bank_ds_agent", "sandbox")
+)
+
+# 默认的脚本化单元格 (循环使用): 造数据 -> 描述统计 -> 训练/发布指标 -> 聚合
+DEFAULT_CELLS = [
+    "import numpy as np\n"
+    "import pandas as pd\n"
+    "rng = np.random.default_rng(0)\n"
+    "df = pd.DataFrame({\n"
+    "    'balance': rng.normal(5000, 1500, 5000),\n"
+    "    'tenure': rng.integers(0, 120, 5000),\n"
+    "    'churn': rng.integers(0, 2, 5000),\n"
+    "})\n"
+    "print(df.shape)",
+    "print(df.describe().round(2))",
+    "from agent_sandbox import publish_metrics\n"
+    "score = (df['balance'] - df['balance'].mean()) / df['balance'].std()\n"
+    "pred = (score > 0).astype(int)\n"
+    "publish_metrics({'accuracy': float((pred == df['churn']).mean())})",
+    "df.groupby('churn')['tenure'].mean()",
+]
+
+
+def _usage(prompt: str, completion: str) -> dict:
+    # (粗略估算: 约 4 个字符一个 token，只用于让 token 指标有数据)
+    input_tokens = len(prompt) // 4
+    output_tokens = max(len(completion) // 4, 1)
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+    }
+
+
+class ScriptedLLM:
+    """
+    确定性的假 LLM。根据提示词判断是哪个节点在调用它:
+      - code_generator (系统提示词): 返回下一个脚本化单元格的 PythonCode 工具调用
+      - reflection ("complete/continue"): 执行满 iterations 个单元格后返回 "complete"
+      - planner (其他): 返回固定的业务目标
+    latency 是每次调用前的模拟延迟 (秒)。
+    """
+
+    def __init__(
+        self,
+        iterations: int,
+        cells: Optional[List[str]] = None,
+        latency: float = 0.0,
+        output_bytes: int = 0,
+    ):
+        self.iterations = iterations
+        self.cells = cells or DEFAULT_CELLS
+        self.latency = latency
+        # 每个单元格额外打印的字节数 (模拟大输出，观察 AgentState 的增长)
+        self.output_bytes = output_bytes
+        self.calls = 0
+        self._cells_issued = 0
+
+    def reset(self) -> None:
+        """每次运行图之前调用。"""
+        self._cells_issued = 0
+
+    def invoke(self, messages, **kwargs) -> AIMessage:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = "\n".join(str(m.content) for m in messages)
+
+        first = messages[0]
+        if first.type == "system" and first.content == CODE_GENERATOR_SYSTEM_PROMPT:
+            code = self.cells[self._cells_issued % len(self.cells)]
+            if self.output_bytes:
+                code += f"\nprint('x' * {self.output_bytes})"
+            self._cells_issued += 1
+            return AIMessage(
+                content="",
+                tool_calls=[
+                    {
+                        "id": f"bench_call_{self.calls}",
+                        "name": "PythonCode",
+                        "args": {"code_string": code},
+                    }
+                ],
+                usage_metadata=_usage(prompt, code),
+            )
+
+        if "complete/continue" in prompt:
+            done = self._cells_issued >= self.iterations
+            decision = "complete" if done else "continue"
+            return AIMessage(content=decision, usage_metadata=_usage(prompt, decision))
+
+        objective = "构建一个客户流失预测模型，并报告其准确率。"
+        return AIMessage(content=objective, usage_metadata=_usage(prompt, objective))
+
+
+class _InProcessClient:
+    """
+    包装 BlockingInProcessKernelClient。
+    进程内内核发出的 stream 消息没有 parent_header (输出流不知道当前请求)，
+    而 execute_stream 会丢弃不属于当前 msg_id 的消息。
+    由于进程内执行是同步的，这些消息一定属于最近一次 execute()，这里补上。
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._last_msg_id = None
+
+    def execute(self, code, **kwargs):
+        self._last_msg_id = self._client.execute(code, **kwargs)
+        return self._last_msg_id
+
+    def get_iopub_msg(self, **kwargs):
+        msg = self._client.get_iopub_msg(**kwargs)
+        if not msg["parent_header"]:
+            msg["parent_header"] = {"msg_id": self._last_msg_id}
+        return msg
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class InProcessSandbox(KernelExecutor):
+    """
+    在当前进程中运行的 IPython 内核 (ipykernel.inprocess)。
+    复用 KernelExecutor 的消息解析 (execute / execute_stream)，
+    但没有子进程和 ZMQ 套接字，所以往返开销只剩下 jupyter 消息协议本身。
+
+    注意: 内核与调用方在同一个线程中同步执行，单元格超时不会生效。
+    """
+
+    backend_name = "inprocess"
+
+    def __init__(self):
+        from ipykernel.inprocess.manager import InProcessKernelManager
+
+        # (与镜像一致: 辅助库以 'agent_sandbox' 的名字导入)
+        self.kernel_dir = tempfile.mkdtemp(prefix="agent_bench_")
+        os.symlink(SANDBOX_LIB_DIR, os.path.join(self.kernel_dir, "agent_sandbox"))
+        sys.path.insert(0, self.kernel_dir)
+
+        self._manager = InProcessKernelManager()
+        self._manager.start_kernel()
+        client = self._manager.client()
+        client.start_channels()
+        # (进程内内核在 start_kernel() 返回时就已就绪，不需要 wait_for_ready)
+        self.km = _InProcessClient(client)
+
+    def cleanup(self):
+        if self.km:
+            self.km.stop_channels()
+            self._manager.shutdown_kernel()
+        if self.kernel_dir in sys.path:
+            sys.path.remove(self.kernel_dir)
+        if self.kernel_dir and os.path.exists(self.kernel_dir):
+            shutil.rmtree(self.kernel_dir)
+        self.km = None
@@ -0,0 +1,494 @@
+import os
+import random
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from ..utils.logger import get_logger
+from ..utils.metrics import REGISTRY, DEFAULT_SIZE_BUCKETS
+
+logger = get_logger(__name__)
+
+# ----------------------------------------------------------------------
+# 持久化的图检查点 (SQLite，只依赖标准库)
+#
+# 每个节点完成后 LangGraph 都会保存一个检查点。进程崩溃 / 重新部署之后，
+# 用同一个 thread_id 调用 graph.stream(None, config) 就会从最后一个
+# 完成的节点继续，而不是从 planner 重新开始。
+#
+# 紧凑存储:
+#   - 与 LangGraph 的内存检查点一样，每个通道按版本单独存储，
+#     只有本步骤中变化了的通道才会写入新的 blob。
+#   - 'messages' 每一步都会变化 (只追加)。对它只存储相对上一个版本
+#     新增的尾部 (base_version 指向上一个版本)，每 snapshot_every 个
+#     增量存一次完整快照，读取时的链长度因此有上限。
+#
+# 环境变量:
+#   AGENT_CHECKPOINT_DB = create_persistent_graph() 使用的 SQLite 文件路径
+#                         (默认 <项目根目录>/.checkpoints/agent.sqlite)
+#                         设置为 "off" 则不使用检查点
+# ----------------------------------------------------------------------
+
+PROJECT_ROOT = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..", "..")
+)
+DEFAULT_CHECKPOINT_DB = os.path.join(PROJECT_ROOT, ".checkpoints", "agent.sqlite")
+
+# 只追加的列表通道 (使用增量编码)
+DELTA_CHANNELS = ("messages",)
+
+CHECKPOINT_WRITE_BYTES = REGISTRY.histogram(
+    "agent_checkpoint_write_bytes",
+    "每个检查点写入的通道数据大小 (字节)",
+    buckets=DEFAULT_SIZE_BUCKETS,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB,
+    base_version TEXT,
+    depth INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+def default_checkpointer() -> Optional["SQLiteCheckpointSaver"]:
+    """
+    根据 AGENT_CHECKPOINT_DB 创建默认的检查点 (设置为 "off" 时返回 None)。
+    """
+    path = os.getenv("AGENT_CHECKPOINT_DB", DEFAULT_CHECKPOINT_DB)
+    if path.strip().lower() in ("", "off", "none"):
+        return None
+    return SQLiteCheckpointSaver(path)
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    基于 SQLite 的 LangGraph 检查点，对只追加的 'messages' 通道做增量存储。
+
+    连接在第一次使用时才打开 (导入 graph.py 时不会创建数据库文件)。
+    同一个实例可以被多个线程共享。
+    max_cached_lists 限制增量编码缓存的通道数 (LRU)；被淘汰的线程下一次
+    写入一个完整快照，不影响正确性。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        serde=None,
+        delta_channels: Sequence[str] = DELTA_CHANNELS,
+        snapshot_every: int = 20,
+        max_cached_lists: int = 256,
+    ):
+        super().__init__(serde=serde)
+        self.path = path
+        self.delta_channels = tuple(delta_channels)
+        self.snapshot_every = snapshot_every
+        self.max_cached_lists = max_cached_lists
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        # {(thread_id, ns, channel): (version, 列表的浅拷贝, depth)}
+        # 用于判断新值是否只是在上一个版本后面追加 (按对象身份比较，只需 O(n) 次指针比较)
+        # (LRU: 长时间运行的服务器不会为每个历史线程都保留一份完整的消息列表)
+        self._last_lists: "OrderedDict[Tuple[str, str, str], Tuple[str, list, int]]" = (
+            OrderedDict()
+        )
+
+    # --- 连接 ---
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    if self.path != ":memory:":
+                        directory = os.path.dirname(os.path.abspath(self.path))
+                        os.makedirs(directory, exist_ok=True)
+                    conn = sqlite3.connect(self.path, check_same_thread=False)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA synchronous=NORMAL")
+                    conn.executescript(_SCHEMA)
+                    self._conn = conn
+                    logger.info("检查点数据库已打开", extra={"path": self.path})
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._last_lists.clear()
+
+    # --- 通道 blob (带增量编码) ---
+
+    def _remember_list(
+        self, key: Tuple[str, str, str], version: str, value: list, depth: int
+    ) -> None:
+        self._last_lists[key] = (version, list(value), depth)
+        self._last_lists.move_to_end(key)
+        while len(self._last_lists) > self.max_cached_lists:
+            self._last_lists.popitem(last=False)
+
+    def _encode_channel(
+        self, thread_id: str, ns: str, channel: str, version: str, value: Any
+    ) -> Tuple[str, bytes, Optional[str], int]:
+        """返回 (type, bytes, base_version, depth)。"""
+        key = (thread_id, ns, channel)
+        if channel not in self.delta_channels or not isinstance(value, list):
+            return (*self.serde.dumps_typed(value), None, 0)
+
+        previous = self._last_lists.get(key)
+        if previous is not None:
+            base_version, base_list, depth = previous
+            if (
+                depth < self.snapshot_every
+                and len(value) >= len(base_list)
+                and all(a is b for a, b in zip(value, base_list))
+            ):
+                tail = value[len(base_list):]
+                self._remember_list(key, version, value, depth + 1)
+                return (*self.serde.dumps_typed(tail), base_version, depth + 1)
+
+        self._remember_list(key, version, value, 0)
+        return (*self.serde.dumps_typed(value), None, 0)
+
+    def _load_channel(
+        self, thread_id: str, ns: str, channel: str, version: str
+    ) -> Tuple[bool, Any]:
+        """返回 (是否有值, 值)。增量 blob 会沿 base_version 链重建完整列表。"""
+        tails: List[list] = []
+        current = version
+        depth = None
+        while True:
+            row = self.conn.execute(
+                "SELECT type, value, base_version, depth FROM blobs WHERE "
+                "thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, ns, channel, current),
+            ).fetchone()
+            if row is None:
+                return False, None
+            type_, data, base_version, row_depth = row
+            if depth is None:
+                depth = row_depth
+            if type_ == "empty":
+                return False, None
+            value = self.serde.loads_typed((type_, data))
+            if base_version is None:
+                break
+            tails.append(value)
+            current = base_version
+
+        if channel not in self.delta_channels or not isinstance(value, list):
+            return True, value
+        full = list(value)
+        for tail in reversed(tails):
+            full.extend(tail)
+        # (恢复之后的下一次写入可以继续做增量，而不是先写一个完整快照)
+        self._remember_list((thread_id, ns, channel), version, full, depth)
+        return True, full
+
+    def _load_channels(
+        self, thread_id: str, ns: str, versions: ChannelVersions
+    ) -> Dict[str, Any]:
+        values = {}
+        for channel, version in versions.items():
+            found, value = self._load_channel(thread_id, ns, channel, str(version))
+            if found:
+                values[channel] = value
+        return values
+
+    # --- 读取 ---
+
+    def _make_tuple(self, thread_id: str, ns: str, row) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, data, metadata_type, metadata = row
+        checkpoint = self.serde.loads_typed((type_, data))
+        writes = self.conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? "
+            "ORDER BY task_path, task_id, idx",
+            (thread_id, ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_channels(
+                    thread_id, ns, checkpoint["channel_versions"]
+                ),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((t, v)))
+                for task_id, channel, t, v in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        columns = (
+            "checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+            "metadata_type, metadata"
+        )
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, ns),
+                ).fetchone()
+            if row is None:
+                return None
+            return self._make_tuple(thread_id, ns, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+            "type, checkpoint, metadata_type, metadata FROM checkpoints"
+        )
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (ns := config["configurable"].get("checkpoint_ns")) is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+
+        for thread_id, ns, *row in rows:
+            if limit is not None and limit <= 0:
+                break
+            metadata = self.serde.loads_typed((row[4], row[5]))
+            if filter and not all(metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            with self._lock:
+                item = self._make_tuple(thread_id, ns, row)
+            # (在锁外 yield: 调用方中途停止迭代或者在迭代时写入，都不会阻塞其他线程)
+            yield item
+
+    # --- 写入 ---
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint = checkpoint.copy()
+        values: Dict[str, Any] = checkpoint.pop("channel_values")
+
+        with self._lock:
+            blob_rows = []
+            for channel, version in new_versions.items():
+                if channel in values:
+                    type_, data, base_version, depth = self._encode_channel(
+                        thread_id, ns, channel, str(version), values[channel]
+                    )
+                else:
+                    type_, data, base_version, depth = "empty", b"", None, 0
+                blob_rows.append(
+                    (thread_id, ns, channel, str(version), type_, data)
+                    + (base_version, depth)
+                )
+            type_, data = self.serde.dumps_typed(checkpoint)
+            metadata_type, metadata_data = self.serde.dumps_typed(
+                get_checkpoint_metadata(config, metadata)
+            )
+            try:
+                with self.conn:
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        blob_rows,
+                    )
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO checkpoints "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            thread_id,
+                            ns,
+                            checkpoint["id"],
+                            config["configurable"].get("checkpoint_id"),
+                            type_,
+                            data,
+                            metadata_type,
+                            metadata_data,
+                        ),
+                    )
+            except Exception:
+                # (增量的基准版本没有写入成功，下一次必须写完整快照)
+                self._last_lists.clear()
+                raise
+        CHECKPOINT_WRITE_BYTES.observe(sum(len(row[5]) for row in blob_rows))
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # (特殊写入 (错误/中断等) 使用负索引，可以覆盖；普通写入只保留第一次)
+        verb = (
+            "INSERT OR REPLACE"
+            if all(channel in WRITES_IDX_MAP for channel, _ in writes)
+            else "INSERT OR IGNORE"
+        )
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self.serde.dumps_typed(value)
+            rows.append(
+                (
+                    thread_id,
+                    ns,
+                    checkpoint_id,
+                    task_id,
+                    WRITES_IDX_MAP.get(channel, idx),
+                    channel,
+                    type_,
+                    data,
+                    task_path,
+                )
+            )
+        with self._lock, self.conn:
+            self.conn.executemany(
+                f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock, self.conn:
+            for table in ("checkpoints", "blobs", "writes"):
+                self.conn.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,)
+                )
+            for key in [k for k in self._last_lists if k[0] == thread_id]:
+                del self._last_lists[key]
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # (与 LangGraph 内存检查点相同的版本格式: 可按字符串排序)
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # --- 异步接口 (SQLite 调用很快，直接复用同步实现) ---
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(
+        self, config, checkpoint, metadata, new_versions
+    ) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = "") -> None:
+        return self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return self.delete_thread(thread_id)
@@ -1,25 +1,47 @@
+from functools import lru_cache
+from typing import Any, Dict, Iterator, Optional
 from langgraph.graph import StateGraph, END  # <--- 修复 1
 from .state import AgentState
+from .checkpoint import default_checkpointer
 from .nodes.planner import planner_node
+from .nodes.data_profiler import data_profiler_node
 from .nodes.code_generator import code_generator_node
 from .nodes.code_executor import code_executor_node
 from .nodes.reflection import reflection_node
+from .instrumentation import instrument_node
+from ..utils.logger import get_logger
 
+logger = get_logger(__name__)
 
-def create_agent_graph():
+
+def create_agent_graph(checkpointer=None):
     """
     创建并编译 agentic 循环图。
+
+    checkpointer:
+      - None / False (默认): 不保存检查点
+      - 其他: 任何 LangGraph BaseCheckpointSaver
+    需要持久化 (崩溃后继续) 时使用 create_persistent_graph()。
+    有检查点时，每次运行都必须在 config 中提供 thread_id (见 thread_config)。
     """
-    print("--- [Graph] 正在构建 Agent 状态机... ---")
+    logger.info("正在构建 Agent 状态机...")
 
     # 1. 初始化图，并绑定我们的“记忆”（AgentState）
     workflow = StateGraph(AgentState)  # <--- 修复 2
 
     # 2. 添加我们所有的“功能模块”（节点）
-    workflow.add_node("planner", planner_node)
-    workflow.add_node("code_generator", code_generator_node)
-    workflow.add_node("code_executor", code_executor_node)
-    workflow.add_node("reflection", reflection_node)
+    #    (每个节点都被包装，以记录延迟直方图)
+    workflow.add_node("planner", instrument_node("planner", planner_node))
+    workflow.add_node(
+        "data_profiler", instrument_node("data_profiler", data_profiler_node)
+    )
+    workflow.add_node(
+        "code_generator", instrument_node("code_generator", code_generator_node)
+    )
+    workflow.add_node(
+        "code_executor", instrument_node("code_executor", code_executor_node)
+    )
+    workflow.add_node("reflection", instrument_node("reflection", reflection_node))
 
     # 3. 设置入口点
     # (Agent 总是从 "planner" 节点开始)
@@ -27,8 +49,9 @@ def create_agent_graph():
 
     # 4. 连接“节点” (添加边)
 
-    # (规划师 -> 编码器)
-    workflow.add_edge("planner", "code_generator")
+    # (规划师 -> 数据画像 -> 编码器)
+    workflow.add_edge("planner", "data_profiler")
+    workflow.add_edge("data_profiler", "code_generator")
 
     # (编码器 -> 执行器)
     workflow.add_edge("code_generator", "code_executor")
@@ -47,7 +70,7 @@ def create_agent_graph():
         # (我们假设 reflection_node 会返回一个 'next_node' 键)
         # (这个键是在 reflection.py 中设置的)
         next_node = state.get("next_node", "continue")  # 默认为 "continue"
-        print(f"--- [Graph Router] 路由决策: {next_node} ---")
+        logger.info("路由决策", extra={"next_node": next_node})
         return next_node
 
     workflow.add_conditional_edges(
@@ -59,10 +82,65 @@ def create_agent_graph():
         },
     )
 
-    # 6. 编译图
-    print("--- [Graph] 编译完成。 ---")
-    return workflow.compile()
+    # 6. 编译图 (有检查点时，每个节点完成后把状态写入检查点，进程崩溃后可以从最后一步继续)
+    logger.info(
+        "编译完成。",
+        extra={"checkpointer": type(checkpointer).__name__ if checkpointer else None},
+    )
+    return workflow.compile(checkpointer=checkpointer or None)
+
+
+def create_persistent_graph(checkpointer=None):
+    """
+    创建一个保存检查点的图 (显式开启持久化)。
+    checkpointer 为 None 时使用 default_checkpointer()
+    (SQLite 文件，路径由 AGENT_CHECKPOINT_DB 指定，设为 "off" 时不保存检查点)。
+    """
+    if checkpointer is None:
+        checkpointer = default_checkpointer()
+        if checkpointer is None:
+            logger.warning("AGENT_CHECKPOINT_DB 已关闭，图不会保存检查点")
+    return create_agent_graph(checkpointer=checkpointer)
+
+
+@lru_cache(maxsize=1)
+def persistent_app():
+    """进程内共享的持久化图 (第一次调用时才创建，导入本模块不会创建数据库)。"""
+    return create_persistent_graph()
+
+
+def thread_config(thread_id: str, recursion_limit: int = 100) -> Dict[str, Any]:
+    """一次运行的 config: thread_id 决定检查点和沙箱会话。"""
+    return {
+        "configurable": {"thread_id": thread_id},
+        "recursion_limit": recursion_limit,
+    }
+
+
+def stream_session(
+    inputs: Optional[dict],
+    thread_id: str,
+    graph=None,
+    recursion_limit: int = 100,
+    **kwargs,
+) -> Iterator[Any]:
+    """
+    像 graph.stream() 一样运行，但如果这个 thread_id 有一个中断的运行
+    (例如进程崩溃)，就从它最后的检查点继续，而不是从头开始。
+    graph 默认为 persistent_app()；传入没有检查点的图时等同于 graph.stream()。
+    """
+    graph = graph or persistent_app()
+    config = thread_config(thread_id, recursion_limit)
+    if graph.checkpointer is not None:
+        snapshot = graph.get_state(config)
+        if snapshot.next:
+            logger.info(
+                "从检查点恢复中断的运行",
+                extra={"thread_id": thread_id, "next": list(snapshot.next)},
+            )
+            inputs = None  # (None = 从最后的检查点继续)
+    return graph.stream(inputs, config=config, **kwargs)
 
 
-# (关键!) 创建一个我们可以从其他地方导入的已编译的 app
+# (关键!) 创建一个我们可以从其他地方导入的已编译的 app (不保存检查点)
 app = create_agent_graph()
@@ -0,0 +1,77 @@
+import time
+import functools
+from typing import Any, Callable
+
+from ..utils.metrics import REGISTRY
+from ..utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# --- Agent 进程内的指标 (通过 REGISTRY.snapshot() 读取) ---
+NODE_LATENCY = REGISTRY.histogram(
+    "agent_node_latency_seconds", "每个图节点的执行耗时 (秒)", ["node"]
+)
+NODE_ERRORS = REGISTRY.counter(
+    "agent_node_errors_total", "图节点抛出的异常次数", ["node"]
+)
+LLM_CALL_LATENCY = REGISTRY.histogram(
+    "agent_llm_call_seconds", "每次 LLM 调用的耗时 (秒)", ["node"]
+)
+LLM_PROMPT_TOKENS = REGISTRY.counter(
+    "agent_llm_prompt_tokens_total", "LLM 提示词 token 数", ["node"]
+)
+LLM_COMPLETION_TOKENS = REGISTRY.counter(
+    "agent_llm_completion_tokens_total", "LLM 生成的 token 数", ["node"]
+)
+
+
+def instrument_node(name: str, fn: Callable[[Any], dict]) -> Callable[[Any], dict]:
+    """
+    包装一个图节点: 记录延迟直方图和异常次数。
+    """
+
+    # (functools.wraps 让 LangGraph 看到原函数的签名:
+    #  需要 config 的节点会收到它，所以这里原样转发额外的参数)
+    @functools.wraps(fn)
+    def wrapper(state, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(state, *args, **kwargs)
+        except Exception:
+            NODE_ERRORS.inc(node=name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            NODE_LATENCY.observe(elapsed, node=name)
+            logger.debug("节点完成", extra={"node": name, "seconds": round(elapsed, 4)})
+
+    return wrapper
+
+
+def _token_usage(response: Any) -> tuple:
+    """
+    从 LLM 响应中提取 (prompt_tokens, completion_tokens)。
+    支持 llama.cpp 的字典响应和 LangChain 的 AIMessage.usage_metadata。
+    """
+    if isinstance(response, dict):
+        usage = response.get("usage") or {}
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    usage = getattr(response, "usage_metadata", None) or {}
+    return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+
+def record_llm_call(node: str, response: Any, seconds: float) -> None:
+    """记录一次 LLM 调用的耗时和 token 数。"""
+    prompt_tokens, completion_tokens = _token_usage(response)
+    LLM_CALL_LATENCY.observe(seconds, node=node)
+    LLM_PROMPT_TOKENS.inc(prompt_tokens, node=node)
+    LLM_COMPLETION_TOKENS.inc(completion_tokens, node=node)
+    logger.info(
+        "LLM 调用完成",
+        extra={
+            "node": node,
+            "seconds": round(seconds, 3),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        },
+    )
@@ -1,9 +1,10 @@
 import os
 import gc
 from dotenv import load_dotenv
-from llama_cpp import Llama
-from langchain_google_genai import ChatGoogleGenerativeAI
 from ..tools.code_tool import PythonCode  # 确保导入我们的工具定义
+from ..utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 # --- 全局设置 ---
 # 加载 .env 文件 (它会读取 LLM_BACKEND, GOOGLE_API_KEY 等)
@@ -28,7 +29,10 @@ def get_llm():
     backend = os.getenv("LLM_BACKEND", "local")  # 默认为 "local"
 
     if backend == "api":
-        print("--- [LLM 引擎] 正在初始化 Google Gemini API ('api' 模式) ---")
+        logger.info("正在初始化 Google Gemini API ('api' 模式)")
+        # (延迟导入: 只安装了其中一个后端的机器，以及离线基准测试，都能导入本模块)
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
         if not os.getenv("GOOGLE_API_KEY"):
             raise EnvironmentError(
                 "LLM_BACKEND='api'，但 GOOGLE_API_KEY 未在 .env 文件中找到。"
@@ -42,11 +46,13 @@ def get_llm():
         )
         # (关键) 将工具绑定到 API LLM
         _llm_instance = llm.bind_tools([PythonCode])
-        print("--- [LLM 引擎] Google Gemini API 已准备就绪 (已绑定工具)。 ---")
+        logger.info("Google Gemini API 已准备就绪 (已绑定工具)。")
         return _llm_instance
 
     elif backend == "local":
-        print(f"--- [LLM 引擎] 正在加载 'DeepAnalyze-8B' ('local' 模式) ---")
+        logger.info("正在加载 'DeepAnalyze-8B' ('local' 模式)")
+        from llama_cpp import Llama
+
         llm = Llama(
             model_path=MODEL_PATH_EXECUTOR,
             n_gpu_layers=GPU_LAYERS_EXECUTOR,
@@ -56,7 +62,7 @@ def get_llm():
         # (注意: llama-cpp-python 不支持 .bind_tools()。
         #  我们必须依赖 code_generator 的提示词来强制它使用工具格式)
         _llm_instance = llm
-        print("--- [LLM 引擎] 本地 8B 模型已加载。 ---")
+        logger.info("本地 8B 模型已加载。")
         return _llm_instance
 
     else:
@@ -69,5 +75,5 @@ def unload_llms():
     """(此函数现在仅在本地模式下有用)"""
     global _llm_instance
     _llm_instance = None
-    print("--- [LLM 引擎] 正在卸载模型... ---")
+    logger.info("正在卸载模型...")
     gc.collect()
@@ -1,14 +1,118 @@
-from langchain_core.messages import ToolMessage, AIMessage
+import os
+from typing import List, Optional
+from langchain_core.messages import ToolMessage, AIMessage, BaseMessage
+from langchain_core.runnables import RunnableConfig
 from ..state import AgentState
-from ...tools.mcp_client import execute_code_in_sandbox
+from ...tools.mcp_client import execute_code_in_sandbox, ensure_sandbox_session
+from ...utils.logger import get_logger
 
+logger = get_logger(__name__)
 
-def code_executor_node(state: AgentState) -> dict:
+# 重放单元格时的执行截止时间 (秒)。重放的可能是很长的训练单元格，
+# 默认的 10 秒截止时间会让它们悄悄失败。
+REPLAY_TIMEOUT = int(os.getenv("AGENT_REPLAY_TIMEOUT", "600"))
+
+
+def _is_error_output(output: str) -> bool:
+    # (与 reflection 节点的判断保持一致)
+    return "[Error]" in output or "[MCP 致命错误]" in output or "Stderr:" in output
+
+
+def _successful_cells(messages: List[BaseMessage]) -> List[str]:
+    """按顺序返回历史中执行成功的代码单元格。"""
+    outputs = {
+        m.tool_call_id: m.content for m in messages if isinstance(m, ToolMessage)
+    }
+    cells = []
+    for message in messages:
+        if isinstance(message, AIMessage) and message.tool_calls:
+            call = message.tool_calls[0]
+            output = outputs.get(call["id"])
+            if output is not None and not _is_error_output(output):
+                cells.append(call["args"]["code_string"])
+    return cells
+
+
+def _replay_cells(session_id: str, messages: List[BaseMessage]) -> None:
+    """
+    内核是新建的 (之前的变量、模型都已丢失): 重放之前成功的单元格来恢复状态。
+    """
+    cells = _successful_cells(messages)
+    if not cells:
+        return
+    logger.info(
+        "沙箱内核是新建的，正在重放之前的单元格",
+        extra={"session_id": session_id, "cells": len(cells)},
+    )
+    for i, code in enumerate(cells):
+        result = execute_code_in_sandbox(
+            code, timeout=REPLAY_TIMEOUT, session_id=session_id, create_session=False
+        )
+        if result.get("session_status") == "missing":
+            # (重放时内核又丢失了: 不能在另一个新内核上继续重放后面的单元格)
+            logger.warning("重放时沙箱内核丢失", extra={"session_id": session_id})
+            break
+        if _is_error_output(result.get("result", "")):
+            # (例如依赖外部状态的单元格；继续执行，让 LLM 在需要时修复)
+            logger.warning(f"重放第 {i + 1} 个单元格失败", extra={"session_id": session_id})
+
+
+def _sandbox_session_id(state: AgentState, config: Optional[RunnableConfig]) -> str:
+    if state.get("sandbox_session_id"):
+        return state["sandbox_session_id"]
+    thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+    return str(thread_id) if thread_id else "default"
+
+
+def _restore_session(session_id: str, messages: List[BaseMessage]) -> Optional[str]:
+    """
+    会话的内核已经丢失 (沙箱服务器重启、内核崩溃、从检查点恢复的运行...):
+    重建内核并重放之前成功的单元格。失败时返回错误信息。
+    """
+    status = ensure_sandbox_session(session_id)
+    if "error" in status:
+        return status["error"]
+    logger.info(
+        "沙箱会话已就绪", extra={"session_id": session_id, "status": status["status"]}
+    )
+    if status["status"] == "created":
+        _replay_cells(session_id, messages)
+    return None
+
+
+def _execute_in_order(code: str, session_id: str, history: List[BaseMessage]) -> dict:
+    """
+    在会话的内核上执行 code，并保证它总是在之前的单元格 *之后* 执行。
+    历史中有需要恢复的单元格时，不允许后端为这次请求新建内核
+    (create_session=False): 内核丢失时后端不执行 (session_status="missing")，
+    这里先重建并重放之前的单元格，再执行当前单元格。
+    """
+    if not _successful_cells(history):
+        # (没有需要恢复的状态: 新内核也可以)
+        return execute_code_in_sandbox(code, session_id=session_id)
+
+    result = execute_code_in_sandbox(code, session_id=session_id, create_session=False)
+    if result.get("session_status") != "missing":
+        return result
+
+    error = _restore_session(session_id, history)
+    if error:
+        return {"result": f"[MCP 致命错误] 无法恢复沙箱会话: {error}"}
+    result = execute_code_in_sandbox(code, session_id=session_id, create_session=False)
+    if result.get("session_status") == "missing":
+        # (重放之后内核又丢失了)
+        return {"result": "[MCP 致命错误] 沙箱内核在恢复之后再次丢失，单元格没有执行。"}
+    return result
+
+
+def code_executor_node(state: AgentState, config: RunnableConfig = None) -> dict:
     """
     CRISP-DM 步骤 3/4: 执行代码
     调用 FastAPI/MCP 服务器来运行代码。
+    每个 LangGraph thread_id 使用自己的沙箱会话 (内核)，所以从检查点恢复的
+    运行会回到同一个内核；内核丢失时先重放之前成功的单元格，再执行当前单元格。
     """
-    print("--- [节点 3: 代码执行器] ---")
+    logger.info("[节点 3: 代码执行器]")
 
     # 1. 从状态中获取最后一条 AI 消息（即代码）
     last_message = state["messages"][-1]
@@ -42,12 +146,30 @@ def code_executor_node(state: AgentState) -> dict:
     code_to_run = last_message.tool_calls[0]["args"]["code_string"]
     # --- ⬆️ 修复结束 ⬆️ ---
 
-    # 3. (关键) 调用我们的 MCP 客户端
-    result_dict = execute_code_in_sandbox(code_to_run)
-
+    # 3. (关键) 调用我们的 MCP 客户端 (在这个线程自己的沙箱会话中)
+    session_id = _sandbox_session_id(state, config)
+    result_dict = _execute_in_order(code_to_run, session_id, state["messages"][:-1])
     result_string = result_dict.get("result", "没有收到来自沙箱的输出。")
 
-    print(f"代码执行结果 (前 200 字符):\n{result_string[:200]}...")
+    logger.info("代码执行完成", extra={"output_chars": len(result_string)})
+    logger.debug(f"代码执行结果 (前 200 字符):\n{result_string[:200]}...")
 
     # 4. (关键) 返回带有 *正确* tool_call_id 的 ToolMessage
-    return {"messages": [ToolMessage(content=result_string, tool_call_id=tool_call_id)]}
+    updates = {
+        "messages": [ToolMessage(content=result_string, tool_call_id=tool_call_id)],
+        "sandbox_session_id": session_id,
+    }
+
+    # 5. 合并沙箱发布的结构化字段 (不需要 LLM 再解析文本)
+    new_metrics = result_dict.get("evaluation_metrics") or {}
+    if new_metrics:
+        metrics = dict(state.get("evaluation_metrics") or {})
+        metrics.update(new_metrics)
+        updates["evaluation_metrics"] = metrics
+        logger.info("收到结构化指标", extra={"metrics": new_metrics})
+
+    for report_key in ("xai_report", "compliance_report"):
+        if result_dict.get(report_key):
+            updates[report_key] = result_dict[report_key]
+
+    return updates
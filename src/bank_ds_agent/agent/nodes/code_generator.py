@@ -3,9 +3,14 @@ import re
 import json
 import time  # <-- 导入 time
 import os  # <-- 导入 os
+import logging
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from ..state import AgentState
 from ..llms import get_llm
+from ..instrumentation import record_llm_call
+from ...utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 CODE_GENERATOR_SYSTEM_PROMPT = """
 你是一个专业的 Python 数据科学家。
@@ -14,9 +19,28 @@ CODE_GENERATOR_SYSTEM_PROMPT = """
 
 规则:
 1.  **必须**使用 'PythonCode' 工具来提交你的代码。
-2.  你只能访问 (pandas, sklearn, matplotlib, shap, fairlearn, dill)。
+2.  你只能访问 (pandas, pyarrow, sklearn, matplotlib, shap, fairlearn, dill)。
 3.  **不要**做任何 `pip install` 操作。
 4.  你的代码应该是 *有状态的*。你可以假设在 /app/session.dill 中保存了之前的变量。
+5.  评估指标和报告**必须**通过沙箱辅助库发布 (不要只是 print 它们):
+    from agent_sandbox import publish_metrics, publish_xai_report, publish_compliance_report
+    publish_metrics({"accuracy": 0.9, "f1_score": 0.88})
+6.  已注册的数据集以只读方式挂载在沙箱中，**不要**自己去读 CSV:
+    from agent_sandbox.datasets import list_datasets, load_dataframe
+    df = load_dataframe("数据集名称", columns=[...])  # memory-map，几乎不占内存
+7.  沙箱内存有限。处理大表 (交易/刷卡流水) 时**必须**使用大数据辅助函数，
+    不要用默认 dtype 一次性载入全表:
+    from agent_sandbox.bigdata import (
+        optimize_dtypes,     # 数值向下转换 + 低基数字符串转 category
+        iter_chunks,         # 分块/流式读取 (数据集名称 / Parquet / CSV)
+        read_optimized,      # 分块读取并压缩 dtype 后拼接
+        chunked_groupby,     # 核外分组聚合 (sum/count/min/max/mean/size)
+        stratified_sample,   # 按目标列分层抽样，用于模型原型
+    )
+8.  可解释性分析**不要**直接调用 shap.Explainer，使用带缓存的解释服务
+    (自动选择解释器并发布到 xai_report):
+    from agent_sandbox.explain import explain
+    result = explain(model, X_test)  # result["top_features"], result["shap_values"]
 """
 
 
@@ -33,28 +57,35 @@ def code_generator_node(state: AgentState) -> dict:
     CRISP-DM 步骤 3/4: 数据准备/模型构建
     调用 LLM 来生成一个 *工具调用* (Tool Call)。
     """
-    print("--- [节点 2: 代码生成器] ---")
+    logger.info("[节点 2: 代码生成器]")
 
     llm = get_llm()
 
     messages_for_prompt = [SystemMessage(content=CODE_GENERATOR_SYSTEM_PROMPT)]
     prompt = f"业务目标: {state['business_objective']}\n\n"
+    if state.get("data_summary"):
+        # (数据画像已经预先计算好，不需要再 df.info() / df.describe())
+        prompt += f"--- 数据集画像 ---\n{state['data_summary']}\n\n"
     prompt += "根据这个目标和下面的历史记录，为下一步调用 PythonCode 工具：\n"
     prompt += "--- 历史记录 ---\n"
     for msg in state["messages"][-5:]:
         prompt += f"{msg.type}: {msg.content}\n"
     messages_for_prompt.append(HumanMessage(content=prompt))
 
-    print(f"正在调用 '{os.getenv('LLM_BACKEND')}' LLM (以获取工具调用)...")
+    logger.info(
+        "正在调用 LLM (以获取工具调用)...", extra={"backend": os.getenv("LLM_BACKEND")}
+    )
 
     tool_call_id = None
     response_message = None
 
     if hasattr(llm, "invoke"):
         # --- 这是 LangChain (API) 的方式 ---
+        start = time.perf_counter()
         response_message = llm.invoke(messages_for_prompt)
+        record_llm_call("code_generator", response_message, time.perf_counter() - start)
         if not response_message.tool_calls:
-            print("!! 错误: (API) LLM 未返回工具调用，返回了一个普通消息。")
+            logger.error("(API) LLM 未返回工具调用，返回了一个普通消息。")
             return {"messages": [response_message]}
         tool_call = response_message.tool_calls[0]
         code_string = tool_call["args"]["code_string"]
@@ -69,13 +100,15 @@ def code_generator_node(state: AgentState) -> dict:
             elif msg.type == "system":
                 messages_as_dicts.append({"role": "system", "content": msg.content})
 
+        start = time.perf_counter()
         response = llm.create_chat_completion(
             messages=messages_as_dicts, temperature=0.0
         )
+        record_llm_call("code_generator", response, time.perf_counter() - start)
         response_content = response["choices"][0]["message"]["content"].strip()
 
         try:
-            print(f"Llama.cpp 原始输出: {response_content}")
+            logger.debug(f"Llama.cpp 原始输出: {response_content}")
             code_string = _parse_code_block(response_content)
             tool_call_id = f"local_tool_call_{int(time.time())}"
             response_message = AIMessage(
@@ -92,11 +125,12 @@ def code_generator_node(state: AgentState) -> dict:
                 raise ValueError("Llama.cpp 未返回代码块。")
 
         except Exception as e:
-            print(f"!! 错误: (Local) LLM 未返回可解析的代码。错误: {e}")
+            logger.error(f"(Local) LLM 未返回可解析的代码。错误: {e}")
             return {"messages": [AIMessage(content=f"错误: {e}")]}
         # --- ⬆️ 修复结束 ⬆️ ---
 
-    print(f"生成的代码:\n{code_string[:200]}...")
-    print(f"生成的 Tool Call ID: {tool_call_id}")
+    logger.info("代码已生成", extra={"tool_call_id": tool_call_id})
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"生成的代码:\n{code_string}")
 
     return {"messages": [response_message], "current_tool_call_id": tool_call_id}
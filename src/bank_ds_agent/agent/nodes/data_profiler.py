@@ -0,0 +1,36 @@
+from ..state import AgentState
+from ...tools.mcp_client import fetch_dataset_profile
+from ...utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def data_profiler_node(state: AgentState) -> dict:
+    """
+    CRISP-DM 步骤 2: 数据理解
+    在编码之前，把已注册数据集的画像 (列类型、缺失率、基数、分位数、
+    目标分布) 注入 'data_summary'。
+    这样 LLM 就不需要在前几轮里反复试探 df.info() / df.describe()。
+    """
+    logger.info("[节点 1.5: 数据画像]")
+
+    dataset_name = state.get("dataset_name")
+    if not dataset_name:
+        logger.info("没有指定数据集，跳过画像。")
+        return {}
+
+    if state.get("data_summary"):
+        # (例如从检查点恢复时，画像已经存在)
+        logger.info("data_summary 已存在，跳过画像。")
+        return {}
+
+    result = fetch_dataset_profile(dataset_name, state.get("target_column"))
+    if "error" in result:
+        # (画像只是一个优化，失败时不应阻塞 Agent)
+        logger.warning(f"无法获取数据集画像: {result['error']}")
+        return {}
+
+    summary = result["summary"]
+    logger.info("数据集画像已注入", extra={"dataset": dataset_name})
+    logger.debug(f"数据集画像:\n{summary}")
+    return {"data_summary": summary}
@@ -1,7 +1,12 @@
 import os
+import time
 from langchain_core.messages import SystemMessage, HumanMessage
 from ..state import AgentState
 from ..llms import get_llm, unload_llms
+from ..instrumentation import record_llm_call
+from ...utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 # --- ⬇️ 适用于 8B 模型的“更简单”的提示词 ⬇️ ---
 PLANNER_SYSTEM_PROMPT = """
@@ -18,7 +23,7 @@ PLANNER_SYSTEM_PROMPT = """
 
 
 def planner_node(state: AgentState) -> dict:
-    print("--- [节点 1: 规划师] ---")
+    logger.info("[节点 1: 规划师]")
 
     llm = get_llm()
     prompt = PLANNER_SYSTEM_PROMPT.format(task=state["task"])
@@ -28,8 +33,9 @@ def planner_node(state: AgentState) -> dict:
         HumanMessage(content=prompt)
     ]
 
-    print(f"正在调用 '{os.getenv('LLM_BACKEND')}' LLM 进行规划...")
+    logger.info("正在调用 LLM 进行规划...", extra={"backend": os.getenv("LLM_BACKEND")})
 
+    start = time.perf_counter()
     if hasattr(llm, "invoke"):
         # --- 这是 LangChain (API) 的方式 ---
         response = llm.invoke(messages)
@@ -50,7 +56,9 @@ def planner_node(state: AgentState) -> dict:
         business_objective = response["choices"][0]["message"]["content"].strip()
         # --- ⬆️ 修复结束 ⬆️ ---
 
-    print(f"提炼的目标: {business_objective}")
+    record_llm_call("planner", response, time.perf_counter() - start)
+
+    logger.info(f"提炼的目标: {business_objective}")
 
     return {
         "business_objective": business_objective,
@@ -1,7 +1,12 @@
 from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage
 from ..state import AgentState
 from ..llms import get_llm
+from ..instrumentation import record_llm_call
+from ...utils.logger import get_logger
 import os  # <-- 确保导入 os
+import time
+
+logger = get_logger(__name__)
 
 # --- ⬇️ 适用于 8B 模型的“更简单”的提示词 ⬇️ ---
 REFLECTION_SYSTEM_PROMPT = """
@@ -24,11 +29,11 @@ def reflection_node(state: AgentState) -> dict:
     CRISP-DM 步骤 5: 评估
     评估上一步代码执行的结果，并决定下一步的路由。
     """
-    print("--- [节点 4: 反思] ---")
+    logger.info("[节点 4: 反思]")
 
     # (安全网: 如果规划师失败了，就直接结束循环)
     if not state.get("business_objective") or state["business_objective"].strip() == "":
-        print("!! 警告: 业务目标为空。强制结束循环。")
+        logger.warning("业务目标为空。强制结束循环。")
         return {"next_node": "complete"}  # <-- 修复 1 (将更新状态)
 
     last_message = state["messages"][-1]
@@ -42,7 +47,7 @@ def reflection_node(state: AgentState) -> dict:
         or "[MCP 致命错误]" in tool_output
         or "Stderr:" in tool_output
     ):
-        print("检测到代码执行错误。")
+        logger.info("检测到代码执行错误。")
         return {
             "messages": [
                 HumanMessage(
@@ -54,7 +59,10 @@ def reflection_node(state: AgentState) -> dict:
 
     llm = get_llm()
 
-    print(f"代码执行成功。正在调用 '{os.getenv('LLM_BACKEND')}' LLM 进行评估...")
+    logger.info(
+        "代码执行成功。正在调用 LLM 进行评估...",
+        extra={"backend": os.getenv("LLM_BACKEND")},
+    )
 
     prompt = REFLECTION_SYSTEM_PROMPT.format(
         objective=state["business_objective"], output=tool_output
@@ -63,6 +71,7 @@ def reflection_node(state: AgentState) -> dict:
     messages = [HumanMessage(content=prompt)]
 
     decision = ""
+    start = time.perf_counter()
     if hasattr(llm, "invoke"):
         # --- 这是 LangChain (API) 的方式 ---
         response = llm.invoke(messages)
@@ -90,16 +99,18 @@ def reflection_node(state: AgentState) -> dict:
         )
         decision = response["choices"][0]["message"]["content"].strip()
 
+    record_llm_call("reflection", response, time.perf_counter() - start)
+
     decision = decision.strip().lower()
-    print(f"“{os.getenv('LLM_BACKEND')}”的决定是: {decision}")
+    logger.info("LLM 的决定", extra={"decision": decision})
 
     # --- ⬇️ 这是关键修复 ⬇️ ---
     # 我们返回一个字典，LangGraph 会自动用它来更新 AgentState
     if "complete" in decision:
-        print("--- [反思] 决策：任务已完成。---")
+        logger.info("决策：任务已完成。")
         return {"next_node": "complete"}
 
     # 否则 (如果它说 "continue" 或任何其他垃圾信息)，我们就继续
-    print("--- [反思] 决策：任务继续。---")
+    logger.info("决策：任务继续。")
     return {"next_node": "continue"}
     # --- ⬆️ 修复结束 ⬆️ ---
@@ -32,7 +32,9 @@ class AgentState(TypedDict):
 
     # --- CRISP-DM 阶段 2 & 3：数据理解与准备 ---
     # (注意：我们不再需要 dataset_path，因为沙箱会自己管理)
-    data_summary: str  # 'df.info()' 和 'df.describe()' 的摘要
+    dataset_name: Optional[str]  # 在 DatasetRegistry 中注册的数据集名称
+    target_column: Optional[str]  # 目标变量 (例如 "default")，用于计算类别分布
+    data_summary: str  # 数据集画像 (由 data_profiler 节点在编码之前填充)
 
     # --- CRISP-DM 阶段 4：模型构建 ---
     # (我们也不再需要 model_path)
@@ -49,3 +51,8 @@ class AgentState(TypedDict):
     # 一个临时字段，用于在 reflection 和 router 之间传递决策
     next_node: Optional[str]
     # --- ⬆️ 修复结束 ⬆️ ---
+
+    # --- 沙箱会话 ---
+    # code_executor 使用的沙箱内核 (默认等于 LangGraph 的 thread_id)。
+    # 它随检查点一起保存，从检查点恢复的运行会回到同一个内核。
+    sandbox_session_id: Optional[str]
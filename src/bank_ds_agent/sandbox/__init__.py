@@ -0,0 +1,7 @@
+# 沙箱端辅助库 (在 Docker 镜像中以 'agent_sandbox' 包的形式安装)
+from .reporting import (
+    AGENT_REPORT_MIME_TYPE,
+    publish_metrics,
+    publish_xai_report,
+    publish_compliance_report,
+)
@@ -0,0 +1,304 @@
+import os
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Union
+
+if TYPE_CHECKING:  # (pandas 只在函数内按需导入)
+    import pandas as pd
+
+# ----------------------------------------------------------------------
+# 沙箱端 (内核内) 的大数据辅助函数
+#
+# 银行的交易/刷卡流水表很容易超出沙箱内存。这里提供:
+#   - optimize_dtypes:     自动向下转换数值类型 + 低基数字符串转 category
+#   - iter_chunks:         分块/流式读取 (CSV / Parquet / 已注册数据集)
+#   - read_optimized:      分块读取并逐块压缩，再拼接成一个 DataFrame
+#   - chunked_groupby:     核外 (out-of-core) 分组聚合
+#   - stratified_sample:   分层抽样，用于模型原型
+# 每个函数都会打印它节省了多少内存。
+#
+#     from agent_sandbox.bigdata import read_optimized, chunked_groupby
+# ----------------------------------------------------------------------
+
+DEFAULT_CHUNKSIZE = 200_000
+
+# 可以按块计算、再合并的聚合函数
+_COMBINABLE_AGGS = ("sum", "count", "min", "max", "mean", "size")
+
+Source = Union[str, "pd.DataFrame"]
+
+
+def memory_mb(df) -> float:
+    """DataFrame 的真实内存占用 (MB，包含 object 列的字符串)。"""
+    return df.memory_usage(deep=True).sum() / 1024**2
+
+
+def _report(label: str, before_mb: float, after_mb: float) -> Dict[str, float]:
+    saved = before_mb - after_mb
+    ratio = (saved / before_mb) if before_mb else 0.0
+    print(
+        f"[内存] {label}: {before_mb:.1f} MB -> {after_mb:.1f} MB "
+        f"(节省 {saved:.1f} MB, {ratio:.0%})"
+    )
+    return {"before_mb": before_mb, "after_mb": after_mb, "saved_mb": saved}
+
+
+def _downcast(df, categorical_threshold: float):
+    import pandas as pd
+
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            if series.isna().any():
+                continue
+            kind = "unsigned" if len(series) and series.min() >= 0 else "integer"
+            df[column] = pd.to_numeric(series, downcast=kind)
+        elif pd.api.types.is_float_dtype(series):
+            df[column] = pd.to_numeric(series, downcast="float")
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(
+            series
+        ):
+            if len(series) and series.nunique(dropna=True) / len(series) <= (
+                categorical_threshold
+            ):
+                df[column] = series.astype("category")
+    return df
+
+
+def optimize_dtypes(df, categorical_threshold: float = 0.5, inplace: bool = False):
+    """
+    向下转换数值列 (int64 -> int8/16/32, float64 -> float32)，
+    并把低基数 (唯一值比例 <= categorical_threshold) 的字符串列转为 category。
+    """
+    before = memory_mb(df)
+    if not inplace:
+        df = df.copy()
+    df = _downcast(df, categorical_threshold)
+    _report("optimize_dtypes", before, memory_mb(df))
+    return df
+
+
+def _registered_dataset_path(name: str) -> Optional[str]:
+    from .datasets import dataset_path
+
+    try:
+        return dataset_path(name)
+    except KeyError:
+        return None
+
+
+def iter_chunks(
+    source: str,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    columns: Optional[List[str]] = None,
+    optimize: bool = True,
+    categorical_threshold: float = 0.5,
+    **read_csv_kwargs: Any,
+) -> Iterator["pd.DataFrame"]:
+    """
+    逐块读取数据源，每块都是一个 (可选地已压缩的) DataFrame。
+    source 可以是已注册数据集的名称、Parquet 文件或 CSV 文件。
+    """
+    import pandas as pd
+
+    dataset_file = None if os.path.exists(source) else _registered_dataset_path(source)
+    if dataset_file is not None:
+        from .datasets import load_table
+
+        # (memory-map 的表: 只有当前块会被物化为 pandas)
+        chunks = (
+            batch.to_pandas()
+            for batch in load_table(source, columns=columns).to_batches(chunksize)
+        )
+    elif source.lower().endswith((".parquet", ".pq")):
+        import pyarrow.parquet as pq
+
+        chunks = (
+            batch.to_pandas()
+            for batch in pq.ParquetFile(source).iter_batches(
+                batch_size=chunksize, columns=columns
+            )
+        )
+    else:
+        chunks = pd.read_csv(
+            source, chunksize=chunksize, usecols=columns, **read_csv_kwargs
+        )
+
+    for chunk in chunks:
+        if optimize:
+            chunk = _downcast(chunk, categorical_threshold)
+        yield chunk
+
+
+def _concat_chunks(chunks: List["pd.DataFrame"]):
+    import pandas as pd
+    from pandas.api.types import union_categoricals
+
+    if not chunks:
+        return pd.DataFrame()
+    # (关键) 各块的 category 取值可能不同，直接 concat 会退化成 object
+    for column in chunks[0].columns:
+        if all(isinstance(c[column].dtype, pd.CategoricalDtype) for c in chunks):
+            categories = union_categoricals(
+                [c[column] for c in chunks], ignore_order=True
+            ).categories
+            for c in chunks:
+                c[column] = c[column].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def read_optimized(
+    source: str,
+    columns: Optional[List[str]] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    categorical_threshold: float = 0.5,
+    **read_csv_kwargs: Any,
+):
+    """
+    分块读取并逐块压缩 dtype，然后拼接。
+    峰值内存约等于“压缩后的全表 + 一个未压缩的块”，而不是未压缩的全表。
+    """
+    before = 0.0
+    chunks = []
+    for chunk in iter_chunks(
+        source, chunksize=chunksize, columns=columns, optimize=False, **read_csv_kwargs
+    ):
+        before += memory_mb(chunk)
+        chunks.append(_downcast(chunk, categorical_threshold))
+    df = _concat_chunks(chunks)
+    _report(f"read_optimized('{source}')", before, memory_mb(df))
+    return df
+
+
+def chunked_groupby(
+    source: Source,
+    by: Union[str, List[str]],
+    agg: Dict[str, Union[str, List[str]]],
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    **read_csv_kwargs: Any,
+):
+    """
+    核外分组聚合: 每块先做部分聚合，最后再合并。
+    支持的聚合函数: sum, count, min, max, mean, size。
+
+        chunked_groupby("transactions", by="customer_id",
+                        agg={"amount": ["sum", "mean"], "txn_id": "count"})
+    """
+    import pandas as pd
+
+    keys = [by] if isinstance(by, str) else list(by)
+    wanted = {col: [f] if isinstance(f, str) else list(f) for col, f in agg.items()}
+    for funcs in wanted.values():
+        for func in funcs:
+            if func not in _COMBINABLE_AGGS:
+                raise ValueError(
+                    f"不支持按块合并的聚合函数: '{func}'。可选: {_COMBINABLE_AGGS}"
+                )
+
+    # 每块计算的部分聚合 (mean 拆成 sum + count)
+    partial_spec: Dict[str, set] = {}
+    for col, funcs in wanted.items():
+        for func in funcs:
+            if func == "mean":
+                partial_spec.setdefault(col, set()).update(("sum", "count"))
+            elif func == "size":
+                partial_spec.setdefault(col, set()).add("size")
+            else:
+                partial_spec.setdefault(col, set()).add(func)
+
+    if isinstance(source, pd.DataFrame):
+        chunks = (
+            source.iloc[i : i + chunksize] for i in range(0, len(source), chunksize)
+        )
+    else:
+        columns = list(dict.fromkeys(keys + list(wanted)))
+        chunks = iter_chunks(
+            source, chunksize=chunksize, columns=columns, **read_csv_kwargs
+        )
+
+    partials = []
+    scanned_mb = 0.0
+    peak_chunk_mb = 0.0
+    for chunk in chunks:
+        chunk_mb = memory_mb(chunk)
+        scanned_mb += chunk_mb
+        peak_chunk_mb = max(peak_chunk_mb, chunk_mb)
+        grouped = chunk.groupby(keys, observed=True, sort=False)
+        part = grouped.agg({col: sorted(funcs) for col, funcs in partial_spec.items()})
+        partials.append(part)
+
+    if not partials:
+        return pd.DataFrame()
+
+    stacked = pd.concat(partials)
+    combine = {"sum": "sum", "count": "sum", "size": "sum", "min": "min", "max": "max"}
+    merged = stacked.groupby(level=list(range(len(keys))), sort=True).agg(
+        {column: combine[column[1]] for column in stacked.columns}
+    )
+
+    result = pd.DataFrame(index=merged.index)
+    for col, funcs in wanted.items():
+        for func in funcs:
+            name = f"{col}_{func}"
+            if func == "mean":
+                result[name] = merged[(col, "sum")] / merged[(col, "count")]
+            else:
+                result[name] = merged[(col, func)]
+
+    _report(
+        "chunked_groupby (全表加载 vs 单块峰值)",
+        scanned_mb,
+        peak_chunk_mb + memory_mb(stacked),
+    )
+    return result.reset_index()
+
+
+def stratified_sample(
+    source: Source,
+    target: str,
+    n: Optional[int] = None,
+    frac: Optional[float] = None,
+    random_state: int = 0,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    **read_csv_kwargs: Any,
+):
+    """
+    按目标列分层抽样 (保持类别比例)，用于快速做模型原型。
+    source 可以是 DataFrame，也可以是数据源 (此时按块流式抽样，不会载入全表)。
+    """
+    import pandas as pd
+
+    if (n is None) == (frac is None):
+        raise ValueError("必须且只能指定 n 或 frac 之一。")
+
+    if isinstance(source, pd.DataFrame):
+        total = len(source)
+        fraction = frac if frac is not None else min(1.0, n / max(total, 1))
+        sample = source.groupby(target, observed=True, group_keys=False).sample(
+            frac=fraction, random_state=random_state
+        )
+        _report("stratified_sample", memory_mb(source), memory_mb(sample))
+        return sample
+
+    if frac is None:
+        # 第一遍: 只读目标列来计数，得到抽样比例
+        counts = chunked_groupby(
+            source, by=target, agg={target: "size"}, chunksize=chunksize, **read_csv_kwargs
+        )
+        total = int(counts[f"{target}_size"].sum())
+        frac = min(1.0, n / max(total, 1))
+
+    scanned_mb = 0.0
+    parts = []
+    for i, chunk in enumerate(
+        iter_chunks(source, chunksize=chunksize, **read_csv_kwargs)
+    ):
+        scanned_mb += memory_mb(chunk)
+        parts.append(
+            chunk.groupby(target, observed=True, group_keys=False).sample(
+                frac=frac, random_state=random_state + i
+            )
+        )
+    sample = _concat_chunks(parts)
+    _report("stratified_sample (全表 vs 样本)", scanned_mb, memory_mb(sample))
+    return sample
@@ -0,0 +1,76 @@
+import os
+import json
+from typing import Any, Dict, List, Optional
+
+# ----------------------------------------------------------------------
+# 沙箱端 (内核内) 的数据集加载器
+#
+# 宿主机端的 DatasetRegistry 把注册的数据集转换为未压缩的 Arrow IPC 文件，
+# 并以只读方式挂载到 /data。这里通过 memory-map 打开它们：
+# 数据页由操作系统的页缓存共享，不会在每个内核里各复制一份。
+#
+#     from agent_sandbox.datasets import list_datasets, load_dataframe
+#     df = load_dataframe("credit_customers", columns=["age", "income", "default"])
+# ----------------------------------------------------------------------
+
+DATASETS_DIR = os.environ.get("AGENT_DATASETS_DIR", "/data")
+MANIFEST_FILENAME = "registry.json"
+
+
+def _manifest() -> Dict[str, Dict[str, Any]]:
+    path = os.path.join(DATASETS_DIR, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_datasets() -> List[Dict[str, Any]]:
+    """
+    列出所有可用的数据集 (名称、行数、列类型)。
+    """
+    return [
+        {"name": e["name"], "num_rows": e["num_rows"], "columns": e["columns"]}
+        for e in _manifest().values()
+    ]
+
+
+def dataset_path(name: str) -> str:
+    entry = _manifest().get(name)
+    if entry is None:
+        raise KeyError(
+            f"数据集未注册: '{name}'。可用的数据集: {sorted(_manifest())}"
+        )
+    return os.path.join(DATASETS_DIR, entry["file"])
+
+
+def load_table(name: str, columns: Optional[List[str]] = None):
+    """
+    以零拷贝的方式 memory-map 一个数据集，返回 pyarrow.Table。
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+
+    source = pa.memory_map(dataset_path(name), "r")
+    table = pa_ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+
+def load_dataframe(
+    name: str, columns: Optional[List[str]] = None, arrow_dtypes: bool = True
+):
+    """
+    加载一个数据集为 pandas DataFrame。
+
+    arrow_dtypes=True (默认) 时，列使用 pd.ArrowDtype，
+    数据仍然由 memory-map 支撑，几乎不增加内核的 RSS。
+    arrow_dtypes=False 时，转换为经典的 numpy dtype (会复制数据)。
+    """
+    import pandas as pd
+
+    table = load_table(name, columns=columns)
+    if arrow_dtypes:
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    return table.to_pandas()
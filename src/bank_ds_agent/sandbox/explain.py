@@ -0,0 +1,204 @@
+import time
+from typing import Any, Dict, Optional
+
+# ----------------------------------------------------------------------
+# 沙箱端 (内核内) 的 SHAP 解释服务
+#
+# 在完整的信用风险测试集上直接调用 shap.Explainer 往往是整个流程中最慢的一步。
+# explain() 会:
+#   1. 自动选择最快的解释器 (Tree > Linear > Kernel)
+#   2. 压缩背景数据 (Kernel 用 k-means，Linear 用随机样本)
+#   3. 分批并行计算
+#   4. 按 (模型指纹, 数据指纹, 参数) 缓存 SHAP 值，同一会话中重复请求几乎是瞬时的
+#      (摘要每次根据 top_k 重新生成，所以不同的 top_k 可以共用同一份 SHAP 值)
+# 并返回一个紧凑的摘要 (默认同时发布到 AgentState.xai_report)。
+#
+#     from agent_sandbox.explain import explain
+#     result = explain(model, X_test)
+# ----------------------------------------------------------------------
+
+# 内核内的缓存: {缓存键: {"explainer", "n_rows", "shap_values", "columns"}}
+_CACHE: Dict[str, Dict[str, Any]] = {}
+_CACHE_STATS = {"hits": 0, "misses": 0}
+
+_LINEAR_MODULES = ("sklearn.linear_model",)
+
+
+def _fingerprint(obj: Any) -> str:
+    import joblib
+
+    return joblib.hash(obj)
+
+
+def _select_explainer(model: Any, X, max_background: int, seed: int) -> tuple:
+    """
+    返回 (解释器名称, 解释器)。按速度从快到慢尝试，
+    并且只为需要背景数据的解释器压缩背景。
+    """
+    import shap
+
+    try:
+        # (最快) 基于树的模型: 精确且不需要背景数据
+        return "tree", shap.TreeExplainer(model)
+    except Exception:
+        pass
+
+    if type(model).__module__.startswith(_LINEAR_MODULES):
+        try:
+            background = X
+            if len(X) > max_background:
+                background = X.sample(n=max_background, random_state=seed)
+            return "linear", shap.LinearExplainer(model, background)
+        except Exception:
+            pass
+
+    # (最慢) 模型无关的 KernelExplainer:
+    # 耗时与背景大小成正比，所以用 k-means 把背景压缩为 max_background 个中心
+    background = X if len(X) <= max_background else shap.kmeans(X, max_background)
+    predict = getattr(model, "predict_proba", None) or model.predict
+    return "kernel", shap.KernelExplainer(predict, background)
+
+
+def _positive_class(values):
+    """分类器的 SHAP 值可能是 list 或 (n, f, classes)，统一取最后一个类别。"""
+    import numpy as np
+
+    if isinstance(values, list):
+        values = values[-1]
+    values = np.asarray(values)
+    if values.ndim == 3:
+        values = values[..., -1]
+    return values
+
+
+def _compute_batch(explainer, batch, kind: str, nsamples: Any):
+    if kind == "kernel":
+        return _positive_class(
+            explainer.shap_values(batch, nsamples=nsamples, silent=True)
+        )
+    return _positive_class(explainer.shap_values(batch))
+
+
+def _summarize(kind: str, shap_values, columns, top_k: int) -> tuple:
+    """返回 (top_features, summary): 按平均 |SHAP| 排序的前 top_k 个特征。"""
+    import numpy as np
+
+    importance = np.abs(shap_values).mean(axis=0)
+    order = np.argsort(importance)[::-1][:top_k]
+    top_features = [
+        {"feature": str(columns[i]), "mean_abs_shap": float(importance[i])}
+        for i in order
+    ]
+    lines = [
+        f"SHAP ({kind} explainer, {len(shap_values)} 行): "
+        f"前 {len(top_features)} 个重要特征 (平均 |SHAP|):"
+    ]
+    lines += [
+        f"{rank}. {item['feature']}: {item['mean_abs_shap']:.4g}"
+        for rank, item in enumerate(top_features, start=1)
+    ]
+    return top_features, "\n".join(lines)
+
+
+def _result(cached: Dict[str, Any], top_k: int, publish: bool) -> Dict[str, Any]:
+    """由缓存的 SHAP 值生成返回值 (shap_values 是副本，调用方修改它不会污染缓存)。"""
+    top_features, summary = _summarize(
+        cached["explainer"], cached["shap_values"], cached["columns"], top_k
+    )
+    if publish:
+        from .reporting import publish_xai_report
+
+        publish_xai_report(summary)
+    return {
+        "explainer": cached["explainer"],
+        "n_rows": cached["n_rows"],
+        "shap_values": cached["shap_values"].copy(),
+        "columns": list(cached["columns"]),
+        "top_features": top_features,
+        "summary": summary,
+    }
+
+
+def explain(
+    model: Any,
+    X,
+    max_rows: Optional[int] = 2000,
+    max_background: int = 50,
+    batch_size: int = 256,
+    n_jobs: int = -1,
+    nsamples: Any = "auto",
+    top_k: int = 10,
+    random_state: int = 0,
+    publish: bool = True,
+) -> Dict[str, Any]:
+    """
+    计算 SHAP 值并返回紧凑的摘要。
+
+    返回: {"explainer", "n_rows", "shap_values", "columns",
+           "top_features", "summary", "cached", "seconds"}
+    max_rows: 超过这个行数时，只解释一个随机样本 (None = 全部行)。
+    """
+    import numpy as np
+    import pandas as pd
+    from joblib import Parallel, delayed
+
+    start_time = time.time()
+    if not isinstance(X, pd.DataFrame):
+        X = pd.DataFrame(X)
+    if max_rows is not None and len(X) > max_rows:
+        X = X.sample(n=max_rows, random_state=random_state)
+
+    cache_key = _fingerprint(
+        (
+            _fingerprint(model),
+            _fingerprint(X),
+            max_background,
+            nsamples,
+            random_state,
+        )
+    )
+    cached = _CACHE.get(cache_key)
+    if cached is not None:
+        _CACHE_STATS["hits"] += 1
+        print(f"[SHAP] 缓存命中 ({cached['explainer']}, {cached['n_rows']} 行)。")
+        result = _result(cached, top_k, publish)
+        return dict(result, cached=True, seconds=time.time() - start_time)
+    _CACHE_STATS["misses"] += 1
+
+    # 1. 选择最快的解释器 (以及压缩后的背景数据)
+    kind, explainer = _select_explainer(model, X, max_background, random_state)
+
+    # 2. 分批并行计算 (Kernel 是纯 Python，用进程；Tree/Linear 用线程即可)
+    batches = [X.iloc[i : i + batch_size] for i in range(0, len(X), batch_size)]
+    if len(batches) == 1:
+        parts = [_compute_batch(explainer, batches[0], kind, nsamples)]
+    else:
+        parts = Parallel(
+            n_jobs=n_jobs, prefer="processes" if kind == "kernel" else "threads"
+        )(delayed(_compute_batch)(explainer, b, kind, nsamples) for b in batches)
+    shap_values = np.vstack(parts)
+
+    # 3. 缓存 SHAP 值 (紧凑摘要按 top_k 在 _result 中生成)
+    cached = {
+        "explainer": kind,
+        "n_rows": len(X),
+        "shap_values": shap_values,
+        "columns": list(X.columns),
+    }
+    _CACHE[cache_key] = cached
+    print(
+        f"[SHAP] 计算完成 ({kind}, {len(X)} 行)，"
+        f"耗时 {time.time() - start_time:.2f} 秒。"
+    )
+
+    result = _result(cached, top_k, publish)
+    return dict(result, cached=False, seconds=time.time() - start_time)
+
+
+def cache_info() -> Dict[str, int]:
+    """SHAP 缓存的命中统计。"""
+    return dict(_CACHE_STATS, entries=len(_CACHE))
+
+
+def clear_cache() -> None:
+    _CACHE.clear()
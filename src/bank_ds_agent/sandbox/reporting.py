@@ -0,0 +1,83 @@
+import json
+import math
+from typing import Any, Dict
+
+# ----------------------------------------------------------------------
+# 沙箱端 (内核内) 的结构化结果通道
+#
+# 这个文件会被 Dockerfile.agent 复制到镜像中 (作为 'agent_sandbox' 包)，
+# 生成的代码可以这样调用:
+#     from agent_sandbox.reporting import publish_metrics
+#     publish_metrics({"auc": 0.91, "f1_score": 0.78})
+#
+# 结果通过 'display_data' 以自定义 MIME 类型发布，
+# 宿主机端的 SandboxJupyterExecutor 会直接解析它，无需 LLM 再读一遍文本。
+# (注意: 本文件在顶层只能导入标准库，因为宿主机端也会导入 MIME 常量)
+# ----------------------------------------------------------------------
+
+AGENT_REPORT_MIME_TYPE = "application/vnd.bank-ds-agent.report+json"
+
+# 允许的报告种类 (与 AgentState 中的字段名一一对应)
+REPORT_KINDS = ("evaluation_metrics", "xai_report", "compliance_report")
+
+
+def _to_jsonable(value: Any) -> Any:
+    """
+    将 numpy / pandas 标量等转换为纯 JSON 值。
+    """
+    if isinstance(value, dict):
+        return {str(k): _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(v) for v in value]
+    if hasattr(value, "tolist"):  # numpy 数组 / 标量
+        return _to_jsonable(value.tolist())
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _publish(kind: str, data: Any, summary: str) -> None:
+    if kind not in REPORT_KINDS:
+        raise ValueError(f"未知的报告种类: '{kind}'。可选: {REPORT_KINDS}")
+
+    from IPython.display import display  # 只在内核中可用
+
+    payload = {"kind": kind, "data": _to_jsonable(data)}
+    display(
+        {
+            AGENT_REPORT_MIME_TYPE: payload,
+            # (同时保留一个简短的纯文本版本，让 LLM 在历史记录中也能看到)
+            "text/plain": summary,
+        },
+        raw=True,
+    )
+
+
+def publish_metrics(metrics: Dict[str, Any] = None, **kwargs: Any) -> None:
+    """
+    发布模型评估指标 (例如 {'accuracy': 0.9, 'f1_score': 0.88})。
+    同一个单元格中的多次调用会被合并。
+    """
+    merged = dict(metrics or {})
+    merged.update(kwargs)
+    _publish(
+        "evaluation_metrics",
+        merged,
+        f"[evaluation_metrics] {json.dumps(_to_jsonable(merged), ensure_ascii=False)}",
+    )
+
+
+def publish_xai_report(report: str) -> None:
+    """
+    发布 SHAP/LIME 可解释性分析的文本摘要。
+    """
+    _publish("xai_report", str(report), f"[xai_report]\n{report}")
+
+
+def publish_compliance_report(report: str) -> None:
+    """
+    发布 Fairlearn 公平性审计的文本摘要。
+    """
+    _publish("compliance_report", str(report), f"[compliance_report]\n{report}")
@@ -6,21 +6,38 @@ import json
 import tempfile
 import shutil
 import atexit
-import re  # <-- 确保 re 被导入
-from queue import Empty
 import docker.errors  # <-- 确保 docker.errors 被导入
+from ..utils.logger import get_logger
+from .kernel_executor import (  # noqa: F401 (ExecutionResult 等在这里重新导出)
+    STARTUP_LATENCY,
+    ExecutionResult,
+    KernelExecutor,
+)
 
+logger = get_logger(__name__)
 
-class SandboxJupyterExecutor:
+# 沙箱容器内的只读数据集挂载点 (必须与 sandbox/datasets.py 中的默认值一致)
+SANDBOX_DATASETS_MOUNT = "/data"
+
+# kernel.json 中需要改写为宿主机端口的字段
+KERNEL_PORT_KEYS = ("shell_port", "iopub_port", "stdin_port", "hb_port", "control_port")
+
+
+class SandboxJupyterExecutor(KernelExecutor):
     """
     一个有状态的、沙箱化的 Jupyter 执行器。（来自您的优秀参考）
 
     它通过 Docker 启动一个 Jupyter 内核容器，并使用 jupyter_client
-    通过 TCP 端口（9000-9004）连接到它。
+    通过 TCP 端口（容器内 9000-9004，映射到动态的宿主机端口）连接到它。
+    代码在容器中运行，适用于不受信任的 (LLM 生成的) 代码。
     """
 
-    def __init__(self, image_name="agent-executor:latest", timeout=20):
-        print(f"Initializing SandboxJupyterExecutor with image {image_name}...")
+    backend_name = "docker"
+
+    def __init__(
+        self, image_name="agent-executor:latest", timeout=20, datasets_dir=None
+    ):
+        logger.info(f"Initializing SandboxJupyterExecutor with image {image_name}...")
         self.client = docker.from_env()
         self.image_name = image_name
         self.container = None
@@ -30,23 +47,37 @@ class SandboxJupyterExecutor:
         self.kernel_dir = tempfile.mkdtemp(prefix="agent_kernel_")
         self.kernel_json_path = os.path.join(self.kernel_dir, "kernel.json")
 
-        # 端口必须与 Dockerfile.agent 中的 CMD 匹配
-        self.ports = {f"{p}/tcp": p for p in range(9000, 9005)}
-
+        # 容器内的端口必须与 Dockerfile.agent 中的 CMD 匹配。
+        # 宿主机端口由 Docker 动态分配 (只绑定 127.0.0.1)，
+        # 这样每个会话都可以有自己的容器。
+        self.ports = {f"{p}/tcp": ("127.0.0.1", None) for p in range(9000, 9005)}
+
+        # 数据集注册表目录 (只读挂载到 /data，与 kernel_dir 卷并列)
+        volumes = {self.kernel_dir: {"bind": "/app", "mode": "rw"}}
+        environment = {}
+        if datasets_dir:
+            volumes[os.path.abspath(datasets_dir)] = {
+                "bind": SANDBOX_DATASETS_MOUNT,
+                "mode": "ro",
+            }
+            environment["AGENT_DATASETS_DIR"] = SANDBOX_DATASETS_MOUNT
+
+        container_start = time.perf_counter()
         try:
             # 启动容器
-            print(f"Starting container from image {self.image_name}...")
+            logger.info(f"Starting container from image {self.image_name}...")
             self.container = self.client.containers.run(
                 image=self.image_name,
                 detach=True,
                 ports=self.ports,
-                volumes={self.kernel_dir: {"bind": "/app", "mode": "rw"}},
+                volumes=volumes,
+                environment=environment,
                 auto_remove=False,  # 我们将在 cleanup() 中手动删除
                 publish_all_ports=False,
             )
 
             # 解决方案 2：等待 kernel.json 文件出现
-            print(f"Waiting for kernel.json to appear at {self.kernel_json_path}...")
+            logger.info(f"Waiting for kernel.json to appear at {self.kernel_json_path}...")
             start_time = time.time()
             while not os.path.exists(self.kernel_json_path):
                 if time.time() - start_time > timeout:
@@ -59,149 +90,105 @@ class SandboxJupyterExecutor:
                     logs = self.container.logs().decode("utf-8")
                     raise RuntimeError(f"Container exited unexpectedly. Logs:\n{logs}")
 
-            print("kernel.json found. Patching IP address...")
+            logger.info("kernel.json found. Patching IP address and ports...")
 
-            # 解决方案 3：修补 kernel.json
+            # 解决方案 3：修补 kernel.json (容器内端口 -> 动态分配的宿主机端口)
+            self.container.reload()
+            port_map = self.container.attrs["NetworkSettings"]["Ports"]
             with open(self.kernel_json_path, "r+") as f:
                 config = json.load(f)
                 config["ip"] = "127.0.0.1"
+                for key in KERNEL_PORT_KEYS:
+                    config[key] = int(port_map[f"{config[key]}/tcp"][0]["HostPort"])
                 f.seek(0)
                 json.dump(config, f)
                 f.truncate()
 
-            print("Connecting jupyter_client...")
+            logger.info("Connecting jupyter_client...")
             self.km = jupyter_client.BlockingKernelClient()
             self.km.load_connection_file(self.kernel_json_path)
             self.km.start_channels()
 
             # 解决方案 4：健壮的连接握手
             try:
-                print("Testing kernel connection (wait_for_ready)...")
+                logger.info("Testing kernel connection (wait_for_ready)...")
                 self.km.wait_for_ready(timeout=timeout)
-                print("Kernel is alive and ready!")
+                STARTUP_LATENCY.observe(
+                    time.perf_counter() - container_start, backend=self.backend_name
+                )
+                logger.info("Kernel is alive and ready!")
             except RuntimeError as e:
-                print(f"Kernel connection test failed: {e}")
-                print("This is often a FIREWALL or ANTIVIRUS issue.")
-                print("---!!!--- Retrieving container logs for debugging ---!!!---")
+                logger.error(f"Kernel connection test failed: {e}")
+                logger.error("This is often a FIREWALL or ANTIVIRUS issue.")
+                logger.error("---!!!--- Retrieving container logs for debugging ---!!!---")
                 try:
                     self.container.reload()
                     logs = self.container.logs().decode("utf-8")
-                    print(f"Container '{self.container.short_id}' logs:\n{logs}")
+                    logger.error(f"Container '{self.container.short_id}' logs:\n{logs}")
                 except Exception as log_e:
-                    print(f"Failed to retrieve container logs: {log_e}")
+                    logger.error(f"Failed to retrieve container logs: {log_e}")
                 self.cleanup()
                 raise
 
             atexit.register(self.cleanup)
 
         except Exception as e:
-            print(f"Error during initialization: {e}")
+            logger.error(f"Error during initialization: {e}")
             if self.container:
-                print("---!!!--- Retrieving container logs for debugging ---!!!---")
+                logger.error("---!!!--- Retrieving container logs for debugging ---!!!---")
                 try:
                     self.container.reload()
                     logs = self.container.logs().decode("utf-8")
-                    print(f"Container '{self.container.short_id}' logs:\n{logs}")
+                    logger.error(f"Container '{self.container.short_id}' logs:\n{logs}")
                 except Exception as log_e:
-                    print(f"Failed to retrieve container logs: {log_e}")
+                    logger.error(f"Failed to retrieve container logs: {log_e}")
             self.cleanup()  # 确保在失败时清理
             raise
 
-    def execute(self, code, timeout=10):
-        """
-        在沙箱化、有状态的内核中执行代码。
-        """
-        if not self.km:
-            raise RuntimeError("Executor is not initialized or has been cleaned up.")
-
-        print(f"\n[Executing Code]:\n{code}\n")
-        msg_id = self.km.execute(code)
-        outputs = []
-
+    def is_alive(self) -> bool:
+        if self.container is None:
+            return False
         try:
-            # 2. 等待 shell 通道的最终执行回复
-            reply = self.km.get_shell_msg(timeout=timeout)
-
-            if reply["content"]["status"] == "error":
-                error_content = reply["content"]
-                traceback = "\n".join(error_content.get("traceback", []))
-                # (清理 ANSI 颜色代码)
-                traceback = re.sub(r"\x1B\[[0-?]*[ -/]*[@-~]", "", traceback)
-                outputs.append(
-                    f"[Error] {error_content.get('ename', 'UnknownError')}: {error_content.get('evalue', '')}\n{traceback}"
-                )
-
-        except Empty:
-            return f"[Error] Timeout: Code execution took too long (> {timeout}s)."
-        except Exception as e:
-            return f"[Error] Failed to get shell reply: {e}"
-
-        # 3. 排空 IOPub 通道
-        while True:
-            try:
-                msg = self.km.get_iopub_msg(timeout=0.2)
-            except Empty:
-                break
-
-            if msg["parent_header"].get("msg_id") != msg_id:
-                continue
-
-            msg_type = msg["header"]["msg_type"]
-            content = msg["content"]
-
-            if msg_type == "stream":
-                outputs.append(f"[{content['name']}] {content['text']}")
-            elif msg_type == "display_data":
-                outputs.append(
-                    f"[Display] {content['data'].get('text/plain', 'No plain text representation')}"
-                )
-            elif msg_type == "execute_result":
-                outputs.append(
-                    f"[Result] {content['data'].get('text/plain', 'No plain text representation')}"
-                )
-            elif msg_type == "error":
-                traceback = "\n".join(content.get("traceback", []))
-                traceback = re.sub(r"\x1B\[[0-?]*[ -/]*[@-~]", "", traceback)
-                outputs.append(
-                    f"[Error] {content.get('ename', 'UnknownError')}: {content.get('evalue', '')}\n{traceback}"
-                )
-
-        result = "\n".join(outputs)
-        print(f"[Execution Result]:\n{result}")
-        return result
+            self.container.reload()
+        except docker.errors.NotFound:
+            return False
+        return self.container.status == "running" and super().is_alive()
 
     def cleanup(self):
         """
         停止内核、停止容器并删除临时目录。
         """
-        print("\nCleaning up resources...")
+        logger.info("Cleaning up resources...")
+        # (已经清理过的执行器不需要在退出时再清理一次: 会话池会不断创建/关闭执行器，
+        #  不取消注册的话 atexit 列表会无限增长)
+        atexit.unregister(self.cleanup)
         try:
             if self.km and self.km.is_alive():
-                print("Shutting down kernel...")
+                logger.info("Shutting down kernel...")
                 self.km.shutdown()
         except Exception as e:
-            print(f"Error shutting down kernel: {e}")
+            logger.error(f"Error shutting down kernel: {e}")
 
         try:
             if self.container:
-                print(f"Stopping container {self.container.short_id}...")
+                logger.info(f"Stopping container {self.container.short_id}...")
                 self.container.stop()
-                print("Container stopped.")
-                print(f"Removing container {self.container.short_id}...")
+                logger.info("Container stopped.")
+                logger.info(f"Removing container {self.container.short_id}...")
                 self.container.remove()
-                print("Container removed.")
+                logger.info("Container removed.")
         except docker.errors.NotFound:
-            print("Container already stopped or removed.")
+            logger.warning("Container already stopped or removed.")
         except Exception as e:
-            print(f"Error stopping/removing container: {e}")
+            logger.error(f"Error stopping/removing container: {e}")
 
         try:
             if self.kernel_dir and os.path.exists(self.kernel_dir):
-                print(f"Removing temp directory {self.kernel_dir}...")
+                logger.info(f"Removing temp directory {self.kernel_dir}...")
                 shutil.rmtree(self.kernel_dir)
-                print("Temp directory removed.")
+                logger.info("Temp directory removed.")
         except Exception as e:
-            print(f"Error removing temp directory: {e}")
+            logger.error(f"Error removing temp directory: {e}")
 
         self.km = None
         self.container = None
@@ -213,7 +200,7 @@ def build_docker_image(
     """
     自动构建 Docker 镜像。
     """
-    print(f"Building Docker image '{image_tag}' from Dockerfile.agent...")
+    logger.info(f"Building Docker image '{image_tag}' from Dockerfile.agent...")
     try:
         client = docker.from_env()
         image, logs = client.images.build(
@@ -222,11 +209,11 @@ def build_docker_image(
             tag=image_tag,
             rm=True,
         )
-        print("Docker image built successfully.")
+        logger.info("Docker image built successfully.")
         return image
     except Exception as e:
-        print(f"Failed to build Docker image: {e}")
-        print(
+        logger.error(f"Failed to build Docker image: {e}")
+        logger.error(
             "Please ensure Docker is running and Dockerfile.agent is in the same directory."
         )
         raise
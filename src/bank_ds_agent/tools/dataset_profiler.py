@@ -0,0 +1,179 @@
+import math
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as pa_ipc
+
+# 超过这个行数时，基数和高频值只在随机样本上计算
+DEFAULT_SAMPLE_ROWS = 100_000
+QUANTILES = [0.0, 0.01, 0.25, 0.5, 0.75, 0.99, 1.0]
+
+
+def _is_numeric(data_type: pa.DataType) -> bool:
+    return pa.types.is_integer(data_type) or pa.types.is_floating(data_type)
+
+
+def _finite(value: Any) -> Any:
+    """NaN / inf -> None (画像会被缓存为 JSON，而 JSON 不支持这些值)。"""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _column_stats(
+    column: pa.ChunkedArray, sample_column: pa.ChunkedArray, num_rows: int, sampled: bool
+) -> Dict[str, Any]:
+    info: Dict[str, Any] = {
+        "distinct": pc.count_distinct(sample_column).as_py(),
+        "distinct_is_approx": sampled,
+    }
+    if _is_numeric(column.type) and column.null_count < num_rows:
+        digest = pc.tdigest(column, q=QUANTILES)
+        info["quantiles"] = {
+            str(q): _finite(v) for q, v in zip(QUANTILES, digest.to_pylist())
+        }
+        info["mean"] = _finite(pc.mean(column).as_py())
+    elif info["distinct"] <= 50 or pa.types.is_string(column.type):
+        counts = pc.value_counts(sample_column.drop_null()).to_pylist()
+        counts.sort(key=lambda item: item["counts"], reverse=True)
+        info["top_values"] = {
+            str(item["values"]): item["counts"] for item in counts[:5]
+        }
+    return info
+
+
+def _sample_table(table: pa.Table, sample_rows: int) -> pa.Table:
+    if table.num_rows <= sample_rows:
+        return table
+    rng = np.random.default_rng(0)  # 固定种子，保证画像可复现
+    indices = np.sort(rng.choice(table.num_rows, size=sample_rows, replace=False))
+    return table.take(pa.array(indices))
+
+
+def profile_table(
+    table: pa.Table,
+    target_column: Optional[str] = None,
+    sample_rows: int = DEFAULT_SAMPLE_ROWS,
+) -> Dict[str, Any]:
+    """
+    计算一张表的画像: 列类型、缺失率、基数、分位数和目标变量的分布。
+
+    - 缺失率 / 目标分布: 在完整的列上计算 (向量化，读取 Arrow 元数据或单次扫描)
+    - 分位数: 使用流式的 t-digest，单次扫描即可
+    - 基数 / 高频值: 在随机样本上计算 (大表时标记为近似值)
+    - Arrow 不支持统计的列 (例如 list / struct) 只报告类型和缺失率，
+      并标记为 unsupported；一列失败不会影响整张表的画像
+    """
+    start_time = time.time()
+    sample = _sample_table(table, sample_rows)
+    sampled = sample.num_rows < table.num_rows
+
+    columns = {}
+    for name in table.column_names:
+        column = table.column(name)
+        sample_column = sample.column(name)
+        info: Dict[str, Any] = {
+            "type": str(column.type),
+            "null_rate": (column.null_count / table.num_rows) if table.num_rows else 0.0,
+        }
+        try:
+            info.update(_column_stats(column, sample_column, table.num_rows, sampled))
+        except (pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            # (例如 count_distinct / value_counts 不支持嵌套类型)
+            info.update(distinct=None, distinct_is_approx=sampled, unsupported=True)
+        columns[name] = info
+
+    profile = {
+        "num_rows": table.num_rows,
+        "num_columns": table.num_columns,
+        "sample_rows": sample.num_rows,
+        "columns": columns,
+    }
+
+    if target_column:
+        if target_column not in table.column_names:
+            raise KeyError(f"目标列不存在: '{target_column}'")
+        target = table.column(target_column).drop_null()
+        try:
+            counts = pc.value_counts(target).to_pylist()
+        except (pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            raise ValueError(
+                f"不能统计目标列 '{target_column}' 的分布 (类型 {target.type})"
+            )
+        total = sum(item["counts"] for item in counts) or 1
+        profile["target"] = {
+            "column": target_column,
+            "balance": {
+                str(item["values"]): item["counts"] / total
+                for item in sorted(counts, key=lambda item: -item["counts"])[:20]
+            },
+        }
+
+    profile["profile_seconds"] = round(time.time() - start_time, 3)
+    return profile
+
+
+def profile_arrow_file(
+    path: str,
+    target_column: Optional[str] = None,
+    sample_rows: int = DEFAULT_SAMPLE_ROWS,
+) -> Dict[str, Any]:
+    """
+    memory-map 一个 Arrow IPC 文件 (由 DatasetRegistry 生成) 并计算画像。
+    """
+    table = pa_ipc.open_file(pa.memory_map(path, "r")).read_all()
+    return profile_table(table, target_column=target_column, sample_rows=sample_rows)
+
+
+def _fmt(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    return str(value)
+
+
+def render_profile(name: str, profile: Dict[str, Any]) -> str:
+    """
+    将画像渲染为一段紧凑的文本，用于 AgentState.data_summary。
+    """
+    lines = [
+        f"数据集 '{name}': {profile['num_rows']} 行, {profile['num_columns']} 列"
+        + (
+            f" (基数/高频值基于 {profile['sample_rows']} 行样本)"
+            if profile["sample_rows"] < profile["num_rows"]
+            else ""
+        )
+    ]
+    for column, info in profile["columns"].items():
+        parts = [
+            f"- {column} [{info['type']}]",
+            f"缺失率={info['null_rate']:.2%}",
+        ]
+        if info.get("unsupported"):
+            parts.append("(不支持统计的类型)")
+        else:
+            parts.append(
+                f"基数{'≈' if info['distinct_is_approx'] else '='}{info['distinct']}"
+            )
+        if "quantiles" in info:
+            q = info["quantiles"]
+            parts.append(
+                f"min={_fmt(q['0.0'])} p25={_fmt(q['0.25'])} p50={_fmt(q['0.5'])} "
+                f"p75={_fmt(q['0.75'])} max={_fmt(q['1.0'])} mean={_fmt(info['mean'])}"
+            )
+        elif "top_values" in info:
+            top = ", ".join(f"{k}:{v}" for k, v in info["top_values"].items())
+            parts.append(f"高频值={{{top}}}")
+        lines.append(" ".join(parts))
+
+    if "target" in profile:
+        balance = ", ".join(
+            f"{k}={v:.2%}" for k, v in profile["target"]["balance"].items()
+        )
+        lines.append(f"目标列 '{profile['target']['column']}' 分布: {balance}")
+
+    return "\n".join(lines)
@@ -0,0 +1,328 @@
+import os
+import json
+import time
+import re
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.ipc as pa_ipc
+import pyarrow.parquet as pq
+
+from .dataset_profiler import DEFAULT_SAMPLE_ROWS, profile_arrow_file, render_profile
+from ..utils.logger import get_logger
+from ..utils.metrics import REGISTRY
+
+logger = get_logger(__name__)
+
+CACHE_REQUESTS = REGISTRY.counter(
+    "dataset_cache_requests_total",
+    "数据集注册表的缓存查询 (cache=conversion/profile, result=hit/miss)",
+    ["cache", "result"],
+)
+CONVERSION_LATENCY = REGISTRY.histogram(
+    "dataset_conversion_seconds", "数据源转换为 Arrow 的耗时 (秒)"
+)
+PROFILE_LATENCY = REGISTRY.histogram("dataset_profile_seconds", "计算数据集画像的耗时 (秒)")
+
+MANIFEST_FILENAME = "registry.json"
+
+# 数据集名称会成为 root_dir 中的文件名 (以及沙箱中的 /data/<name>.arrow)
+_NAME_PATTERN = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_.-]{0,63}")
+
+
+def fingerprint_source(path: str) -> str:
+    """
+    计算源文件的“指纹”(路径 + 大小 + 修改时间)。
+    (我们故意不对多 GB 的文件做完整哈希)
+    """
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _iter_source_batches(source_path: str):
+    """
+    以流式的方式读取源文件，返回 (schema, RecordBatch 迭代器)。
+    这样即使是多 GB 的 CSV 也不会被一次性载入内存。
+    """
+    ext = os.path.splitext(source_path)[1].lower()
+    if ext in (".csv", ".txt"):
+        reader = pa_csv.open_csv(source_path)
+        return reader.schema, iter(reader)
+    if ext in (".parquet", ".pq"):
+        parquet_file = pq.ParquetFile(source_path)
+        return parquet_file.schema_arrow, parquet_file.iter_batches()
+    if ext in (".arrow", ".feather", ".ipc"):
+        reader = pa_ipc.open_file(pa.memory_map(source_path, "r"))
+        return reader.schema, (
+            reader.get_batch(i) for i in range(reader.num_record_batches)
+        )
+    raise ValueError(f"不支持的数据格式: '{ext}' (支持 csv / parquet / arrow)")
+
+
+def _write_ipc(target_path: str, schema: pa.Schema, batches) -> int:
+    """把 RecordBatch 写成 Arrow IPC 文件，返回行数。"""
+    num_rows = 0
+    # (关键) 不压缩，这样内核端可以零拷贝地 memory-map
+    with pa.OSFile(target_path, "wb") as sink:
+        with pa_ipc.new_file(sink, schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+                num_rows += batch.num_rows
+    return num_rows
+
+
+def _widening_chain(data_type: pa.DataType) -> List[pa.DataType]:
+    """第一个块推断的类型不适用时，依次尝试的更宽的类型 (最后总是字符串)。"""
+    if pa.types.is_null(data_type):
+        # (第一个块里这一列全部为空)
+        return [pa.int64(), pa.float64(), pa.string()]
+    if pa.types.is_integer(data_type):
+        return [data_type, pa.float64(), pa.string()]
+    if pa.types.is_string(data_type):
+        return [data_type]
+    return [data_type, pa.string()]
+
+
+def _infer_csv_types(source_path: str, schema: pa.Schema) -> Dict[str, pa.DataType]:
+    """
+    流式扫描整个 CSV 来确定每一列的类型: 所有列先按字符串读取，逐块检查
+    每一列能否转换为当前的候选类型，不能时放宽 (整数 -> 浮点数 -> 字符串)。
+    内存占用只与块大小有关，与文件大小无关。
+    """
+    chains = {field.name: _widening_chain(field.type) for field in schema}
+    reader = pa_csv.open_csv(
+        source_path,
+        convert_options=pa_csv.ConvertOptions(
+            column_types={name: pa.string() for name in chains},
+            strings_can_be_null=True,  # (与按类型读取时的空值一致)
+        ),
+    )
+    for batch in reader:
+        for name, chain in chains.items():
+            column = batch.column(name)
+            while len(chain) > 1:
+                try:
+                    pc.cast(column, chain[0])
+                    break
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    chain.pop(0)
+    return {name: chain[0] for name, chain in chains.items()}
+
+
+def _convert_source(source_path: str, target_path: str):
+    """
+    把数据源转换为 Arrow IPC 文件，返回 (schema, 行数)。
+    流式读取 CSV 时，列类型只根据第一个块推断；如果后面的行不符合
+    (例如看起来是整数的列后来出现了小数或字符串)，就先流式扫描整个文件
+    确定列类型，再用这些类型重新流式转换 (不会把整个文件载入内存)。
+    """
+    schema, batches = _iter_source_batches(source_path)
+    try:
+        return schema, _write_ipc(target_path, schema, batches)
+    except pa.ArrowInvalid as e:
+        if os.path.splitext(source_path)[1].lower() not in (".csv", ".txt"):
+            raise
+        logger.warning(
+            f"CSV 的列类型与第一个块推断的不一致，改为扫描整个文件推断类型: {e}",
+            extra={"source": source_path},
+        )
+    column_types = _infer_csv_types(source_path, schema)
+    reader = pa_csv.open_csv(
+        source_path,
+        convert_options=pa_csv.ConvertOptions(column_types=column_types),
+    )
+    return reader.schema, _write_ipc(target_path, reader.schema, reader)
+
+
+class DatasetRegistry:
+    """
+    一个宿主机端的、只读的数据集注册表。
+
+    每个注册的数据源只会被转换 *一次* 为未压缩的 Arrow IPC 文件，
+    然后以只读方式挂载到每个沙箱容器的 /data 中。
+    内核端通过 memory-map 读取它们，因此 N 个内核共享同一份页缓存，
+    而不是各自解析并持有 N 份 CSV。
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = os.path.abspath(root_dir)
+        os.makedirs(self.root_dir, exist_ok=True)
+        self.manifest_path = os.path.join(self.root_dir, MANIFEST_FILENAME)
+        self._lock = threading.Lock()
+        # 画像缓存: {缓存键: 画像}，同时持久化到 <name>.<key>.profile.json
+        # (单独的锁: 读取画像时不需要等待其他数据集的转换完成)
+        self._profiles: Dict[str, Dict[str, Any]] = {}
+        self._profiles_lock = threading.Lock()
+        self._manifest: Dict[str, Dict[str, Any]] = self._load_manifest()
+
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_manifest(self) -> None:
+        # (先写临时文件再原子替换，避免内核读到写了一半的清单)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def register(self, name: str, source_path: str) -> Dict[str, Any]:
+        """
+        注册 (或刷新) 一个数据集。
+        如果源文件的指纹没有变化，则直接复用已转换的 Arrow 文件。
+        """
+        if not _NAME_PATTERN.fullmatch(name or ""):
+            raise ValueError(
+                f"非法的数据集名称: '{name}' "
+                "(只能包含字母、数字、'_'、'.'、'-'，不能以 '.' 或 '-' 开头，最多 64 个字符)"
+            )
+        if not os.path.exists(source_path):
+            raise FileNotFoundError(f"找不到数据源: {source_path}")
+
+        fingerprint = fingerprint_source(source_path)
+        filename = f"{name}.arrow"
+        target_path = os.path.join(self.root_dir, filename)
+
+        with self._lock:
+            entry = self._manifest.get(name)
+            if (
+                entry
+                and entry["fingerprint"] == fingerprint
+                and os.path.exists(target_path)
+            ):
+                CACHE_REQUESTS.inc(cache="conversion", result="hit")
+                logger.info("数据集未变化，复用缓存。", extra={"dataset": name})
+                return entry
+
+            CACHE_REQUESTS.inc(cache="conversion", result="miss")
+            logger.info(f"正在转换 '{source_path}' -> {filename}", extra={"dataset": name})
+            start_time = time.time()
+            tmp_path = f"{target_path}.tmp"
+            try:
+                schema, num_rows = _convert_source(source_path, tmp_path)
+                os.replace(tmp_path, target_path)
+            except Exception:
+                # (转换失败时不留下写了一半的临时文件)
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._drop_profiles(name)
+
+            entry = {
+                "name": name,
+                "file": filename,
+                "source_path": os.path.abspath(source_path),
+                "fingerprint": fingerprint,
+                "num_rows": num_rows,
+                "columns": {field.name: str(field.type) for field in schema},
+                "size_bytes": os.path.getsize(target_path),
+                "registered_at": time.time(),
+            }
+            self._manifest[name] = entry
+            self._save_manifest()
+
+        elapsed = time.time() - start_time
+        CONVERSION_LATENCY.observe(elapsed)
+        logger.info(
+            "转换完成",
+            extra={"dataset": name, "rows": num_rows, "seconds": round(elapsed, 2)},
+        )
+        return entry
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            entry = self._manifest.pop(name, None)
+            if entry is None:
+                raise KeyError(f"数据集未注册: '{name}'")
+            self._save_manifest()
+            self._drop_profiles(name)
+            path = os.path.join(self.root_dir, entry["file"])
+            if os.path.exists(path):
+                os.remove(path)
+
+    def get(self, name: str) -> Dict[str, Any]:
+        entry = self._manifest.get(name)
+        if entry is None:
+            raise KeyError(f"数据集未注册: '{name}'")
+        return entry
+
+    def path_of(self, name: str) -> str:
+        """宿主机上 Arrow 文件的路径。"""
+        return os.path.join(self.root_dir, self.get(name)["file"])
+
+    def list_datasets(self) -> List[Dict[str, Any]]:
+        return list(self._manifest.values())
+
+    def _profile_cache_path(self, name: str, cache_key: str) -> str:
+        return os.path.join(self.root_dir, f"{name}.{cache_key}.profile.json")
+
+    def _drop_profiles(self, name: str) -> None:
+        """数据集被刷新或删除后，旧的画像缓存全部作废。"""
+        # (精确匹配 <name>.<16 位缓存键>.profile.json: 名称中可以有 '.'，
+        #  通配符 "a.*" 会误删数据集 "a.b" 的缓存)
+        pattern = re.compile(re.escape(name) + r"\.[0-9a-f]{16}\.profile\.json")
+        for filename in os.listdir(self.root_dir):
+            if pattern.fullmatch(filename):
+                os.remove(os.path.join(self.root_dir, filename))
+        with self._profiles_lock:
+            self._profiles = {
+                k: v for k, v in self._profiles.items() if not k.startswith(f"{name}|")
+            }
+
+    def profile(
+        self,
+        name: str,
+        target_column: Optional[str] = None,
+        sample_rows: int = DEFAULT_SAMPLE_ROWS,
+    ) -> Dict[str, Any]:
+        """
+        返回数据集的画像 (以及渲染好的文本摘要)。
+        结果按 (数据集指纹, 目标列, 样本大小) 缓存在内存和磁盘上，
+        所以同一个数据集在每个会话中只需要计算一次。
+        """
+        entry = self.get(name)
+        key_source = f"{entry['fingerprint']}|{target_column}|{sample_rows}"
+        cache_key = hashlib.sha256(key_source.encode("utf-8")).hexdigest()[:16]
+        memory_key = f"{name}|{cache_key}"
+
+        with self._profiles_lock:
+            cached = self._profiles.get(memory_key)
+        if cached is not None:
+            CACHE_REQUESTS.inc(cache="profile", result="hit")
+            return cached
+
+        cache_path = self._profile_cache_path(name, cache_key)
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            with self._profiles_lock:
+                self._profiles[memory_key] = cached
+            CACHE_REQUESTS.inc(cache="profile", result="hit")
+            return cached
+
+        CACHE_REQUESTS.inc(cache="profile", result="miss")
+        logger.info("正在计算画像...", extra={"dataset": name})
+        with PROFILE_LATENCY.time():
+            profile = profile_arrow_file(
+                self.path_of(name), target_column=target_column, sample_rows=sample_rows
+            )
+        result = {
+            "name": name,
+            "fingerprint": entry["fingerprint"],
+            "profile": profile,
+            "summary": render_profile(name, profile),
+        }
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+        with self._profiles_lock:
+            self._profiles[memory_key] = result
+        return result
@@ -0,0 +1,207 @@
+import re
+import time
+import logging
+from abc import ABC, abstractmethod
+from queue import Empty
+from typing import Any, Dict, Iterator, Optional, TypedDict
+from ..sandbox.reporting import AGENT_REPORT_MIME_TYPE
+from ..utils.logger import get_logger
+from ..utils.metrics import REGISTRY, DEFAULT_SIZE_BUCKETS
+
+logger = get_logger(__name__)
+
+# --- 沙箱指标 (通过后端的 /metrics 暴露，所有执行器后端共用) ---
+STARTUP_LATENCY = REGISTRY.histogram(
+    "sandbox_startup_seconds", "执行器启动到内核就绪的耗时 (秒)", ["backend"]
+)
+EXEC_LATENCY = REGISTRY.histogram(
+    "sandbox_exec_seconds", "单元格从提交到内核 idle 的耗时 (秒)"
+)
+DRAIN_LATENCY = REGISTRY.histogram(
+    "sandbox_drain_seconds", "内核 idle 之后等待 shell 回复并整理输出的耗时 (秒)"
+)
+OUTPUT_BYTES = REGISTRY.histogram(
+    "sandbox_output_bytes", "每个单元格返回的输出大小 (字节)", buckets=DEFAULT_SIZE_BUCKETS
+)
+EXEC_OUTCOMES = REGISTRY.counter(
+    "sandbox_executions_total", "单元格执行次数 (status=ok/error/timeout)", ["status"]
+)
+
+
+class ExecutionResult(TypedDict):
+    """
+    execute() 的返回值。
+    除了纯文本输出外，还包含沙箱通过自定义 MIME 类型发布的结构化字段
+    (键名与 AgentState 中的字段一致，方便直接合并)。
+    """
+
+    result: str
+    evaluation_metrics: Dict[str, Any]
+    xai_report: Optional[str]
+    compliance_report: Optional[str]
+
+
+def _make_result(text: str) -> ExecutionResult:
+    return {
+        "result": text,
+        "evaluation_metrics": {},
+        "xai_report": None,
+        "compliance_report": None,
+    }
+
+
+def _merge_report(result: ExecutionResult, payload: Dict[str, Any]) -> None:
+    """
+    将一个 AGENT_REPORT_MIME_TYPE 负载合并到结果中。
+    (同一单元格多次发布时: 指标合并，报告追加)
+    """
+    kind = payload.get("kind")
+    data = payload.get("data")
+    if kind == "evaluation_metrics" and isinstance(data, dict):
+        result["evaluation_metrics"].update(data)
+    elif kind in ("xai_report", "compliance_report") and data:
+        previous = result[kind]
+        result[kind] = f"{previous}\n\n{data}" if previous else str(data)
+
+
+def _format_error(content: Dict[str, Any]) -> str:
+    traceback = "\n".join(content.get("traceback", []))
+    # (清理 ANSI 颜色代码)
+    traceback = re.sub(r"\x1B\[[0-?]*[ -/]*[@-~]", "", traceback)
+    return f"[Error] {content.get('ename', 'UnknownError')}: {content.get('evalue', '')}\n{traceback}"
+
+
+class KernelExecutor(ABC):
+    """
+    执行器接口: 通过 jupyter_client 与一个有状态的 Jupyter 内核通信。
+
+    子类只负责启动/停止内核 (Docker 容器、本地子进程……)，
+    并把一个已连接的 BlockingKernelClient 赋给 self.km。
+    (没有实现 cleanup 的后端在实例化时就会失败)
+    execute / execute_stream 的协议处理对所有后端都相同。
+    """
+
+    # (用于指标标签，例如 "docker" / "local")
+    backend_name = "kernel"
+
+    # 已连接的 jupyter_client.BlockingKernelClient (由子类在 __init__ 中设置)
+    km = None
+
+    def execute(self, code, timeout=10) -> ExecutionResult:
+        """
+        在沙箱化、有状态的内核中执行代码。
+        返回纯文本输出，以及沙箱发布的结构化指标/报告。
+        """
+        execution = _make_result("")
+        for event in self.execute_stream(code, timeout=timeout):
+            if event["type"] == "result":
+                execution = event["execution"]
+        return execution
+
+    def execute_stream(self, code, timeout=10) -> Iterator[Dict[str, Any]]:
+        """
+        与 execute() 相同，但在输出产生时就逐条返回:
+            {"type": "output", "text": "..."}   (每一条输出)
+            {"type": "result", "execution": ExecutionResult}   (最后一条)
+        timeout 是整个单元格的截止时间 (秒)。
+        """
+        if not self.km:
+            raise RuntimeError("Executor is not initialized or has been cleaned up.")
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[Executing Code]:\n{code}")
+        started = time.perf_counter()
+        msg_id = self.km.execute(code)
+        outputs = []
+        execution = _make_result("")
+        saw_error = False
+        deadline = time.time() + timeout
+
+        # 1. 读取 IOPub 通道，直到内核对 *这个* 请求报告 'idle'
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                text = f"[Error] Timeout: Code execution took too long (> {timeout}s)."
+                outputs.append(text)
+                yield {"type": "output", "text": text}
+                execution["result"] = "\n".join(outputs)
+                EXEC_LATENCY.observe(time.perf_counter() - started)
+                EXEC_OUTCOMES.inc(status="timeout")
+                yield {"type": "result", "execution": execution}
+                return
+
+            try:
+                msg = self.km.get_iopub_msg(timeout=min(remaining, 1.0))
+            except Empty:
+                continue
+
+            if msg["parent_header"].get("msg_id") != msg_id:
+                continue
+
+            msg_type = msg["header"]["msg_type"]
+            content = msg["content"]
+
+            if msg_type == "status":
+                if content.get("execution_state") == "idle":
+                    break
+                continue
+
+            text = None
+            if msg_type == "stream":
+                text = f"[{content['name']}] {content['text']}"
+            elif msg_type == "display_data":
+                # (关键) 结构化通道: 直接解析为类型化字段
+                report = content["data"].get(AGENT_REPORT_MIME_TYPE)
+                if isinstance(report, dict):
+                    _merge_report(execution, report)
+                text = f"[Display] {content['data'].get('text/plain', 'No plain text representation')}"
+            elif msg_type == "execute_result":
+                text = f"[Result] {content['data'].get('text/plain', 'No plain text representation')}"
+            elif msg_type == "error":
+                saw_error = True
+                text = _format_error(content)
+
+            if text is not None:
+                outputs.append(text)
+                yield {"type": "output", "text": text}
+
+        idle_at = time.perf_counter()
+        EXEC_LATENCY.observe(idle_at - started)
+
+        # 2. 读取 shell 通道的执行回复 (内核已经 idle，所以它应该马上到达)
+        #    (跳过之前超时单元格遗留下来的旧回复)
+        try:
+            while True:
+                reply = self.km.get_shell_msg(timeout=max(deadline - time.time(), 1.0))
+                if reply["parent_header"].get("msg_id") == msg_id:
+                    break
+            if reply["content"]["status"] == "error" and not saw_error:
+                saw_error = True
+                text = _format_error(reply["content"])
+                outputs.append(text)
+                yield {"type": "output", "text": text}
+        except Empty:
+            pass
+        except Exception as e:
+            text = f"[Error] Failed to get shell reply: {e}"
+            outputs.append(text)
+            yield {"type": "output", "text": text}
+
+        result = "\n".join(outputs)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[Execution Result]:\n{result}")
+        execution["result"] = result
+        DRAIN_LATENCY.observe(time.perf_counter() - idle_at)
+        OUTPUT_BYTES.observe(len(result.encode("utf-8")))
+        EXEC_OUTCOMES.inc(status="error" if saw_error else "ok")
+        yield {"type": "result", "execution": execution}
+
+    def is_alive(self) -> bool:
+        """内核是否仍然可用 (通过心跳通道检查)。"""
+        return self.km is not None and self.km.is_alive()
+
+    @abstractmethod
+    def cleanup(self):
+        """
+        停止内核并释放这个后端占用的所有资源。
+        """
@@ -0,0 +1,110 @@
+import os
+import time
+import atexit
+import shutil
+import tempfile
+import jupyter_client
+from ..utils.logger import get_logger
+from .kernel_executor import STARTUP_LATENCY, KernelExecutor
+
+logger = get_logger(__name__)
+
+# 沙箱辅助库的源码目录 (在 Docker 镜像中它被复制为 /opt/agent_lib/agent_sandbox)
+SANDBOX_LIB_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "sandbox")
+)
+
+
+class LocalKernelExecutor(KernelExecutor):
+    """
+    一个有状态的本地 Jupyter 执行器: 用 jupyter_client.KernelManager
+    在宿主机上启动一个内核子进程 (不经过 Docker 和端口映射)。
+
+    启动只需要不到一秒，适合开发、CI 和受信任的批处理任务。
+    (注意: 代码直接以当前用户的权限在宿主机上运行，*没有*任何隔离。
+     不受信任的代码请使用 SandboxJupyterExecutor。)
+    """
+
+    backend_name = "local"
+
+    def __init__(self, kernel_name="python3", timeout=20, datasets_dir=None):
+        logger.info(f"Initializing LocalKernelExecutor with kernel '{kernel_name}'...")
+        self.kernel_manager = None
+        self.km = None
+
+        # 内核的工作目录 (相当于容器里的 /app)
+        self.kernel_dir = tempfile.mkdtemp(prefix="agent_kernel_")
+        self._install_sandbox_lib()
+
+        # 与镜像一致: 辅助库以 'agent_sandbox' 的名字导入，数据集目录通过环境变量传入
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            p for p in (self.kernel_dir, env.get("PYTHONPATH")) if p
+        )
+        if datasets_dir:
+            env["AGENT_DATASETS_DIR"] = os.path.abspath(datasets_dir)
+
+        start_time = time.perf_counter()
+        try:
+            self.kernel_manager = jupyter_client.KernelManager(kernel_name=kernel_name)
+            self.kernel_manager.start_kernel(cwd=self.kernel_dir, env=env)
+
+            self.km = self.kernel_manager.client()
+            self.km.start_channels()
+            self.km.wait_for_ready(timeout=timeout)
+            STARTUP_LATENCY.observe(
+                time.perf_counter() - start_time, backend=self.backend_name
+            )
+            logger.info("Local kernel is alive and ready!")
+
+            atexit.register(self.cleanup)
+
+        except Exception as e:
+            logger.error(f"Error during initialization: {e}")
+            self.cleanup()  # 确保在失败时清理
+            raise
+
+    def _install_sandbox_lib(self):
+        """
+        让内核可以 'import agent_sandbox'。
+        优先使用符号链接 (修改源码后立即生效)；不支持符号链接的系统 (例如没有
+        开发者模式的 Windows) 退回到复制一份。
+        """
+        target = os.path.join(self.kernel_dir, "agent_sandbox")
+        try:
+            os.symlink(SANDBOX_LIB_DIR, target, target_is_directory=True)
+        except (OSError, NotImplementedError):
+            shutil.copytree(SANDBOX_LIB_DIR, target)
+
+    def is_alive(self) -> bool:
+        return (
+            self.kernel_manager is not None
+            and self.kernel_manager.is_alive()
+            and super().is_alive()
+        )
+
+    def cleanup(self):
+        """
+        停止内核子进程并删除临时目录。
+        """
+        logger.info("Cleaning up resources...")
+        # (已经清理过的执行器不需要在退出时再清理一次: 会话池会不断创建/关闭执行器，
+        #  不取消注册的话 atexit 列表会无限增长)
+        atexit.unregister(self.cleanup)
+        try:
+            if self.km:
+                self.km.stop_channels()
+            if self.kernel_manager and self.kernel_manager.has_kernel:
+                logger.info("Shutting down local kernel...")
+                self.kernel_manager.shutdown_kernel(now=True)
+        except Exception as e:
+            logger.error(f"Error shutting down kernel: {e}")
+
+        try:
+            if self.kernel_dir and os.path.exists(self.kernel_dir):
+                shutil.rmtree(self.kernel_dir)
+        except Exception as e:
+            logger.error(f"Error removing temp directory: {e}")
+
+        self.km = None
+        self.kernel_manager = None
@@ -1,36 +1,544 @@
-import requests
+import os
 import json
+import asyncio
+import time
+import random
+import functools
+import threading
+import weakref
+from urllib.parse import quote
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from ..utils.logger import get_logger
+from ..utils.metrics import REGISTRY
+
+logger = get_logger(__name__)
+
+MCP_REQUEST_LATENCY = REGISTRY.histogram(
+    "mcp_client_request_seconds", "MCP 客户端调用的耗时 (秒，包括排队和重试)", ["call"]
+)
+MCP_RETRIES = REGISTRY.counter("mcp_client_retries_total", "MCP 客户端的重试次数", ["call"])
 
 # 这是我们 FastAPI/MCP 服务器的地址
-TOOL_SERVER_URL = "http://127.0.0.1:8000"
+TOOL_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://127.0.0.1:8000")
+
+# --- 连接池 / 重试 / 截止时间 的配置 (都可以通过环境变量覆盖) ---
+POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "16"))
+MAX_RETRIES = int(os.getenv("MCP_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("MCP_BACKOFF_BASE", "0.5"))  # 秒
+BACKOFF_MAX = float(os.getenv("MCP_BACKOFF_MAX", "8.0"))  # 秒
+CONNECT_TIMEOUT = float(os.getenv("MCP_CONNECT_TIMEOUT", "3.0"))  # 秒
+# 默认的单元格执行截止时间 (与沙箱端 execute() 的默认值一致)
+DEFAULT_EXEC_TIMEOUT = int(os.getenv("MCP_EXEC_TIMEOUT", "10"))
+# HTTP 截止时间 = 排队时间 + 沙箱截止时间 + 这个余量 (网络往返 + 排空输出)
+DEADLINE_MARGIN = float(os.getenv("MCP_DEADLINE_MARGIN", "5.0"))
+# 最多愿意在后端调度器的队列中等待多久 (秒)，会随请求发送给后端
+QUEUE_WAIT = float(os.getenv("MCP_QUEUE_WAIT", "30.0"))
+
+# 这些状态码说明后端在执行 *之前* 就拒绝了请求 (429 = 队列 / 会话已满，
+# 503 = 排队超时或沙箱不可用)，重发是安全的。
+# (502 / 504 来自中间的代理: 请求可能已经送达后端、代码可能已经执行，不重试)
+RETRYABLE_STATUS = (429, 503)
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+# 每个事件循环一个 httpx.AsyncClient (按需创建)。
+# 客户端的连接绑定在创建它的事件循环上，不能跨 asyncio.run() 复用。
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _get_session() -> requests.Session:
+    """
+    返回一个持久的、带连接池的 requests.Session (keep-alive)，
+    这样每个单元格不再需要建立新的 TCP 连接。
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # (max_retries=0: 重试由我们自己控制，带抖动)
+                adapter = HTTPAdapter(
+                    pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=0
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def _get_async_client():
+    """
+    返回当前事件循环的持久 httpx.AsyncClient (连接池 + keep-alive)。
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        import httpx  # (只有异步版本才需要)
+
+        client = _async_clients[loop] = httpx.AsyncClient(
+            base_url=TOOL_SERVER_URL,
+            limits=httpx.Limits(
+                max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE
+            ),
+        )
+    return client
+
+
+def close_clients() -> None:
+    """关闭同步的连接池 (异步客户端请使用 aclose_clients)。"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+async def aclose_clients() -> None:
+    """关闭同步的连接池和当前事件循环的异步客户端。"""
+    close_clients()
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _is_connect_failure(error: requests.exceptions.ConnectionError) -> bool:
+    """
+    连接是否在建立阶段就失败了 (请求体一定还没有发出，重发是安全的)。
+    其他连接错误 (例如发送之后 RemoteDisconnected) 时代码可能已经在内核中
+    执行了，重发会导致有状态的单元格执行两次。
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(reason, NewConnectionError)
 
 
-def execute_code_in_sandbox(code: str) -> dict:
+def _retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """
+    带“全抖动”(full jitter) 的指数退避。
+    如果服务器给出了 Retry-After，则至少等待那么久。
+    """
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2**attempt)))
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    return delay
+
+
+def _http_timeout(deadline: float) -> tuple:
+    """(连接超时, 读取超时)，读取超时不会超过整体截止时间。"""
+    remaining = max(deadline - time.monotonic(), 0.1)
+    return (min(CONNECT_TIMEOUT, remaining), remaining)
+
+
+def _payload(
+    code: str,
+    timeout: int,
+    session_id: str,
+    priority: str,
+    deadline: float,
+    create_session: bool = True,
+) -> Dict[str, Any]:
+    """
+    请求体。max_queue_wait 是剩余的排队预算: 后端不会在客户端放弃之后
+    才开始执行这个单元格。
+    """
+    remaining = deadline - time.monotonic() - timeout - DEADLINE_MARGIN
+    return {
+        "code": code,
+        "timeout": timeout,
+        "session_id": session_id,
+        "priority": priority,
+        "max_queue_wait": max(remaining, 0.0),
+        "create_session": create_session,
+    }
+
+
+def _error_result(message: str) -> Dict[str, Any]:
+    return {"result": message}
+
+
+def _session_missing_result(session_id: str) -> Dict[str, Any]:
+    # (create_session=False 并且会话没有活着的内核: 代码没有执行)
+    return {
+        "result": f"[MCP 错误] 会话 '{session_id}' 没有活着的内核，代码没有执行。",
+        "session_status": "missing",
+    }
+
+
+def _timed(call: str):
+    """记录一次 (同步或异步) 客户端调用的总耗时。"""
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with MCP_REQUEST_LATENCY.time(call=call):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with MCP_REQUEST_LATENCY.time(call=call):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@_timed("execute")
+def execute_code_in_sandbox(
+    code: str,
+    timeout: int = DEFAULT_EXEC_TIMEOUT,
+    session_id: str = "default",
+    priority: str = "interactive",
+    create_session: bool = True,
+) -> dict:
     """
     调用我们的 FastAPI/MCP 服务器来执行代码。
     这是 Agent 的“双手”。
+
+    timeout 是沙箱端的执行截止时间；HTTP 请求 (包括排队和所有重试)
+    会在 QUEUE_WAIT + timeout + DEADLINE_MARGIN 秒内结束。
+    create_session=False: 会话的内核已经丢失时不执行，
+    返回 session_status="missing" (调用方先重建并重放，再重新执行)。
     """
-    print(f"--- [MCP 客户端] 正在向沙箱发送代码 ---")
-    try:
-        response = requests.post(
-            f"{TOOL_SERVER_URL}/execute",
-            json={"code": code},
-            timeout=60,  # 增加超时以应对长时间运行的代码
+    logger.info("正在向沙箱发送代码", extra={"session_id": session_id})
+    deadline = time.monotonic() + QUEUE_WAIT + timeout + DEADLINE_MARGIN
+    session = _get_session()
+    last_error = None
+
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = session.post(
+                f"{TOOL_SERVER_URL}/execute",
+                json=_payload(
+                    code, timeout, session_id, priority, deadline, create_session
+                ),
+                timeout=_http_timeout(deadline),
+            )
+
+            if response.status_code == 200:
+                # 成功
+                return response.json()
+            if response.status_code == 409:
+                return _session_missing_result(session_id)
+
+            if response.status_code not in RETRYABLE_STATUS:
+                # API 服务器返回了一个 HTTP 错误 (不可重试)
+                return _error_result(
+                    f"[MCP 错误] 服务器返回状态 {response.status_code}: {response.text}"
+                )
+            last_error = f"服务器返回状态 {response.status_code}: {response.text}"
+            retry_after = response.headers.get("Retry-After")
+
+        except requests.exceptions.ConnectionError as e:
+            if not _is_connect_failure(e):
+                # (请求可能已经送达: 不重发)
+                return _error_result(f"[MCP 致命错误] 与沙箱服务器的连接中断: {e}")
+            last_error = f"无法连接: {e}"
+            retry_after = None
+        except requests.exceptions.Timeout:
+            # (不重试: 代码可能仍在内核中运行，重发会导致重复执行)
+            return _error_result(
+                f"[MCP 致命错误] 沙箱在截止时间内没有响应 (执行超时 {timeout} 秒)。"
+            )
+        except Exception as e:
+            return _error_result(f"[MCP 致命错误] 发生意外错误: {e}")
+
+        delay = _retry_delay(attempt, retry_after)
+        if attempt == MAX_RETRIES or time.monotonic() + delay >= deadline:
+            break
+        MCP_RETRIES.inc(call="execute")
+        logger.warning(
+            f"第 {attempt + 1} 次重试 ({delay:.2f} 秒后): {last_error}",
+            extra={"call": "execute"},
         )
+        time.sleep(delay)
 
-        if response.status_code == 200:
-            # 成功
-            return response.json()
-        else:
-            # API 服务器返回了一个 HTTP 错误
-            return {
-                "result": f"[MCP 错误] 服务器返回状态 {response.status_code}: {response.text}"
+    return _error_result(
+        "[MCP 致命错误] 无法连接到沙箱服务器 (FastAPI)。"
+        f"请确保 'backend/main.py' 正在运行。(最后的错误: {last_error})"
+    )
+
+
+@_timed("aexecute")
+async def aexecute_code_in_sandbox(
+    code: str,
+    timeout: int = DEFAULT_EXEC_TIMEOUT,
+    session_id: str = "default",
+    priority: str = "interactive",
+    create_session: bool = True,
+) -> dict:
+    """
+    execute_code_in_sandbox 的异步版本 (不会阻塞事件循环)。
+    """
+    import httpx
+
+    deadline = time.monotonic() + QUEUE_WAIT + timeout + DEADLINE_MARGIN
+    client = _get_async_client()
+    last_error = None
+
+    for attempt in range(MAX_RETRIES + 1):
+        connect_timeout, read_timeout = _http_timeout(deadline)
+        try:
+            response = await client.post(
+                "/execute",
+                json=_payload(
+                    code, timeout, session_id, priority, deadline, create_session
+                ),
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            )
+
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code == 409:
+                return _session_missing_result(session_id)
+
+            if response.status_code not in RETRYABLE_STATUS:
+                return _error_result(
+                    f"[MCP 错误] 服务器返回状态 {response.status_code}: {response.text}"
+                )
+            last_error = f"服务器返回状态 {response.status_code}: {response.text}"
+            retry_after = response.headers.get("Retry-After")
+
+        except httpx.ConnectError as e:
+            last_error = f"无法连接: {e}"
+            retry_after = None
+        except httpx.TimeoutException:
+            return _error_result(
+                f"[MCP 致命错误] 沙箱在截止时间内没有响应 (执行超时 {timeout} 秒)。"
+            )
+        except Exception as e:
+            return _error_result(f"[MCP 致命错误] 发生意外错误: {e}")
+
+        delay = _retry_delay(attempt, retry_after)
+        if attempt == MAX_RETRIES or time.monotonic() + delay >= deadline:
+            break
+        MCP_RETRIES.inc(call="aexecute")
+        await asyncio.sleep(delay)
+
+    return _error_result(
+        "[MCP 致命错误] 无法连接到沙箱服务器 (FastAPI)。"
+        f"请确保 'backend/main.py' 正在运行。(最后的错误: {last_error})"
+    )
+
+
+def stream_code_in_sandbox(
+    code: str,
+    timeout: int = DEFAULT_EXEC_TIMEOUT,
+    session_id: str = "default",
+    priority: str = "interactive",
+) -> Iterator[Dict[str, Any]]:
+    """
+    流式执行: 在输出产生时就逐条返回事件
+        {"type": "output", "text": ...}  ...  {"type": "result", "result": ..., ...}
+    (只在建立连接时重试；一旦开始流式传输就不会重发代码)
+    """
+    deadline = time.monotonic() + QUEUE_WAIT + timeout + DEADLINE_MARGIN
+    session = _get_session()
+    last_error = None
+    started = False
+
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            with session.post(
+                f"{TOOL_SERVER_URL}/execute/stream",
+                json=_payload(code, timeout, session_id, priority, deadline),
+                timeout=_http_timeout(deadline),
+                stream=True,
+            ) as response:
+                if response.status_code in RETRYABLE_STATUS:
+                    retry_after = response.headers.get("Retry-After")
+                    last_error = f"服务器返回状态 {response.status_code}"
+                elif response.status_code != 200:
+                    yield {
+                        "type": "result",
+                        "result": f"[MCP 错误] 服务器返回状态 {response.status_code}: {response.text}",
+                    }
+                    return
+                else:
+                    started = True
+                    for line in response.iter_lines(decode_unicode=True):
+                        if line:
+                            yield json.loads(line)
+                    return
+        except requests.exceptions.ConnectionError as e:
+            if started or not _is_connect_failure(e):
+                # (流已经开始或者请求可能已经送达: 代码可能已在执行，不能重发)
+                yield {"type": "result", "result": f"[MCP 致命错误] 流式连接中断: {e}"}
+                return
+            last_error = f"无法连接: {e}"
+            retry_after = None
+        except requests.exceptions.Timeout:
+            yield {
+                "type": "result",
+                "result": f"[MCP 致命错误] 沙箱在截止时间内没有响应 (执行超时 {timeout} 秒)。",
             }
+            return
+        except (requests.exceptions.ChunkedEncodingError, json.JSONDecodeError) as e:
+            # (响应在中途被截断: 不完整的分块或者半行 NDJSON)
+            yield {"type": "result", "result": f"[MCP 致命错误] 流式响应中断: {e}"}
+            return
+        except Exception as e:
+            yield {"type": "result", "result": f"[MCP 致命错误] 发生意外错误: {e}"}
+            return
 
-    except requests.exceptions.ConnectionError:
+        delay = _retry_delay(attempt, retry_after)
+        if attempt == MAX_RETRIES or time.monotonic() + delay >= deadline:
+            break
+        MCP_RETRIES.inc(call="stream")
+        time.sleep(delay)
+
+    yield {
+        "type": "result",
+        "result": f"[MCP 致命错误] 无法连接到沙箱服务器 (FastAPI)。(最后的错误: {last_error})",
+    }
+
+
+async def astream_code_in_sandbox(
+    code: str,
+    timeout: int = DEFAULT_EXEC_TIMEOUT,
+    session_id: str = "default",
+    priority: str = "interactive",
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    stream_code_in_sandbox 的异步版本。
+    """
+    import httpx
+
+    deadline = time.monotonic() + QUEUE_WAIT + timeout + DEADLINE_MARGIN
+    client = _get_async_client()
+    last_error = None
+    started = False
+
+    for attempt in range(MAX_RETRIES + 1):
+        connect_timeout, read_timeout = _http_timeout(deadline)
+        try:
+            async with client.stream(
+                "POST",
+                "/execute/stream",
+                json=_payload(code, timeout, session_id, priority, deadline),
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            ) as response:
+                if response.status_code in RETRYABLE_STATUS:
+                    retry_after = response.headers.get("Retry-After")
+                    last_error = f"服务器返回状态 {response.status_code}"
+                elif response.status_code != 200:
+                    body = (await response.aread()).decode("utf-8", "replace")
+                    yield {
+                        "type": "result",
+                        "result": f"[MCP 错误] 服务器返回状态 {response.status_code}: {body}",
+                    }
+                    return
+                else:
+                    started = True
+                    async for line in response.aiter_lines():
+                        if line:
+                            yield json.loads(line)
+                    return
+        except httpx.TimeoutException:
+            yield {
+                "type": "result",
+                "result": f"[MCP 致命错误] 沙箱在截止时间内没有响应 (执行超时 {timeout} 秒)。",
+            }
+            return
+        except httpx.TransportError as e:
+            if started or not isinstance(e, httpx.ConnectError):
+                yield {"type": "result", "result": f"[MCP 致命错误] 流式连接中断: {e}"}
+                return
+            last_error = f"无法连接: {e}"
+            retry_after = None
+        except json.JSONDecodeError as e:
+            yield {"type": "result", "result": f"[MCP 致命错误] 流式响应中断: {e}"}
+            return
+        except Exception as e:
+            yield {"type": "result", "result": f"[MCP 致命错误] 发生意外错误: {e}"}
+            return
+
+        delay = _retry_delay(attempt, retry_after)
+        if attempt == MAX_RETRIES or time.monotonic() + delay >= deadline:
+            break
+        MCP_RETRIES.inc(call="astream")
+        await asyncio.sleep(delay)
+
+    yield {
+        "type": "result",
+        "result": f"[MCP 致命错误] 无法连接到沙箱服务器 (FastAPI)。(最后的错误: {last_error})",
+    }
+
+
+@_timed("dataset_profile")
+def fetch_dataset_profile(name: str, target_column: str = None) -> dict:
+    """
+    从 FastAPI/MCP 服务器获取数据集画像 (服务器端有缓存)。
+    失败时返回 {"error": ...}，调用方可以选择跳过。
+    """
+    logger.info("正在获取数据集画像", extra={"dataset": name})
+    try:
+        response = _get_session().get(
+            f"{TOOL_SERVER_URL}/datasets/{quote(name, safe='')}/profile",
+            params={"target": target_column} if target_column else None,
+            timeout=(CONNECT_TIMEOUT, 300),  # 第一次计算大表的画像可能需要一些时间
+        )
+        if response.status_code == 200:
+            return response.json()
         return {
-            "result": "[MCP 致命错误] 无法连接到沙箱服务器 (FastAPI)。"
-            "请确保 'backend/main.py' 正在运行。"
+            "error": f"[MCP 错误] 服务器返回状态 {response.status_code}: {response.text}"
         }
+    except requests.exceptions.ConnectionError:
+        return {"error": "[MCP 致命错误] 无法连接到沙箱服务器 (FastAPI)。"}
     except Exception as e:
-        return {"result": f"[MCP 致命错误] 发生意外错误: {e}"}
+        return {"error": f"[MCP 致命错误] 发生意外错误: {e}"}
+
+
+@_timed("sandbox_session")
+def ensure_sandbox_session(session_id: str) -> dict:
+    """
+    确保服务器上有这个会话的内核: 如果它还活着就重新连接，否则重建一个。
+    返回 {"session_id": ..., "status": "attached" | "created"}，
+    失败时返回 {"error": ...}。
+    ("created" 意味着之前的内核状态 (变量、模型) 已经丢失)
+    (这个请求是幂等的: 连接失败和 RETRYABLE_STATUS 时带退避重试)
+    """
+    last_error = None
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = _get_session().post(
+                f"{TOOL_SERVER_URL}/sessions/{quote(session_id, safe='')}",
+                timeout=(CONNECT_TIMEOUT, 120),  # 重建 Docker 内核可能需要几秒
+            )
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code not in RETRYABLE_STATUS:
+                return {
+                    "error": f"[MCP 错误] 服务器返回状态 {response.status_code}: {response.text}"
+                }
+            last_error = f"服务器返回状态 {response.status_code}: {response.text}"
+            retry_after = response.headers.get("Retry-After")
+        except requests.exceptions.ConnectionError as e:
+            last_error = f"无法连接: {e}"
+            retry_after = None
+        except Exception as e:
+            return {"error": f"[MCP 致命错误] 发生意外错误: {e}"}
+
+        if attempt == MAX_RETRIES:
+            break
+        MCP_RETRIES.inc(call="sandbox_session")
+        time.sleep(_retry_delay(attempt, retry_after))
+
+    return {
+        "error": f"[MCP 致命错误] 无法连接到沙箱服务器 (FastAPI)。(最后的错误: {last_error})"
+    }
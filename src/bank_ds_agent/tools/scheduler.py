@@ -0,0 +1,256 @@
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from ..utils.metrics import REGISTRY
+
+# 优先级类别 (按顺序: 越靠前越优先)
+PRIORITIES = ("interactive", "batch")
+
+QUEUE_WAIT = REGISTRY.histogram(
+    "sandbox_queue_wait_seconds", "任务在调度队列中等待的时间 (秒)", ["priority"]
+)
+
+
+class QueueFullError(Exception):
+    """队列已满，客户端应在 retry_after 秒后重试 (HTTP 429)。"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueTimeoutError(Exception):
+    """任务在队列中等待的时间超过了 max_queue_wait (HTTP 503)。"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Job:
+    __slots__ = (
+        "session_id",
+        "priority",
+        "fn",
+        "future",
+        "enqueued_at",
+        "max_wait",
+        "queued",
+    )
+
+    def __init__(self, session_id, priority, fn, future, max_wait):
+        self.session_id = session_id
+        self.priority = priority
+        self.fn = fn
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.max_wait = max_wait
+        # 提交时没有空闲槽位、真正进入了队列 (只有这样的任务才会因等待超时而过期)
+        self.queued = False
+
+
+class FairScheduler:
+    """
+    沙箱后端的准入控制 + 公平排队。
+
+    - 有界队列: 每个会话最多 max_queue_per_session 个，全局最多 max_queue_total 个，
+      超出时立即拒绝 (QueueFullError -> 429 + Retry-After)
+    - 公平: 同一优先级内，在各会话之间轮询 (round-robin)
+    - 优先级: 'interactive' 优先于 'batch'，但每 batch_every 个交互任务
+      至少放行一个批处理任务，避免饿死
+    - 同一会话的任务严格串行 (内核是有状态的)
+    任务本身 (阻塞的 execute 调用) 在线程池中运行，不会阻塞事件循环。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 1,
+        max_queue_per_session: int = 4,
+        max_queue_total: int = 64,
+        batch_every: int = 4,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue_per_session = max_queue_per_session
+        self.max_queue_total = max_queue_total
+        self.batch_every = batch_every
+
+        # {优先级: {会话: 任务队列}} (OrderedDict 的顺序即轮询顺序)
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Job]]"] = {
+            p: OrderedDict() for p in PRIORITIES
+        }
+        self._queued = 0
+        self._running = 0
+        self._running_sessions: set = set()
+        self._interactive_streak = 0
+
+        # 统计 (用于 Retry-After 估算和队列深度指标)
+        self._avg_exec_seconds = 1.0
+        self.total_completed = 0
+        self.total_rejected = 0
+        self.total_expired = 0
+        self.last_queue_seconds = 0.0
+
+    # ------------------------------------------------------------------
+    # 提交
+    # ------------------------------------------------------------------
+    def _retry_after(self) -> int:
+        waiting = self._queued + self._running
+        estimate = self._avg_exec_seconds * (waiting + 1) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(estimate))
+
+    def session_depth(self, session_id: str) -> int:
+        return sum(
+            len(queues.get(session_id, ())) for queues in self._queues.values()
+        )
+
+    def submit(
+        self,
+        session_id: str,
+        fn: Callable[[], Any],
+        priority: str = "interactive",
+        max_wait: Optional[float] = None,
+    ) -> "asyncio.Future":
+        """
+        将一个阻塞函数加入队列，并返回一个 Future (await 它得到结果)。
+        超出容量时 *立即* 抛出 QueueFullError。必须在事件循环中调用。
+        max_wait=0 表示“现在有空闲槽位就运行，否则不排队”:
+        没有立即开始时 *立即* 抛出 QueueTimeoutError。
+        """
+        if priority not in self._queues:
+            raise ValueError(f"未知的优先级: '{priority}'。可选: {PRIORITIES}")
+
+        if self._queued >= self.max_queue_total:
+            self.total_rejected += 1
+            raise QueueFullError("沙箱全局队列已满。", self._retry_after())
+        if self.session_depth(session_id) >= self.max_queue_per_session:
+            self.total_rejected += 1
+            raise QueueFullError(
+                f"会话 '{session_id}' 的队列已满。", self._retry_after()
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(session_id, priority, fn, future, max_wait)
+        self._queues[priority].setdefault(session_id, deque()).append(job)
+        self._queued += 1
+        self._dispatch()
+
+        jobs = self._queues[priority].get(session_id)
+        if jobs and job in jobs:
+            # (没有被立即调度: 它要排队了)
+            if job.max_wait is not None and job.max_wait <= 0:
+                jobs.remove(job)
+                if not jobs:
+                    del self._queues[priority][session_id]
+                self._queued -= 1
+                self.total_expired += 1
+                raise QueueTimeoutError(
+                    "沙箱当前没有空闲槽位 (max_queue_wait=0，不排队)。",
+                    self._retry_after(),
+                )
+            job.queued = True
+        return future
+
+    # ------------------------------------------------------------------
+    # 调度
+    # ------------------------------------------------------------------
+    def _pop_from(self, priority: str) -> Optional[_Job]:
+        """在一个优先级内按轮询顺序取出下一个可运行的任务。"""
+        queues = self._queues[priority]
+        for session_id in list(queues):
+            if session_id in self._running_sessions:
+                continue
+            jobs = queues[session_id]
+            job = jobs.popleft()
+            if jobs:
+                queues.move_to_end(session_id)  # 轮到下一个会话
+            else:
+                del queues[session_id]
+            self._queued -= 1
+            return job
+        return None
+
+    def _next_job(self) -> Optional[_Job]:
+        batch_turn = self._interactive_streak >= self.batch_every
+        order = ("batch", "interactive") if batch_turn else PRIORITIES
+        for priority in order:
+            job = self._pop_from(priority)
+            if job is not None:
+                if priority == "interactive":
+                    self._interactive_streak += 1
+                else:
+                    self._interactive_streak = 0
+                return job
+        return None
+
+    def _dispatch(self) -> None:
+        while self._running < self.max_concurrency:
+            job = self._next_job()
+            if job is None:
+                return
+
+            if job.future.done():
+                # (客户端已经断开 / 被取消)
+                continue
+
+            waited = time.monotonic() - job.enqueued_at
+            if job.queued and job.max_wait is not None and waited > job.max_wait:
+                self.total_expired += 1
+                job.future.set_exception(
+                    QueueTimeoutError(
+                        f"任务在队列中等待了 {waited:.1f} 秒，超过了 {job.max_wait} 秒。",
+                        self._retry_after(),
+                    )
+                )
+                continue
+
+            self.last_queue_seconds = waited
+            QUEUE_WAIT.observe(waited, priority=job.priority)
+            self._running += 1
+            self._running_sessions.add(job.session_id)
+            asyncio.ensure_future(self._run(job))
+
+    async def _run(self, job: _Job) -> None:
+        loop = asyncio.get_running_loop()
+        start_time = time.monotonic()
+        try:
+            result = await loop.run_in_executor(None, job.fn)
+            if not job.future.done():
+                job.future.set_result(result)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            elapsed = time.monotonic() - start_time
+            # 指数加权平均，用于估算 Retry-After
+            self._avg_exec_seconds = 0.8 * self._avg_exec_seconds + 0.2 * elapsed
+            self.total_completed += 1
+            self._running -= 1
+            self._running_sessions.discard(job.session_id)
+            self._dispatch()
+
+    # ------------------------------------------------------------------
+    # 队列深度指标
+    # ------------------------------------------------------------------
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queued,
+            "running": self._running,
+            "max_concurrency": self.max_concurrency,
+            "queued_by_priority": {
+                p: sum(len(q) for q in queues.values())
+                for p, queues in self._queues.items()
+            },
+            "queued_by_session": {
+                session_id: self.session_depth(session_id)
+                for queues in self._queues.values()
+                for session_id in queues
+            },
+            "avg_exec_seconds": round(self._avg_exec_seconds, 3),
+            "last_queue_seconds": round(self.last_queue_seconds, 3),
+            "total_completed": self.total_completed,
+            "total_rejected": self.total_rejected,
+            "total_expired": self.total_expired,
+        }
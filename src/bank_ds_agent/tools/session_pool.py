@@ -0,0 +1,236 @@
+import math
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .kernel_executor import KernelExecutor
+from ..utils.logger import get_logger
+from ..utils.metrics import REGISTRY
+
+logger = get_logger(__name__)
+
+SESSION_EVENTS = REGISTRY.counter(
+    "sandbox_session_events_total",
+    "沙箱会话事件 (event=created/attached/rebuilt/evicted/closed)",
+    ["event"],
+)
+
+
+class SessionPoolFullError(Exception):
+    """所有会话都在使用中 (或刚刚用过)，不能为新会话腾出内核 (HTTP 429)。"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SessionMissingError(Exception):
+    """会话没有活着的内核，而调用方要求不要新建 (HTTP 409)。"""
+
+
+class _Session:
+    __slots__ = (
+        "session_id",
+        "executor",
+        "lock",
+        "created_at",
+        "last_used",
+        "in_use",
+        "retired",
+    )
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.executor: Optional[KernelExecutor] = None
+        # 内核客户端不是线程安全的: 同一会话同一时间只允许一个单元格在执行
+        self.lock = threading.Lock()
+        self.created_at = 0.0
+        self.last_used = time.monotonic()
+        # 已经取出、还没有归还的调用数 (在池的 _lock 下修改)，大于 0 时不能被淘汰
+        self.in_use = 0
+        # 已经从池中移除 (淘汰 / 关闭)。在 lock 下设置；之后不能再在它上面启动内核，
+        # 否则这个内核不属于任何会话，永远不会被清理
+        self.retired = False
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.cleanup()
+            self.executor = None
+
+    def retire(self) -> None:
+        """在持有 lock 时调用: 关闭内核，并标记这个会话对象不能再使用。"""
+        self.retired = True
+        self.close()
+
+
+class SandboxSessionPool:
+    """
+    每个沙箱会话 (session_id，Agent 中即 LangGraph 的 thread_id) 一个独立的内核。
+
+    - 会话的内核还活着时重新连接 (变量、模型都还在)；
+      内核已经死掉 (或者服务器重启后第一次访问) 时用 factory() 重建。
+    - 会话数达到 max_sessions 时，关闭最久没有使用的 *空闲* 会话 (LRU) 来腾出位置:
+      正在执行或者 idle_grace 秒内用过的会话不会被淘汰 (否则两个交替运行的
+      会话会不断地互相淘汰、重放)。没有可以淘汰的会话时抛出 SessionPoolFullError。
+    - 执行器的清理由池负责 (close / close_all)，服务器关闭时调用 close_all()。
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], KernelExecutor],
+        max_sessions: int = 4,
+        idle_grace: float = 60.0,
+    ):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_grace = idle_grace
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evictable(self, session: _Session, now: float) -> bool:
+        return session.in_use == 0 and now - session.last_used >= self.idle_grace
+
+    def _retry_after(self, now: float) -> int:
+        """估算多久之后会有会话可以被淘汰 (秒)。"""
+        waits = [
+            self.idle_grace - (now - s.last_used)
+            for s in self._sessions.values()
+            if s.in_use == 0
+        ]
+        return max(1, math.ceil(min(waits) if waits else self.idle_grace))
+
+    def _get_or_add(
+        self, session_id: str, create: bool = True
+    ) -> Tuple[_Session, List[_Session]]:
+        """取出 (或新建) 会话并把它标记为使用中。调用方必须用 _release 归还。"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            evicted = []
+            if session is None:
+                if not create:
+                    raise SessionMissingError(f"会话 '{session_id}' 没有内核。")
+                now = time.monotonic()
+                # (按 LRU 顺序，只淘汰空闲的会话)
+                for old in list(self._sessions.values()):
+                    if len(self._sessions) - len(evicted) < self.max_sessions:
+                        break
+                    if self._evictable(old, now):
+                        evicted.append(old)
+                if len(self._sessions) - len(evicted) >= self.max_sessions:
+                    raise SessionPoolFullError(
+                        f"沙箱会话已满 (max_sessions={self.max_sessions})，"
+                        "所有会话都在使用中或刚刚用过。",
+                        self._retry_after(now),
+                    )
+                for old in evicted:
+                    del self._sessions[old.session_id]
+                session = self._sessions[session_id] = _Session(session_id)
+            self._sessions.move_to_end(session_id)
+            session.in_use += 1
+            return session, evicted
+
+    def _release(self, session: _Session) -> None:
+        with self._lock:
+            session.in_use -= 1
+            session.last_used = time.monotonic()
+
+    def _ensure_locked(self, session: _Session, create: bool = True) -> str:
+        """在持有 session.lock 时调用。返回 "attached" / "created" / "rebuilt"。"""
+        if session.executor is not None:
+            if session.executor.is_alive():
+                return "attached"
+            logger.warning(
+                "会话内核已经死掉", extra={"session_id": session.session_id}
+            )
+            session.close()
+            status = "rebuilt"
+        else:
+            status = "created"
+
+        if not create:
+            raise SessionMissingError(f"会话 '{session.session_id}' 没有活着的内核。")
+        session.executor = self.factory()
+        session.created_at = time.time()
+        return status
+
+    @contextmanager
+    def session(
+        self, session_id: str, create: bool = True
+    ) -> Iterator[Tuple[KernelExecutor, str]]:
+        """
+        with pool.session("thread-1") as (executor, status):
+            executor.execute(...)
+        在 with 块内独占这个会话的内核。
+        create=False: 会话没有活着的内核时抛出 SessionMissingError，而不是新建一个
+        (调用方需要先重建并重放之前的单元格，再执行新的代码)。
+        """
+        while True:
+            session, evicted = self._get_or_add(session_id, create)
+            for old in evicted:
+                with old.lock:
+                    old.retire()
+                SESSION_EVENTS.inc(event="evicted")
+                logger.info("会话已被淘汰 (LRU)", extra={"session_id": old.session_id})
+
+            session.lock.acquire()
+            if not session.retired:
+                break
+            # (在等待锁的时候，这个会话被另一个线程关闭了: 重新获取)
+            session.lock.release()
+            self._release(session)
+
+        try:
+            status = self._ensure_locked(session, create)
+            SESSION_EVENTS.inc(event=status)
+            yield session.executor, status
+        finally:
+            session.lock.release()
+            self._release(session)
+
+    def ensure(self, session_id: str) -> Dict[str, str]:
+        """重新连接或重建会话的内核 (不执行代码)。"""
+        with self.session(session_id) as (executor, status):
+            return {
+                "session_id": session_id,
+                # ("rebuilt" 对调用方来说与 "created" 相同: 之前的内核状态已经丢失)
+                "status": "attached" if status == "attached" else "created",
+                "backend": executor.backend_name,
+            }
+
+    def close(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        with session.lock:
+            session.retire()
+        SESSION_EVENTS.inc(event="closed")
+        return True
+
+    def close_all(self) -> None:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            with session.lock:
+                session.retire()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> List[Dict[str, object]]:
+        now = time.monotonic()
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return [
+            {
+                "session_id": s.session_id,
+                "started": s.executor is not None,
+                "busy": s.in_use > 0,
+                "created_at": s.created_at,
+                "idle_seconds": round(now - s.last_used, 1),
+            }
+            for s in sessions
+        ]
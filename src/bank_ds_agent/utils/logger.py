@@ -0,0 +1,96 @@
+import os
+import json
+import logging
+
+# ----------------------------------------------------------------------
+# 分级的结构化日志 (替代散落在各处的 print)
+#
+# 环境变量:
+#   AGENT_LOG_LEVEL   = DEBUG / INFO (默认) / WARNING / ERROR / OFF
+#   AGENT_LOG_FORMAT  = text (默认，key=value) / json
+#
+# 使用方式:
+#   logger = get_logger(__name__)
+#   logger.info("代码执行完成", extra={"node": "code_executor", "bytes": 1024})
+# ----------------------------------------------------------------------
+
+ROOT_LOGGER_NAME = "bank_ds_agent"
+
+# logging.LogRecord 自带的属性 (不属于我们的结构化字段)
+_RESERVED = set(
+    logging.LogRecord("", 0, "", 0, "", (), None).__dict__
+) | {"message", "asctime"}
+
+
+def _fields(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in record.__dict__.items() if k not in _RESERVED}
+
+
+class StructuredFormatter(logging.Formatter):
+    """text: '时间 级别 logger 消息 key=value ...'；json: 每行一个 JSON 对象。"""
+
+    def __init__(self, fmt_type: str = "text"):
+        super().__init__()
+        self.fmt_type = fmt_type
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = _fields(record)
+        message = record.getMessage()
+        if self.fmt_type == "json":
+            payload = {
+                "ts": round(record.created, 3),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": message,
+                **fields,
+            }
+            if record.exc_info:
+                payload["exc"] = self.formatException(record.exc_info)
+            return json.dumps(payload, ensure_ascii=False, default=str)
+
+        line = (
+            f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} "
+            f"{record.name} {message}"
+        )
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging(level: str = None, fmt_type: str = None) -> None:
+    """
+    (重新) 配置整个 'bank_ds_agent' 日志树。可以多次调用。
+    """
+    level = (level or os.getenv("AGENT_LOG_LEVEL", "INFO")).upper()
+    fmt_type = (fmt_type or os.getenv("AGENT_LOG_FORMAT", "text")).lower()
+
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.propagate = False
+
+    if level == "OFF":
+        root.addHandler(logging.NullHandler())
+        root.setLevel(logging.CRITICAL + 1)
+        return
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter(fmt_type))
+    root.addHandler(handler)
+    root.setLevel(getattr(logging, level, logging.INFO))
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    返回 'bank_ds_agent' 树下的一个 logger (第一次调用时完成配置)。
+    name 通常是 __name__，例如 'src.bank_ds_agent.agent.nodes.planner'。
+    """
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    if not root.handlers:
+        configure_logging()
+    short_name = name.rsplit("bank_ds_agent.", 1)[-1]
+    if short_name == ROOT_LOGGER_NAME:
+        return root
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{short_name}")
@@ -0,0 +1,132 @@
+import importlib
+import os
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.bank_ds_agent.tools.scheduler import FairScheduler
+
+
+@pytest.fixture(scope="module")
+def backend(tmp_path_factory):
+    # (本地内核后端: 不需要 Docker)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("EXECUTOR_BACKEND", "local")
+        patch.setenv("AGENT_DATASETS_DIR", str(tmp_path_factory.mktemp("datasets")))
+        patch.setenv("AGENT_DATASET_IMPORT_ROOT", str(tmp_path_factory.mktemp("imports")))
+        backend_main = importlib.import_module("backend.main")
+        with TestClient(backend_main.app) as client:
+            yield backend_main, client
+
+
+@pytest.fixture
+def client(backend, monkeypatch):
+    backend_main, client = backend
+    monkeypatch.setattr(backend_main, "scheduler", FairScheduler(max_concurrency=1))
+    return client
+
+
+def test_sessions_are_isolated_and_report_status(client):
+    first = client.post("/execute", json={"code": "x = 41", "session_id": "t1"})
+    assert first.json()["session_status"] == "created"
+    second = client.post("/execute", json={"code": "print(x + 1)", "session_id": "t1"})
+    assert second.json()["result"] == "[stdout] 42\n"
+    assert second.json()["session_status"] == "attached"
+
+    other = client.post("/execute", json={"code": "print(x)", "session_id": "t2"})
+    assert "NameError" in other.json()["result"]
+
+    assert client.delete("/sessions/t1").status_code == 200
+    assert client.delete("/sessions/t1").status_code == 404
+
+
+def test_full_queue_returns_429_with_retry_after(backend, client, monkeypatch):
+    backend_main, _ = backend
+    monkeypatch.setattr(backend_main, "scheduler", FairScheduler(max_queue_total=0))
+    response = client.post("/execute", json={"code": "1"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_zero_queue_wait(backend, client):
+    backend_main, _ = backend
+    # 空闲时 max_queue_wait=0 的任务正常执行
+    idle = client.post("/execute", json={"code": "print(1)", "max_queue_wait": 0})
+    assert idle.status_code == 200 and idle.json()["result"] == "[stdout] 1\n"
+
+    # 忙碌时立即拒绝: /execute 和 /execute/stream 都返回 503 + Retry-After
+    busy = threading.Thread(
+        target=client.post,
+        args=("/execute",),
+        kwargs={"json": {"code": "import time; time.sleep(1)", "session_id": "busy"}},
+    )
+    busy.start()
+    deadline = time.monotonic() + 5
+    while backend_main.scheduler.stats()["running"] == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    for path in ("/execute", "/execute/stream"):
+        response = client.post(
+            path, json={"code": "print(2)", "session_id": "s2", "max_queue_wait": 0}
+        )
+        assert response.status_code == 503, path
+        assert int(response.headers["Retry-After"]) >= 1
+    busy.join(10)
+
+
+def test_create_session_false_never_runs_on_a_new_kernel(client):
+    request = {"code": "print(1)", "session_id": "lost", "create_session": False}
+    assert client.post("/execute", json=request).status_code == 409
+    assert client.post("/execute/stream", json=request).status_code == 409
+
+    assert client.post("/sessions/lost").json()["status"] == "created"
+    response = client.post("/execute", json=request)
+    assert response.status_code == 200
+    assert response.json()["session_status"] == "attached"
+    client.delete("/sessions/lost")
+
+
+def test_session_creation_goes_through_admission(backend, client, monkeypatch):
+    backend_main, _ = backend
+    monkeypatch.setattr(backend_main, "scheduler", FairScheduler(max_queue_total=0))
+    response = client.post("/sessions/new-thread")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert "new-thread" not in [s["session_id"] for s in client.get("/sessions").json()]
+
+
+def test_full_session_pool_returns_429_instead_of_evicting(backend, client, monkeypatch):
+    backend_main, _ = backend
+    # (所有现有会话都刚刚用过: 不能淘汰)
+    monkeypatch.setattr(backend_main.pool, "max_sessions", len(backend_main.pool))
+    before = client.get("/sessions").json()
+    for response in (
+        client.post("/sessions/one-too-many"),
+        client.post("/execute", json={"code": "1", "session_id": "one-too-many"}),
+    ):
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+    assert [s["session_id"] for s in client.get("/sessions").json()] == [
+        s["session_id"] for s in before
+    ]
+
+
+def test_dataset_sources_are_confined_to_the_import_root(backend, client, tmp_path):
+    backend_main, _ = backend
+    import_root = backend_main.DATASET_IMPORT_ROOT
+    with open(os.path.join(import_root, "loans.csv"), "w", encoding="utf-8") as f:
+        f.write("balance,segment\n1,retail\n2,corporate\n")
+    outside = tmp_path / "secret.csv"
+    outside.write_text("a\n1\n", encoding="utf-8")
+    os.symlink(outside, os.path.join(import_root, "link.csv"))
+
+    response = client.post("/datasets", json={"name": "loans", "source_path": "loans.csv"})
+    assert response.status_code == 200 and response.json()["num_rows"] == 2
+    for source_path in (str(outside), "../secret.csv", "link.csv", "/etc/passwd"):
+        response = client.post(
+            "/datasets", json={"name": "x", "source_path": source_path}
+        )
+        assert response.status_code == 403, source_path
@@ -0,0 +1,72 @@
+import json
+
+from benchmarks.run_agent_benchmark import (
+    compare_with_baseline,
+    main,
+    parse_args,
+    run_benchmark,
+)
+
+# 小规模的离线基准测试 (假 LLM + 进程内内核)，几秒内跑完，每个 PR 都会运行
+SMOKE_ARGS = ["--runs", "1", "--iterations", "3", "--probe-samples", "2"]
+
+
+def test_benchmark_runs_against_baseline(tmp_path):
+    baseline_path = tmp_path / "baseline.json"
+    assert main(SMOKE_ARGS + ["--output", str(baseline_path)]) == 0
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    assert baseline["iterations_per_second"] > 0
+    assert {"planner", "code_generator", "code_executor", "reflection"} <= set(
+        baseline["node_latency_seconds"]
+    )
+    assert baseline["config"]["checkpointer"] == "SQLiteCheckpointSaver"
+
+    # (这么小的运行抖动很大: 这里只检查 --baseline 的流程，以及数量级的退化)
+    argv = SMOKE_ARGS + [
+        "--baseline",
+        str(baseline_path),
+        "--max-regression",
+        "0.9",
+        "--output",
+        str(tmp_path / "report.json"),
+    ]
+    assert main(argv) == 0
+
+
+def test_benchmark_flags_regression():
+    report = run_benchmark(parse_args(SMOKE_ARGS + ["--checkpoint-db", "off"]))
+    assert report["config"]["checkpointer"] is None
+
+    faster = dict(report, iterations_per_second=report["iterations_per_second"] * 10)
+    failures, _ = compare_with_baseline(report, faster, max_regression=0.25)
+    assert failures and failures[0].startswith("iterations_per_second")
+    assert compare_with_baseline(report, report, max_regression=0.25)[0] == []
+
+    # (deterministic: 吞吐量只报告；节点执行次数和状态大小仍然判定)
+    failures, notes = compare_with_baseline(
+        report, faster, max_regression=0.25, gate="deterministic"
+    )
+    assert failures == [] and notes[0].startswith("iterations_per_second")
+    smaller = dict(
+        report,
+        state_memory=dict(
+            report["state_memory"],
+            final_state_bytes=report["state_memory"]["final_state_bytes"] // 2,
+        ),
+    )
+    failures, _ = compare_with_baseline(
+        report, smaller, max_regression=0.25, gate="deterministic"
+    )
+    assert failures and failures[0].startswith("final_state_bytes")
+
+
+def test_deterministic_metrics_are_stable():
+    reports = [
+        run_benchmark(parse_args(SMOKE_ARGS + ["--checkpoint-db", "off"]))
+        for _ in range(2)
+    ]
+    failures, _ = compare_with_baseline(
+        reports[1], reports[0], max_regression=0.0, gate="deterministic"
+    )
+    assert failures == []
@@ -0,0 +1,146 @@
+import threading
+from typing import Annotated, TypedDict
+
+import pytest
+from langchain_core.messages import AIMessage, BaseMessage
+from langgraph.graph import END, StateGraph
+from langgraph.graph.message import add_messages
+
+from src.bank_ds_agent.agent.checkpoint import SQLiteCheckpointSaver
+
+
+class _State(TypedDict):
+    messages: Annotated[list[BaseMessage], add_messages]
+    steps: int
+
+
+def _build_graph(saver, total_steps, crash_at=None):
+    """每一步追加一条消息，直到 total_steps；crash_at 模拟进程在那一步崩溃。"""
+
+    def step(state: _State) -> dict:
+        n = state.get("steps", 0) + 1
+        if crash_at is not None and n == crash_at:
+            raise RuntimeError("模拟崩溃")
+        return {"messages": [AIMessage(content=f"step {n}", id=f"m{n}")], "steps": n}
+
+    workflow = StateGraph(_State)
+    workflow.add_node("step", step)
+    workflow.set_entry_point("step")
+    workflow.add_conditional_edges(
+        "step", lambda s: "done" if s["steps"] >= total_steps else "again",
+        {"again": "step", "done": END},
+    )
+    return workflow.compile(checkpointer=saver)
+
+
+def _config(thread_id):
+    return {"configurable": {"thread_id": thread_id}, "recursion_limit": 200}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "checkpoints.sqlite")
+
+
+def test_round_trip_from_a_new_saver(db_path):
+    saver = SQLiteCheckpointSaver(db_path)
+    _build_graph(saver, 10).invoke({"messages": [], "steps": 0}, _config("t1"))
+    saver.close()
+
+    reopened = _build_graph(SQLiteCheckpointSaver(db_path), 10)
+    state = reopened.get_state(_config("t1"))
+    assert state.values["steps"] == 10
+    assert [m.content for m in state.values["messages"]] == [
+        f"step {i}" for i in range(1, 11)
+    ]
+    assert state.next == ()
+
+
+def test_messages_are_stored_as_bounded_delta_chains(db_path):
+    saver = SQLiteCheckpointSaver(db_path, snapshot_every=5)
+    _build_graph(saver, 30).invoke({"messages": [], "steps": 0}, _config("t1"))
+
+    rows = saver.conn.execute(
+        "SELECT base_version, depth FROM blobs WHERE channel = 'messages'"
+    ).fetchall()
+    snapshots = [r for r in rows if r[0] is None]
+    deltas = [r for r in rows if r[0] is not None]
+    assert deltas and len(snapshots) < len(deltas)
+    assert max(depth for _, depth in rows) <= 5
+
+    # 每个历史检查点都能完整地重建 (沿 base_version 链)
+    history = list(_build_graph(saver, 30).get_state_history(_config("t1")))
+    lengths = sorted(len(s.values.get("messages", [])) for s in history)
+    assert lengths[-1] == 30
+    assert set(range(0, 31)) <= set(lengths)
+
+
+def test_resume_after_crash_continues_from_last_checkpoint(db_path):
+    crashing = _build_graph(SQLiteCheckpointSaver(db_path), 20, crash_at=8)
+    with pytest.raises(RuntimeError):
+        crashing.invoke({"messages": [], "steps": 0}, _config("t1"))
+
+    # (新进程: 新的检查点实例，增量缓存为空)
+    resumed = _build_graph(SQLiteCheckpointSaver(db_path), 20)
+    assert resumed.get_state(_config("t1")).next == ("step",)
+    resumed.invoke(None, _config("t1"))
+
+    messages = resumed.get_state(_config("t1")).values["messages"]
+    assert [m.content for m in messages] == [f"step {i}" for i in range(1, 21)]
+
+
+def test_list_filter_limit_and_delete_thread(db_path):
+    saver = SQLiteCheckpointSaver(db_path)
+    graph = _build_graph(saver, 3)
+    graph.invoke({"messages": [], "steps": 0}, _config("a"))
+    graph.invoke({"messages": [], "steps": 0}, _config("b"))
+
+    assert len(list(saver.list(_config("a"), limit=2))) == 2
+    loops = list(saver.list(_config("a"), filter={"source": "loop"}))
+    assert loops and all(c.metadata["source"] == "loop" for c in loops)
+
+    saver.delete_thread("a")
+    assert saver.get_tuple(_config("a")) is None
+    assert saver.get_tuple(_config("b")) is not None
+
+
+def test_partial_list_iteration_does_not_hold_the_lock(db_path):
+    saver = SQLiteCheckpointSaver(db_path)
+    _build_graph(saver, 3).invoke({"messages": [], "steps": 0}, _config("a"))
+
+    iterator = saver.list(_config("a"))
+    next(iterator)  # (调用方在迭代中途停下)
+
+    other = threading.Thread(target=saver.get_tuple, args=(_config("a"),))
+    other.start()
+    other.join(timeout=5)
+    assert not other.is_alive()
+
+
+def test_delta_cache_is_bounded(db_path):
+    saver = SQLiteCheckpointSaver(db_path, max_cached_lists=2)
+    graph = _build_graph(saver, 4)
+    for thread_id in ("a", "b", "c", "d"):
+        graph.invoke({"messages": [], "steps": 0}, _config(thread_id))
+    assert len(saver._last_lists) <= 2
+
+    # (被淘汰的线程继续写入时退回完整快照，仍然可以正确读取)
+    longer = _build_graph(saver, 6)
+    longer.invoke({"messages": []}, _config("a"))
+    messages = longer.get_state(_config("a")).values["messages"]
+    assert [m.content for m in messages] == [f"step {i}" for i in range(1, 7)]
+
+
+def test_persistence_is_opt_in(db_path, monkeypatch):
+    from src.bank_ds_agent.agent import graph as graph_module
+
+    assert graph_module.create_agent_graph().checkpointer is None
+    assert graph_module.app.checkpointer is None
+
+    monkeypatch.setenv("AGENT_CHECKPOINT_DB", db_path)
+    persistent = graph_module.create_persistent_graph()
+    assert isinstance(persistent.checkpointer, SQLiteCheckpointSaver)
+    persistent.checkpointer.close()
+
+    monkeypatch.setenv("AGENT_CHECKPOINT_DB", "off")
+    assert graph_module.create_persistent_graph().checkpointer is None
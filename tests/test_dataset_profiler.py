@@ -0,0 +1,39 @@
+import json
+
+import pyarrow as pa
+import pytest
+
+from src.bank_ds_agent.tools.dataset_profiler import profile_table, render_profile
+
+
+def test_nested_columns_are_marked_unsupported():
+    table = pa.table(
+        {
+            "tags": pa.array([["a", "b"], ["c"], None]),
+            "address": pa.array([{"city": "x"}, {"city": "y"}, None]),
+            "amount": pa.array([1, 2, 3]),
+        }
+    )
+    profile = profile_table(table)
+    for name in ("tags", "address"):
+        assert profile["columns"][name]["unsupported"]
+        assert profile["columns"][name]["null_rate"] == pytest.approx(1 / 3)
+    assert profile["columns"]["amount"]["mean"] == 2
+    assert "(不支持统计的类型)" in render_profile("t", profile)
+
+    with pytest.raises(ValueError):
+        profile_table(table, target_column="tags")
+
+
+def test_non_finite_statistics_become_none():
+    table = pa.table(
+        {
+            "ratio": pa.array([1.0, float("inf"), float("nan")]),
+            "empty": pa.array([float("nan")] * 3),
+        }
+    )
+    profile = profile_table(table)
+    # (画像会被缓存为严格的 JSON)
+    json.dumps(profile, allow_nan=False)
+    assert profile["columns"]["ratio"]["quantiles"]["1.0"] is None
+    assert profile["columns"]["empty"]["mean"] is None
@@ -0,0 +1,76 @@
+import os
+
+import pyarrow.ipc as pa_ipc
+import pytest
+
+from src.bank_ds_agent.tools.dataset_registry import DatasetRegistry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return DatasetRegistry(str(tmp_path / "registry"))
+
+
+def _write_csv(path, rows, header="balance,segment"):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(header + "\n")
+        for row in rows:
+            f.write(",".join(str(v) for v in row) + "\n")
+    return str(path)
+
+
+def test_register_converts_once_and_reuses_cache(registry, tmp_path):
+    source = _write_csv(tmp_path / "loans.csv", [(i, "retail") for i in range(100)])
+    entry = registry.register("loans", source)
+    assert entry["num_rows"] == 100
+    assert registry.register("loans", source)["registered_at"] == entry["registered_at"]
+
+    with pa_ipc.open_file(registry.path_of("loans")) as reader:
+        assert reader.read_all().num_rows == 100
+
+
+def test_csv_types_are_inferred_from_the_whole_file(registry, tmp_path, monkeypatch):
+    # (前面几十万行看起来都是整数，最后一行是小数和字符串；
+    #  第三列在第一个块里全部为空)
+    rows = [(i, i, "") for i in range(300_000)] + [("1.5", "corporate", 7)]
+    source = _write_csv(tmp_path / "txns.csv", rows, header="balance,segment,late")
+    # (退回时也必须流式读取，不能把整个文件载入内存)
+    monkeypatch.setattr(
+        "pyarrow.csv.read_csv", lambda *a, **k: pytest.fail("read_csv 读取了整个文件")
+    )
+
+    entry = registry.register("txns", source)
+    assert entry["num_rows"] == 300_001
+    assert entry["columns"] == {"balance": "double", "segment": "string", "late": "int64"}
+    with pa_ipc.open_file(registry.path_of("txns")) as reader:
+        table = reader.read_all()
+    assert table.column("balance")[-1].as_py() == 1.5
+    assert table.column("late").null_count == 300_000
+
+
+@pytest.mark.parametrize("name", ["", ".hidden", "-x", "a/b", "a\\b", "贷款", "x" * 65])
+def test_dataset_names_are_whitelisted(registry, tmp_path, name):
+    source = _write_csv(tmp_path / "x.csv", [(1, "a")])
+    with pytest.raises(ValueError):
+        registry.register(name, source)
+
+
+def test_failed_conversion_leaves_no_temp_file(registry, tmp_path):
+    source = tmp_path / "broken.csv"
+    source.write_text('a,b\n1,2\n"unterminated,3\n', encoding="utf-8")
+    with pytest.raises(Exception):
+        registry.register("broken", str(source))
+    assert not any(name.endswith(".tmp") for name in os.listdir(registry.root_dir))
+    assert registry.list_datasets() == []
+
+
+def test_dropping_profiles_keeps_datasets_with_a_shared_prefix(registry, tmp_path):
+    source = _write_csv(tmp_path / "x.csv", [(1, "a"), (2, "b")])
+    registry.register("a", source)
+    registry.register("a.b", source)
+    registry.profile("a")
+    registry.profile("a.b")
+
+    registry.unregister("a")
+    profiles = [n for n in os.listdir(registry.root_dir) if n.endswith(".profile.json")]
+    assert len(profiles) == 1 and profiles[0].startswith("a.b.")
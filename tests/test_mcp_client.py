@@ -0,0 +1,128 @@
+import asyncio
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.bank_ds_agent.tools import mcp_client
+
+
+class _SandboxStub(BaseHTTPRequestHandler):
+    """
+    一个最小的沙箱服务器替身。单元格代码决定它的行为:
+      "drop"       -> 读完请求体后断开连接 (不返回响应)
+      "trunc"      -> 流式响应在半行 NDJSON 处结束
+      "status:NNN" -> 返回状态码 NNN
+      其他          -> 正常返回
+    """
+
+    protocol_version = "HTTP/1.1"
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, payload):
+        payload = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.startswith("/sessions/"):
+            self.requests_seen.append((self.path, None))
+            self._reply(200, {"status": "attached"})
+            return
+        body = json.loads(raw)
+        self.requests_seen.append((self.path, body["code"]))
+        if body["code"].startswith("status:"):
+            self._reply(int(body["code"][7:]), {"detail": body["code"]})
+            return
+        if body["code"] == "drop":
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        if body["code"] == "trunc":
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            chunk = b'{"type": "output", "te'
+            self.wfile.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(chunk), chunk))
+            return
+        self._reply(200, {"result": f"[stdout] {body['code']}\n"})
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SandboxStub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    _SandboxStub.requests_seen = []
+    monkeypatch.setattr(
+        mcp_client, "TOOL_SERVER_URL", f"http://127.0.0.1:{server.server_port}"
+    )
+    yield _SandboxStub.requests_seen
+    mcp_client.close_clients()
+    server.shutdown()
+    server.server_close()
+
+
+def test_execute_round_trip(stub_server):
+    assert mcp_client.execute_code_in_sandbox("1")["result"] == "[stdout] 1\n"
+
+
+def test_request_that_may_have_been_delivered_is_not_resent(stub_server):
+    result = mcp_client.execute_code_in_sandbox("drop")
+    assert result["result"].startswith("[MCP 致命错误]")
+    assert stub_server == [("/execute", "drop")]
+
+
+def test_connect_failures_are_retried(monkeypatch):
+    with socket.socket() as sock:  # (一个没有人监听的端口)
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    monkeypatch.setattr(mcp_client, "TOOL_SERVER_URL", f"http://127.0.0.1:{port}")
+    monkeypatch.setattr(mcp_client, "MAX_RETRIES", 2)
+    monkeypatch.setattr(mcp_client, "BACKOFF_BASE", 0.01)
+    retries = mcp_client.MCP_RETRIES.value(call="execute")
+
+    result = mcp_client.execute_code_in_sandbox("1")
+    assert "无法连接到沙箱服务器" in result["result"]
+    assert mcp_client.MCP_RETRIES.value(call="execute") - retries == 2
+
+
+def test_only_pre_execution_rejections_are_retried(stub_server, monkeypatch):
+    monkeypatch.setattr(mcp_client, "MAX_RETRIES", 1)
+    monkeypatch.setattr(mcp_client, "BACKOFF_BASE", 0.01)
+
+    # (502 / 504 来自代理: 单元格可能已经执行过，不能重发)
+    for status in (502, 504):
+        result = mcp_client.execute_code_in_sandbox(f"status:{status}")
+        assert result["result"].startswith(f"[MCP 错误] 服务器返回状态 {status}")
+    assert len(stub_server) == 2
+
+    stub_server.clear()
+    mcp_client.execute_code_in_sandbox("status:503")
+    assert len(stub_server) == 2
+
+
+def test_session_id_is_quoted(stub_server):
+    assert mcp_client.ensure_sandbox_session("a/b c?x")["status"] == "attached"
+    assert stub_server == [("/sessions/a%2Fb%20c%3Fx", None)]
+
+
+def test_truncated_stream_becomes_a_result_event(stub_server):
+    events = list(mcp_client.stream_code_in_sandbox("trunc"))
+    assert len(events) == 1 and events[0]["type"] == "result"
+    assert events[0]["result"].startswith("[MCP 致命错误]")
+
+
+def test_async_client_works_across_event_loops(stub_server):
+    for code in ("1", "2"):
+        result = asyncio.run(mcp_client.aexecute_code_in_sandbox(code))
+        assert result["result"] == f"[stdout] {code}\n"
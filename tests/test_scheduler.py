@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.bank_ds_agent.tools.scheduler import (
+    FairScheduler,
+    QueueFullError,
+    QueueTimeoutError,
+)
+
+
+def _job(order, name, seconds=0.0):
+    def run():
+        order.append(name)
+        time.sleep(seconds)
+        return name
+
+    return run
+
+
+def test_round_robin_between_sessions():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1)
+        order = []
+        futures = [scheduler.submit("a", _job(order, "a1", 0.05))]
+        futures += [scheduler.submit("a", _job(order, name)) for name in ("a2", "a3")]
+        futures += [scheduler.submit("b", _job(order, name)) for name in ("b1", "b2")]
+        await asyncio.gather(*futures)
+        return order
+
+    assert asyncio.run(main()) == ["a1", "a2", "b1", "a3", "b2"]
+
+
+def test_interactive_first_without_starving_batch():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1, batch_every=2)
+        order = []
+        futures = [
+            scheduler.submit("blocker", _job(order, "blocker", 0.05), priority="batch")
+        ]
+        futures.append(scheduler.submit("b", _job(order, "batch"), priority="batch"))
+        futures += [
+            scheduler.submit(f"s{i}", _job(order, f"i{i}")) for i in range(4)
+        ]
+        await asyncio.gather(*futures)
+        return order
+
+    # (每 2 个交互任务至少放行一个批处理任务)
+    assert asyncio.run(main()) == ["blocker", "i0", "i1", "batch", "i2", "i3"]
+
+
+def test_same_session_never_runs_concurrently():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=4)
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def run():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+
+        await asyncio.gather(*(scheduler.submit("same", run) for _ in range(4)))
+        return peak[0]
+
+    assert asyncio.run(main()) == 1
+
+
+def test_full_queues_are_rejected_with_retry_after():
+    async def main():
+        scheduler = FairScheduler(
+            max_concurrency=1, max_queue_per_session=1, max_queue_total=2
+        )
+        futures = [scheduler.submit("a", _job([], "running", 0.05))]
+        futures.append(scheduler.submit("a", _job([], "queued")))
+        with pytest.raises(QueueFullError) as per_session:
+            scheduler.submit("a", _job([], "rejected"))
+
+        futures.append(scheduler.submit("b", _job([], "queued")))
+        with pytest.raises(QueueFullError) as total:
+            scheduler.submit("c", _job([], "rejected"))
+        await asyncio.gather(*futures)
+        return per_session.value, total.value, scheduler
+
+    per_session, total, scheduler = asyncio.run(main())
+    assert per_session.retry_after >= 1 and total.retry_after >= 1
+    assert scheduler.total_rejected == 2
+
+
+def test_queued_job_expires_after_max_wait():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1)
+        running = scheduler.submit("a", _job([], "slow", 0.2))
+        expired = scheduler.submit("b", _job([], "late"), max_wait=0.05)
+        patient = scheduler.submit("c", _job([], "ok"), max_wait=5)
+        await running
+        with pytest.raises(QueueTimeoutError):
+            await expired
+        return await patient
+
+    assert asyncio.run(main()) == "ok"
+
+
+def test_zero_max_wait_runs_when_idle_and_is_rejected_when_busy():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1)
+        assert await scheduler.submit("a", _job([], "now"), max_wait=0) == "now"
+
+        running = scheduler.submit("a", _job([], "slow", 0.1), max_wait=0)
+        with pytest.raises(QueueTimeoutError) as rejected:
+            scheduler.submit("b", _job([], "never"), max_wait=0)
+        await running
+        return rejected.value, scheduler.stats()
+
+    rejected, stats = asyncio.run(main())
+    assert rejected.retry_after >= 1
+    assert stats["queued"] == 0 and stats["total_expired"] == 1
@@ -0,0 +1,170 @@
+import threading
+
+import pytest
+
+from src.bank_ds_agent.tools.kernel_executor import KernelExecutor
+from src.bank_ds_agent.tools.session_pool import (
+    SandboxSessionPool,
+    SessionMissingError,
+    SessionPoolFullError,
+)
+
+
+class _RecordingExecutor(KernelExecutor):
+    """只记录生命周期的执行器 (池的逻辑与内核协议无关)。"""
+
+    backend_name = "test"
+
+    def __init__(self):
+        self.alive = True
+        self.cleaned_up = False
+
+    def is_alive(self) -> bool:
+        return self.alive and not self.cleaned_up
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+class _Factory:
+    def __init__(self):
+        self.created = []
+
+    def __call__(self):
+        executor = _RecordingExecutor()
+        self.created.append(executor)
+        return executor
+
+    def live(self):
+        return [e for e in self.created if not e.cleaned_up]
+
+
+def _owned_executors(pool):
+    return [s.executor for s in pool._sessions.values() if s.executor is not None]
+
+
+def test_attach_and_rebuild_dead_kernel():
+    factory = _Factory()
+    pool = SandboxSessionPool(factory, max_sessions=2)
+
+    assert pool.ensure("a")["status"] == "created"
+    assert pool.ensure("a")["status"] == "attached"
+
+    factory.created[0].alive = False
+    with pool.session("a") as (executor, status):
+        assert status == "rebuilt"
+        assert executor is factory.created[1]
+    assert factory.created[0].cleaned_up
+    # ("rebuilt" 对调用方来说也是一个新内核)
+    factory.created[1].alive = False
+    assert pool.ensure("a")["status"] == "created"
+
+
+def test_least_recently_used_session_is_evicted_and_cleaned_up():
+    factory = _Factory()
+    pool = SandboxSessionPool(factory, max_sessions=2, idle_grace=0)
+    pool.ensure("a")
+    pool.ensure("b")
+    pool.ensure("a")  # ('b' 现在是最久没有使用的)
+    pool.ensure("c")
+
+    assert sorted(s["session_id"] for s in pool.stats()) == ["a", "c"]
+    assert factory.created[1].cleaned_up
+    assert factory.live() == _owned_executors(pool)
+
+
+def test_busy_and_recently_used_sessions_are_not_evicted():
+    factory = _Factory()
+    pool = SandboxSessionPool(factory, max_sessions=1, idle_grace=0)
+    inside, leave = threading.Event(), threading.Event()
+
+    def hold_a():
+        with pool.session("a"):
+            inside.set()
+            leave.wait(5)
+
+    holder = threading.Thread(target=hold_a)
+    holder.start()
+    assert inside.wait(5)
+    with pytest.raises(SessionPoolFullError) as busy:
+        pool.ensure("b")
+    assert busy.value.retry_after >= 1
+    leave.set()
+    holder.join(5)
+    assert not factory.created[0].cleaned_up
+
+    # (刚刚用过的会话在 idle_grace 内也不会被淘汰)
+    pool.idle_grace = 60
+    with pytest.raises(SessionPoolFullError):
+        pool.ensure("b")
+    pool.idle_grace = 0
+    assert pool.ensure("b")["status"] == "created"
+    assert factory.created[0].cleaned_up
+
+
+def test_create_false_never_starts_a_kernel():
+    factory = _Factory()
+    pool = SandboxSessionPool(factory, max_sessions=2)
+    with pytest.raises(SessionMissingError):
+        with pool.session("a", create=False):
+            pass
+    assert len(pool) == 0 and factory.created == []
+
+    pool.ensure("a")
+    factory.created[0].alive = False
+    with pytest.raises(SessionMissingError):
+        with pool.session("a", create=False):
+            pass
+    assert factory.created[0].cleaned_up and len(factory.created) == 1
+    assert pool.ensure("a")["status"] == "created"
+    with pool.session("a", create=False) as (executor, status):
+        assert status == "attached" and executor is factory.created[1]
+
+
+def test_close_and_close_all_clean_up():
+    factory = _Factory()
+    pool = SandboxSessionPool(factory, max_sessions=4)
+    pool.ensure("a")
+    pool.ensure("b")
+
+    assert pool.close("a") and not pool.close("a")
+    assert len(pool) == 1
+    pool.close_all()
+    assert len(pool) == 0 and factory.live() == []
+
+
+def test_close_race_never_leaks_a_kernel():
+    """
+    一个线程已经拿到了会话对象，但在它获得会话锁之前，会话被另一个线程关闭了:
+    它不能在已经移出池的会话上启动内核 (那样的内核永远不会被清理)。
+    """
+    factory = _Factory()
+    pool = SandboxSessionPool(factory, max_sessions=1)
+    pool.ensure("a")
+    fetched, closed = threading.Event(), threading.Event()
+    get_or_add = pool._get_or_add
+
+    def get_or_add_then_pause(session_id, create=True):
+        result = get_or_add(session_id, create)
+        if not fetched.is_set():
+            fetched.set()
+            closed.wait(5)  # (在这里被关闭)
+        return result
+
+    pool._get_or_add = get_or_add_then_pause
+
+    def use_a():
+        with pool.session("a"):
+            pass
+
+    user = threading.Thread(target=use_a)
+    user.start()
+    assert fetched.wait(5)
+    pool._get_or_add = get_or_add
+    assert pool.close("a")
+    closed.set()
+    user.join(5)
+    assert not user.is_alive()
+
+    assert [s["session_id"] for s in pool.stats()] == ["a"]
+    assert factory.live() == _owned_executors(pool)